@@ -1,13 +1,35 @@
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
 import pulp
-from datetime import datetime
+from datetime import datetime, timedelta
 import _tkinter  # Para capturar TclError no try-except
 import sqlite3
 import os
 import logging
+import time
+import tracemalloc
+import cProfile
+import pstats
+import random
 import argparse
+import asyncio
 import sys
+import threading
+import csv
+import hashlib
+import json
+import multiprocessing
+import queue
+import signal
+from contextlib import contextmanager, redirect_stdout
+from functools import lru_cache
+from collections import deque
+from dataclasses import dataclass, asdict, field, replace
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 # Defer importe do tkinter para execução em GUI; em ambientes headless (CI/tests)
 # evitar importar tkinter no carregamento do módulo (pode falhar/pendurar).
@@ -34,351 +56,3231 @@ def _ensure_tkinter():
         messagebox = None
         logging.info(f"tkinter não disponível (modo headless ou libs ausentes): {e}")
 
+# Grade de horários usada pelo otimizador e pelos formulários da GUI
+DIAS_SEMANA = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta']
+HORARIOS = [
+    ('08:00:00', '09:00:00'),
+    ('09:00:00', '10:00:00'),
+    ('10:00:00', '11:00:00'),
+    ('11:00:00', '12:00:00')
+]
+
 # Configurações de conexão com o banco de dados MySQL
 DB_HOST = os.environ.get('DB_HOST', 'localhost')
 DB_USER = os.environ.get('DB_USER', 'root')
 DB_PASSWORD = os.environ.get('DB_PASSWORD', '221203Ma')
 DB_NAME = os.environ.get('DB_NAME', 'sistema_escolar')
+# Backend: 'mysql' (com fallback para SQLite) ou 'sqlite' (banco local em arquivo, sem MySQL)
+DB_BACKEND = os.environ.get('DB_BACKEND', 'mysql').strip().lower() or 'mysql'
+# Arquivo do SQLite; vazio = 'sistema_escolar.db' com DB_BACKEND=sqlite e ':memory:' no fallback
+SQLITE_PATH = os.environ.get('SQLITE_PATH', '').strip()
+SQLITE_CACHE_KB = int(os.environ.get('SQLITE_CACHE_KB', '65536'))
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', '5'))
+# Pool de conexões MySQL: tamanho (máx. 32 no mysql.connector) e espera máxima por uma conexão livre (s)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '3'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+# Linhas por lote no INSERT do cronograma (executemany)
+DB_INSERT_BATCH = int(os.environ.get('DB_INSERT_BATCH', '1000'))
+# Quantas versões de cronograma manter para rollback (além da ativa)
+SCHEDULE_RETENTION = int(os.environ.get('SCHEDULE_RETENTION', '5'))
+
+
+def _env_float(name):
+    valor = os.environ.get(name, '').strip()
+    return float(valor) if valor else None
+
+
+def _env_int(name):
+    valor = os.environ.get(name, '').strip()
+    return int(valor) if valor else None
+
+
+def _env_bool(name, default=False):
+    valor = os.environ.get(name, '').strip().lower()
+    if not valor:
+        return default
+    return valor in ('1', 'true', 'yes', 'sim', 'on')
+
+
+# Opções do solver; valores None deixam o padrão do próprio solver
+@dataclass
+class SolverOptions:
+    solver: str = 'PULP_CBC_CMD'
+    time_limit: Optional[float] = None
+    gap_rel: Optional[float] = None
+    threads: Optional[int] = None
+    keep_logs: bool = False  # grava o log do solver em log_dir/<componente>.log
+    log_dir: str = '.'
+    warm_start: bool = False  # parte do cronograma atual como solução inicial
+    formulation: str = 'full'  # ver FORMULATIONS
+    engine: str = 'milp'  # ver ENGINES
+    heuristic_time: float = 0.5  # tempo da busca local do motor heurístico (s)
+    elastic: bool = False  # carga vira restrição suave: grava o cronograma parcial e as aulas que faltaram
+    profile_dir: Optional[str] = None  # grava cProfile e tracemalloc da montagem do modelo (ver profile_call)
+    force_solve: bool = False  # resolve mesmo se os dados e opções baterem com uma versão guardada
+
+    @classmethod
+    def from_env(cls):
+        """Lê SOLVER_NAME, SOLVER_TIME_LIMIT, SOLVER_GAP_REL, SOLVER_THREADS, SOLVER_KEEP_LOGS,
+        SOLVER_LOG_DIR, SOLVER_WARM_START, SOLVER_FORMULATION, SOLVER_ENGINE, SOLVER_HEURISTIC_TIME,
+        SOLVER_ELASTIC, SOLVER_PROFILE_DIR e SOLVER_FORCE_SOLVE."""
+        return cls(
+            solver=os.environ.get('SOLVER_NAME', '').strip() or cls.solver,
+            time_limit=_env_float('SOLVER_TIME_LIMIT'),
+            gap_rel=_env_float('SOLVER_GAP_REL'),
+            threads=_env_int('SOLVER_THREADS'),
+            keep_logs=_env_bool('SOLVER_KEEP_LOGS'),
+            log_dir=os.environ.get('SOLVER_LOG_DIR', '').strip() or cls.log_dir,
+            warm_start=_env_bool('SOLVER_WARM_START'),
+            formulation=os.environ.get('SOLVER_FORMULATION', '').strip() or cls.formulation,
+            engine=os.environ.get('SOLVER_ENGINE', '').strip() or cls.engine,
+            heuristic_time=_env_float('SOLVER_HEURISTIC_TIME') or cls.heuristic_time,
+            elastic=_env_bool('SOLVER_ELASTIC'),
+            profile_dir=os.environ.get('SOLVER_PROFILE_DIR', '').strip() or None,
+            force_solve=_env_bool('SOLVER_FORCE_SOLVE'),
+        )
+
+    def build(self, log_name='solver', warm_start=False):
+        """Instancia o solver PuLP configurado (ex.: PULP_CBC_CMD, HiGHS_CMD, GUROBI_CMD)."""
+        kwargs = {'msg': False}
+        if warm_start:
+            kwargs['warmStart'] = True
+        if self.time_limit is not None:
+            kwargs['timeLimit'] = self.time_limit
+        if self.gap_rel is not None:
+            kwargs['gapRel'] = self.gap_rel
+        if self.threads is not None:
+            kwargs['threads'] = self.threads
+        if self.keep_logs:
+            kwargs['logPath'] = os.path.join(self.log_dir, f"{log_name}.log")
+        return pulp.getSolver(self.solver, **kwargs)
+
+class _PooledConnection:
+    """Conexão emprestada por `ConnectionPool`: delega tudo à conexão do conector e, no primeiro
+    `close()`, devolve-a ao pool e desconta do contador de conexões em uso."""
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, nome):
+        return getattr(self._connection, nome)
+
+    def close(self):
+        pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        try:
+            self._connection.close()
+        finally:
+            pool._release()
+
+
+class ConnectionPool:
+    """Pool de conexões MySQL sobre `mysql.connector.pooling`, seguro para várias threads.
+
+    `acquire` espera até `timeout` segundos por uma conexão livre (o pool do conector falha na hora
+    quando está esgotado) e faz um health check antes de entregá-la, reconectando conexões que o
+    servidor derrubou (ex.: `wait_timeout`). Fechar a conexão (`close()`) a devolve ao pool.
+    """
+
+    def __init__(self, size=None, timeout=None, **config):
+        self.size = size or DB_POOL_SIZE
+        if self.size > pooling.CNX_POOL_MAXSIZE:
+            logging.warning(f"DB_POOL_SIZE={self.size} acima do máximo do conector; usando {pooling.CNX_POOL_MAXSIZE}")
+            self.size = pooling.CNX_POOL_MAXSIZE
+        self.timeout = DB_POOL_TIMEOUT if timeout is None else timeout
+        self._pool = pooling.MySQLConnectionPool(pool_name='school_schedule', pool_size=self.size,
+                                                 pool_reset_session=True, **config)
+        self._lock = threading.Lock()
+        self._metricas = {'emprestimos': 0, 'esperas': 0, 'espera_total': 0.0, 'espera_max': 0.0,
+                          'reconexoes': 0, 'esgotamentos': 0}
+        self._em_uso = 0
+
+    def acquire(self):
+        inicio = time.perf_counter()
+        while True:
+            try:
+                connection = self._pool.get_connection()
+                break
+            except pooling.PoolError:
+                if time.perf_counter() - inicio >= self.timeout:
+                    with self._lock:
+                        self._metricas['esgotamentos'] += 1
+                    raise
+                time.sleep(0.01)
+        espera = time.perf_counter() - inicio
+        reconectou = False
+        try:
+            connection.ping(reconnect=False)
+        except Error:
+            connection.reconnect(attempts=3, delay=0.5)
+            reconectou = True
+        with self._lock:
+            m = self._metricas
+            m['emprestimos'] += 1
+            m['esperas'] += espera > 0.01
+            m['espera_total'] += espera
+            m['espera_max'] = max(m['espera_max'], espera)
+            m['reconexoes'] += reconectou
+            self._em_uso += 1
+        return _PooledConnection(self, connection)
+
+    def _release(self):
+        with self._lock:
+            self._em_uso -= 1
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    def metrics(self):
+        with self._lock:
+            m = dict(self._metricas)
+            m['em_uso'] = self._em_uso
+        m['tamanho'] = self.size
+        m['espera_media'] = m['espera_total'] / m['emprestimos'] if m['emprestimos'] else 0.0
+        return m
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_pool(size=None):
+    """Cria o pool do processo, usado daí em diante por `create_connection`; None sem MySQL.
+
+    Só para processos de vida longa (GUI e `--serve`): o conector abre as `size` conexões na
+    criação do pool, então processos de geração e execuções avulsas ficam com conexões diretas.
+    """
+    global _pool
+    if DB_BACKEND == 'sqlite':
+        return None
+    with _pool_lock:
+        if _pool is None:
+            try:
+                _pool = ConnectionPool(size=size, host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME)
+                logging.info(f"Pool de conexões MySQL criado ({_pool.size} conexões)")
+            except Error as e:
+                logging.error(f"Pool de conexões MySQL não criado: {e}")
+        return _pool
+
+
+def pool_metrics():
+    """Métricas do pool (empréstimos, tempo de espera, conexões em uso, reconexões); {} sem MySQL."""
+    return _pool.metrics() if _pool is not None else {}
+
+
+def ensure_connection(connection):
+    """Health check de uma conexão de vida longa (ex.: a da GUI), reconectando se ela caiu."""
+    if getattr(connection, 'is_sqlite', False):
+        return connection
+    try:
+        connection.ping(reconnect=True, attempts=3, delay=0.5)
+    except Error as e:
+        logging.error(f"Conexão com o MySQL perdida e não restabelecida: {e}")
+    return connection
+
+
+@contextmanager
+def db_connection(sqlite_path=None):
+    """Abre (ou empresta do pool) uma conexão e a fecha ao sair do bloco (rollback se houver exceção).
+
+    Cada thread deve usar a sua: `with db_connection() as conn: ...`. No SQLite as conexões só
+    compartilham dados com SQLITE_PATH em arquivo; em memória cada uma é um banco próprio.
+    `sqlite_path` força um arquivo SQLite específico (o do modo serviço).
+    """
+    connection = connect_sqlite(sqlite_path) if sqlite_path else create_connection()
+    if connection is None:
+        raise Error("Nenhum banco de dados disponível")
+    try:
+        yield connection
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+_SQL_QUOTES = "'\"`"
+
+
+@lru_cache(maxsize=512)
+def translate_placeholders(sql):
+    """Troca os placeholders `%s` do MySQL pelo `?` do sqlite3, ignorando os que estão dentro de
+    literais ('...', "...", `...`) e comentários `--`. Cacheado por texto de SQL."""
+    partes = []
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if c in _SQL_QUOTES:
+            # literal até a aspa de fechamento; aspa dobrada ('') é escape
+            j = i + 1
+            while j < n:
+                if sql[j] == c:
+                    if j + 1 < n and sql[j + 1] == c:
+                        j += 2
+                        continue
+                    break
+                j += 1
+            partes.append(sql[i:j + 1])
+            i = j + 1
+        elif sql.startswith('--', i):
+            j = sql.find('\n', i)
+            j = n if j < 0 else j
+            partes.append(sql[i:j])
+            i = j
+        elif sql.startswith('%s', i):
+            partes.append('?')
+            i += 2
+        else:
+            partes.append(c)
+            i += 1
+    return ''.join(partes)
+
+
+class SQLiteCursorAdapter:
+    def __init__(self, cur):
+        self._cur = cur
+
+    def execute(self, sql, params=None):
+        if params is None:
+            return self._cur.execute(sql)
+        # traduzir placeholders MySQL (%s) para qmark do sqlite (?)
+        return self._cur.execute(translate_placeholders(sql), params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._cur.executemany(translate_placeholders(sql), seq_of_params)
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+class SQLiteConnectionAdapter:
+    """Expõe uma conexão sqlite3 com a mesma interface usada do mysql.connector."""
+
+    def __init__(self, conn, path=':memory:'):
+        self._conn = conn
+        self.path = path
+        self.is_sqlite = True
+
+    def cursor(self):
+        return SQLiteCursorAdapter(self._conn.cursor())
+
+    def start_transaction(self):
+        # sqlite3 abre transações implícitas no primeiro DML; aqui a abrimos explicitamente
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN")
+
+    def commit(self):
+        return self._conn.commit()
+
+    def rollback(self):
+        return self._conn.rollback()
+
+    def close(self):
+        return self._conn.close()
+
+
+def connect_sqlite(path=None):
+    """Abre o banco SQLite em `path` (arquivo ou ':memory:') com os pragmas de desempenho.
+
+    Em arquivo usa WAL (leitores não bloqueiam a gravação do cronograma) com synchronous=NORMAL,
+    que no WAL só arrisca a última transação numa queda de energia, nunca a integridade do banco.
+    """
+    path = path or SQLITE_PATH or 'sistema_escolar.db'
+    sqlite_conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT)
+    # opcional: retornar linhas como tuplas/objetos compatíveis
+    sqlite_conn.row_factory = None
+    if path != ':memory:':
+        sqlite_conn.execute("PRAGMA journal_mode=WAL")
+        sqlite_conn.execute("PRAGMA synchronous=NORMAL")
+    sqlite_conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    sqlite_conn.execute("PRAGMA temp_store=MEMORY")
+    return SQLiteConnectionAdapter(sqlite_conn, path)
+
+
+# Função para criar a conexão com o banco de dados
+def create_connection():
+    """Conexão conforme DB_BACKEND.
+
+    - `mysql` (padrão): emprestada do pool MySQL quando o processo criou um (`init_pool`; fechá-la
+      a devolve), senão uma conexão direta; se o MySQL não responder, cai para o SQLite em
+      SQLITE_PATH (em memória quando não configurado, útil em CI/testes).
+    - `sqlite`: banco local em SQLITE_PATH (padrão `sistema_escolar.db`), sem tentar o MySQL.
+    """
+    if DB_BACKEND == 'sqlite':
+        try:
+            connection = connect_sqlite()
+            logging.info(f"Usando banco SQLite em {connection.path}")
+            return connection
+        except sqlite3.Error as e:
+            logging.error(f"Erro ao abrir o banco SQLite: {e}")
+            return None
+    connection = None
+    try:
+        if _pool is not None:
+            connection = _pool.acquire()
+        else:
+            connection = mysql.connector.connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME)
+        logging.info("Conexão com MySQL DB bem-sucedida")
+    except pooling.PoolError as e:
+        # MySQL no ar mas pool esgotado: não cair para um SQLite vazio
+        logging.error(f"Nenhuma conexão livre no pool após {DB_POOL_TIMEOUT}s: {e}")
+    except Error as e:
+        logging.error(f"Erro ao conectar ao MySQL DB: '{e}'")
+        # Fallback para SQLite quando o MySQL não está disponível (útil para testes/CI)
+        try:
+            connection = connect_sqlite(SQLITE_PATH or ':memory:')
+            if connection.path == ':memory:':
+                logging.info("Fallback: usando banco SQLite em memória para testes")
+            else:
+                logging.info(f"Fallback: usando banco SQLite em {connection.path}")
+        except Exception as se:
+            logging.error(f"Erro ao criar DB SQLite de fallback: {se}")
+            connection = None
+    return connection
+
+# Função para criar as tabelas no banco de dados
+def create_tables(connection):
+    cursor = connection.cursor()
+
+    # Suporte a SQLite de fallback (usado em CI quando MySQL não está disponível)
+    if getattr(connection, 'is_sqlite', False):
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS professores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            disponibilidade TEXT,
+            preferencias TEXT
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS materias (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            carga_horaria INTEGER NOT NULL
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS turmas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            ano INTEGER NOT NULL
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cronogramas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            professor_id INTEGER,
+            materia_id INTEGER,
+            turma_id INTEGER,
+            dia_semana TEXT,
+            horario_inicio TEXT,
+            horario_fim TEXT,
+            versao_id INTEGER
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cronograma_versoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            criado_em TEXT NOT NULL,
+            total_aulas INTEGER NOT NULL DEFAULT 0,
+            impressao TEXT,
+            usado_em TEXT
+        )
+        """)
+
+        # Ponteiro da versão ativa: uma única linha (id = 1) atualizada atomicamente
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cronograma_ativo (
+            id INTEGER PRIMARY KEY,
+            versao_id INTEGER
+        )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO cronograma_ativo (id, versao_id) VALUES (1, NULL)")
+
+        # Aulas que ficaram sem horário numa versão gerada no modo elástico
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cronograma_faltas (
+            versao_id INTEGER NOT NULL,
+            materia_id INTEGER NOT NULL,
+            turma_id INTEGER NOT NULL,
+            aulas INTEGER NOT NULL,
+            PRIMARY KEY (versao_id, materia_id, turma_id)
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS professor_disponibilidade (
+            professor_id INTEGER NOT NULL,
+            dia_semana TEXT NOT NULL,
+            horario_inicio TEXT NOT NULL,
+            PRIMARY KEY (professor_id, dia_semana, horario_inicio)
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS professor_preferencias (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            professor_id INTEGER NOT NULL,
+            materia_id INTEGER,
+            dia_semana TEXT,
+            peso INTEGER NOT NULL DEFAULT 5
+        )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_professor_preferencias_professor ON professor_preferencias (professor_id)")
+
+        # Grade de horários da escola (dias x horários); lida a cada geração
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS grade_horaria (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dia_semana TEXT NOT NULL,
+            horario_inicio TEXT NOT NULL,
+            horario_fim TEXT NOT NULL,
+            UNIQUE (dia_semana, horario_inicio)
+        )
+        """)
+
+        # Horários permitidos por turma; turma sem linhas pode usar a grade inteira
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS turma_disponibilidade (
+            turma_id INTEGER NOT NULL,
+            dia_semana TEXT NOT NULL,
+            horario_inicio TEXT NOT NULL,
+            PRIMARY KEY (turma_id, dia_semana, horario_inicio)
+        )
+        """)
+    else:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS professores (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nome VARCHAR(100) NOT NULL,
+            disponibilidade TEXT,
+            preferencias TEXT
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS materias (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nome VARCHAR(100) NOT NULL,
+            carga_horaria INT NOT NULL
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS turmas (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nome VARCHAR(50) NOT NULL,
+            ano INT NOT NULL
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cronogramas (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            professor_id INT,
+            materia_id INT,
+            turma_id INT,
+            dia_semana VARCHAR(20),
+            horario_inicio TIME,
+            horario_fim TIME,
+            versao_id INT,
+            FOREIGN KEY (professor_id) REFERENCES professores(id),
+            FOREIGN KEY (materia_id) REFERENCES materias(id),
+            FOREIGN KEY (turma_id) REFERENCES turmas(id)
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cronograma_versoes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            criado_em DATETIME NOT NULL,
+            total_aulas INT NOT NULL DEFAULT 0,
+            impressao CHAR(64) NULL,
+            usado_em DATETIME NULL
+        )
+        """)
+
+        # Ponteiro da versão ativa: uma única linha (id = 1) atualizada atomicamente
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cronograma_ativo (
+            id INT PRIMARY KEY,
+            versao_id INT
+        )
+        """)
+        cursor.execute("INSERT IGNORE INTO cronograma_ativo (id, versao_id) VALUES (1, NULL)")
+
+        # Aulas que ficaram sem horário numa versão gerada no modo elástico
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cronograma_faltas (
+            versao_id INT NOT NULL,
+            materia_id INT NOT NULL,
+            turma_id INT NOT NULL,
+            aulas INT NOT NULL,
+            PRIMARY KEY (versao_id, materia_id, turma_id),
+            FOREIGN KEY (versao_id) REFERENCES cronograma_versoes(id) ON DELETE CASCADE,
+            FOREIGN KEY (materia_id) REFERENCES materias(id) ON DELETE CASCADE,
+            FOREIGN KEY (turma_id) REFERENCES turmas(id) ON DELETE CASCADE
+        )
+        """)
+
+        # Disponibilidade por dia/horário; a chave primária cobre a leitura por professor
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS professor_disponibilidade (
+            professor_id INT NOT NULL,
+            dia_semana VARCHAR(20) NOT NULL,
+            horario_inicio TIME NOT NULL,
+            PRIMARY KEY (professor_id, dia_semana, horario_inicio),
+            FOREIGN KEY (professor_id) REFERENCES professores(id) ON DELETE CASCADE
+        )
+        """)
+
+        # Preferências com peso; matéria e dia são opcionais (a FK já indexa professor_id)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS professor_preferencias (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            professor_id INT NOT NULL,
+            materia_id INT NULL,
+            dia_semana VARCHAR(20) NULL,
+            peso INT NOT NULL DEFAULT 5,
+            FOREIGN KEY (professor_id) REFERENCES professores(id) ON DELETE CASCADE,
+            FOREIGN KEY (materia_id) REFERENCES materias(id) ON DELETE CASCADE
+        )
+        """)
+
+        # Grade de horários da escola (dias x horários); lida a cada geração
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS grade_horaria (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            dia_semana VARCHAR(20) NOT NULL,
+            horario_inicio TIME NOT NULL,
+            horario_fim TIME NOT NULL,
+            UNIQUE KEY ux_grade_horaria_slot (dia_semana, horario_inicio)
+        )
+        """)
+
+        # Horários permitidos por turma; turma sem linhas pode usar a grade inteira
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS turma_disponibilidade (
+            turma_id INT NOT NULL,
+            dia_semana VARCHAR(20) NOT NULL,
+            horario_inicio TIME NOT NULL,
+            PRIMARY KEY (turma_id, dia_semana, horario_inicio),
+            FOREIGN KEY (turma_id) REFERENCES turmas(id) ON DELETE CASCADE
+        )
+        """)
+
+    migrate_schedule_versions(connection)
+    migrate_schedule_cache(connection)
+    migrate_schedule_indexes(connection)
+    seed_time_grid(connection)
+    migrate_professor_tables(connection)
+    connection.commit()
+    print("Tabelas criadas com sucesso")
+
+
+def column_exists(connection, table, column):
+    cursor = connection.cursor()
+    if getattr(connection, 'is_sqlite', False):
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row[1] == column for row in cursor.fetchall())
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.columns
+    WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def migrate_schedule_versions(connection):
+    """Migração idempotente para bancos criados antes do versionamento de cronogramas.
+
+    Adiciona `cronogramas.versao_id` e, se houver linhas antigas sem versão, agrupa-as numa versão
+    nova que passa a ser a ativa quando ainda não há nenhuma.
+    """
+    cursor = connection.cursor()
+    if not column_exists(connection, 'cronogramas', 'versao_id'):
+        tipo = 'INTEGER' if getattr(connection, 'is_sqlite', False) else 'INT'
+        cursor.execute(f"ALTER TABLE cronogramas ADD COLUMN versao_id {tipo}")
+    cursor.execute("SELECT COUNT(*) FROM cronogramas WHERE versao_id IS NULL")
+    legadas = cursor.fetchone()[0]
+    if not legadas:
+        return
+    cursor.execute("INSERT INTO cronograma_versoes (criado_em, total_aulas) VALUES (%s, %s)",
+                   (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), legadas))
+    versao_id = cursor.lastrowid
+    cursor.execute("UPDATE cronogramas SET versao_id = %s WHERE versao_id IS NULL", (versao_id,))
+    cursor.execute("UPDATE cronograma_ativo SET versao_id = %s WHERE id = 1 AND versao_id IS NULL", (versao_id,))
+    logging.info(f"Migração: {legadas} aulas sem versão movidas para a versão {versao_id}")
+
+
+def migrate_schedule_cache(connection):
+    """Migração idempotente: colunas `impressao` e `usado_em` do cache de cronogramas (ver
+    `schedule_fingerprint`). Versões antigas ficam sem impressão e nunca são reaproveitadas."""
+    cursor = connection.cursor()
+    sqlite = getattr(connection, 'is_sqlite', False)
+    for coluna, tipo_sqlite, tipo_mysql in (('impressao', 'TEXT', 'CHAR(64) NULL'),
+                                            ('usado_em', 'TEXT', 'DATETIME NULL')):
+        if not column_exists(connection, 'cronograma_versoes', coluna):
+            cursor.execute(f"ALTER TABLE cronograma_versoes ADD COLUMN {coluna} {tipo_sqlite if sqlite else tipo_mysql}")
+
+
+def seed_time_grid(connection):
+    """Preenche `grade_horaria` com a grade padrão (DIAS_SEMANA x HORARIOS) quando está vazia."""
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM grade_horaria")
+    if cursor.fetchone()[0]:
+        return
+    cursor.executemany("INSERT INTO grade_horaria (dia_semana, horario_inicio, horario_fim) VALUES (%s, %s, %s)",
+                       [(d, inicio, fim) for d in DIAS_SEMANA for inicio, fim in HORARIOS])
+
+
+# Ordem dos dias na grade; dias desconhecidos vão para o fim, em ordem alfabética
+ORDEM_DIAS = DIAS_SEMANA + ['Sábado', 'Domingo']
+
+
+def load_time_grid(cursor):
+    """Lê `grade_horaria` e devolve (dias_semana, horarios, grade_mask).
+
+    `horarios` são os horários distintos de início (com o fim correspondente) em ordem, e as
+    máscaras de disponibilidade usam um bit por (dia, horário) dessa grade retangular (ver
+    `slot_bit`); `grade_mask` marca os slots que existem de fato, já que turnos podem variar por dia.
+    """
+    cursor.execute("SELECT dia_semana, horario_inicio, horario_fim FROM grade_horaria")
+    linhas = [(d, format_horario(inicio), format_horario(fim)) for d, inicio, fim in cursor.fetchall()]
+    if not linhas:
+        return list(DIAS_SEMANA), list(HORARIOS), full_mask(DIAS_SEMANA, len(HORARIOS))
+    dias_semana = sorted({d for d, _, _ in linhas},
+                         key=lambda d: (ORDEM_DIAS.index(d) if d in ORDEM_DIAS else len(ORDEM_DIAS), d))
+    fins = {}
+    for _, inicio, fim in linhas:
+        fins.setdefault(inicio, fim)
+    horarios = sorted(fins.items())
+    d_idx = {d: i for i, d in enumerate(dias_semana)}
+    s_idx = {inicio: s for s, (inicio, _) in enumerate(horarios)}
+    grade_mask = 0
+    for d, inicio, _ in linhas:
+        grade_mask |= slot_bit(d_idx[d], s_idx[inicio], len(horarios))
+    return dias_semana, horarios, grade_mask
+
+
+def _load_slot_masks(cursor, sql, dias_semana, horarios):
+    """Máscara por entidade a partir de linhas (id, dia_semana, horario_inicio)."""
+    d_idx = {d: i for i, d in enumerate(dias_semana)}
+    s_idx = {inicio: s for s, (inicio, _) in enumerate(horarios)}
+    masks = {}
+    cursor.execute(sql)
+    for ent_id, dia, inicio in cursor.fetchall():
+        d, s = d_idx.get(dia), s_idx.get(format_horario(inicio))
+        if d is not None and s is not None:
+            masks[ent_id] = masks.get(ent_id, 0) | slot_bit(d, s, len(horarios))
+    return masks
+
+
+def _save_slot_mask(connection, tabela, coluna, ent_id, mask, dias_semana, horarios):
+    cursor = connection.cursor()
+    cursor.execute(f"DELETE FROM {tabela} WHERE {coluna} = %s", (ent_id,))
+    linhas = [(ent_id, d, horarios[s][0]) for d, s in mask_slots(mask, dias_semana, len(horarios))]
+    if linhas:
+        cursor.executemany(f"INSERT INTO {tabela} ({coluna}, dia_semana, horario_inicio) VALUES (%s, %s, %s)", linhas)
+
+
+def load_turmas(cursor, dias_semana, horarios, grade_mask=None):
+    """Turmas como (id, nome, máscara de horários permitidos); sem linhas em turma_disponibilidade,
+    a turma pode usar a grade inteira."""
+    grade_mask = full_mask(dias_semana, len(horarios)) if grade_mask is None else grade_mask
+    masks = _load_slot_masks(cursor, "SELECT turma_id, dia_semana, horario_inicio FROM turma_disponibilidade",
+                             dias_semana, horarios)
+    cursor.execute("SELECT id, nome FROM turmas ORDER BY id")
+    return [(t_id, nome, masks.get(t_id, grade_mask) & grade_mask) for t_id, nome in cursor.fetchall()]
+
+
+def save_turma_availability(connection, turma_id, mask, dias_semana, horarios, grade_mask=None, commit=True):
+    """Grava os horários permitidos da turma; a grade inteira é gravada como "sem restrição" (nenhuma linha)."""
+    if grade_mask is not None and mask & grade_mask == grade_mask:
+        mask = 0
+    _save_slot_mask(connection, 'turma_disponibilidade', 'turma_id', turma_id, mask, dias_semana, horarios)
+    if commit:
+        connection.commit()
+
+
+def migrate_professor_tables(connection):
+    """Copia as colunas legadas `professores.disponibilidade` e `professores.preferencias` para as
+    tabelas normalizadas, apenas para professores que ainda não têm linhas nelas (idempotente).
+
+    A disponibilidade legada é por dia e vira uma linha por horário do dia. Depois de migradas, as
+    colunas legadas são esvaziadas para não serem migradas de novo.
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+    SELECT p.id, p.disponibilidade, p.preferencias FROM professores p
+    WHERE (p.disponibilidade IS NOT NULL AND p.disponibilidade <> '')
+       OR (p.preferencias IS NOT NULL AND p.preferencias <> '')
+    """)
+    legados = cursor.fetchall()
+    if not legados:
+        return
+    cursor.execute("SELECT id, nome, carga_horaria FROM materias")
+    materias = cursor.fetchall()
+    dias_semana, horarios, grade_mask = load_time_grid(cursor)
+    cursor.execute("SELECT DISTINCT professor_id FROM professor_disponibilidade")
+    com_disponibilidade = {row[0] for row in cursor.fetchall()}
+    cursor.execute("SELECT DISTINCT professor_id FROM professor_preferencias")
+    com_preferencias = {row[0] for row in cursor.fetchall()}
+    for p_id, disp, pref in legados:
+        if p_id not in com_disponibilidade:
+            mask = parse_disponibilidade(disp, dias_semana, len(horarios)) & grade_mask
+            save_professor_availability(connection, p_id, mask, dias_semana, horarios, commit=False)
+        if p_id not in com_preferencias:
+            save_professor_preferences(connection, p_id, parse_preferencias(pref, materias), commit=False)
+        cursor.execute("UPDATE professores SET disponibilidade = '', preferencias = '' WHERE id = %s", (p_id,))
+    logging.info(f"Migração: disponibilidade/preferências de {len(legados)} professor(es) normalizadas")
+
+
+def save_professor_availability(connection, professor_id, mask, dias_semana, horarios, commit=True):
+    """Substitui a disponibilidade do professor pela máscara `mask` sobre a grade (dias_semana x horarios)."""
+    _save_slot_mask(connection, 'professor_disponibilidade', 'professor_id', professor_id, mask, dias_semana, horarios)
+    if commit:
+        connection.commit()
+
+
+def save_professor_preferences(connection, professor_id, preferencias, commit=True):
+    """Substitui as preferências do professor; `preferencias` é uma lista de (materia_id, dia, peso)."""
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM professor_preferencias WHERE professor_id = %s", (professor_id,))
+    linhas = [(professor_id, m_id, dia or None, peso) for m_id, dia, peso in preferencias]
+    if linhas:
+        cursor.executemany("INSERT INTO professor_preferencias (professor_id, materia_id, dia_semana, peso) "
+                           "VALUES (%s, %s, %s, %s)", linhas)
+    if commit:
+        connection.commit()
+
+
+# (nome, colunas, único). Os UNIQUE garantem no próprio banco que uma versão não tem duas aulas
+# da mesma turma ou do mesmo professor no mesmo horário; como começam por versao_id, também
+# cobrem o filtro pela versão ativa nas consultas do cronograma e a remoção de versões antigas.
+CRONOGRAMA_INDICES = (
+    ('ux_cronogramas_turma_horario', ('versao_id', 'turma_id', 'dia_semana', 'horario_inicio'), True),
+    ('ux_cronogramas_professor_horario', ('versao_id', 'professor_id', 'dia_semana', 'horario_inicio'), True),
+    # Caminhos de junção/remoção por entidade. No MySQL o InnoDB já indexa as colunas de FOREIGN KEY.
+    ('ix_cronogramas_professor', ('professor_id',), False),
+    ('ix_cronogramas_materia', ('materia_id',), False),
+    ('ix_cronogramas_turma', ('turma_id',), False),
+)
+
+
+def index_exists(connection, table, index):
+    cursor = connection.cursor()
+    if getattr(connection, 'is_sqlite', False):
+        cursor.execute(f"PRAGMA index_list({table})")
+        return any(row[1] == index for row in cursor.fetchall())
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+
+def migrate_schedule_indexes(connection):
+    """Cria (de forma idempotente) os índices de `cronogramas` em bancos novos e antigos."""
+    sqlite = getattr(connection, 'is_sqlite', False)
+    cursor = connection.cursor()
+    for nome, colunas, unico in CRONOGRAMA_INDICES:
+        if (not unico and not sqlite) or index_exists(connection, 'cronogramas', nome):
+            continue
+        try:
+            cursor.execute(f"CREATE {'UNIQUE ' if unico else ''}INDEX {nome} ON cronogramas ({', '.join(colunas)})")
+        except Exception as e:
+            # Dados antigos com double-booking impedem o UNIQUE; verify_schedule aponta as linhas
+            logging.error(f"Não foi possível criar o índice {nome}: {e} (use --verify para listar os conflitos)")
+
+# Função para mostrar mensagem (compatível com CI/headless)
+def show_message(title, message, type="info"):
+    try:
+        import tkinter.messagebox as mb
+        if type == "info":
+            mb.showinfo(title, message)
+        elif type == "error":
+            mb.showerror(title, message)
+        elif type == "warning":
+            mb.showwarning(title, message)
+    except (ImportError, _tkinter.TclError):
+        logging.info(f"{title}: {message} (Modo headless)")
+
+def slot_bit(d_idx, s, n_slots):
+    """Bit do (dia, horário) numa máscara de disponibilidade: um bit por slot da grade, dia a dia."""
+    return 1 << (d_idx * n_slots + s)
+
+
+def full_mask(dias_semana, n_slots):
+    return (1 << (len(dias_semana) * n_slots)) - 1
+
+
+def mask_from_slots(disponibilidade, dias_semana, n_slots):
+    """{dia: slots} -> máscara inteira sobre a grade; dias fora da grade são ignorados."""
+    mask = 0
+    for d_idx, d in enumerate(dias_semana):
+        for s in disponibilidade.get(d, ()):
+            mask |= slot_bit(d_idx, s, n_slots)
+    return mask
+
+
+def mask_slots(mask, dias_semana, n_slots):
+    """Lista os (dia, slot) dos bits ligados, na ordem da grade."""
+    return [(d, s) for d_idx, d in enumerate(dias_semana) for s in range(n_slots)
+            if mask >> (d_idx * n_slots + s) & 1]
+
+
+def parse_disponibilidade(disponibilidade, dias_semana=DIAS_SEMANA, n_slots=None):
+    """Disponibilidade do professor como máscara de bits sobre a grade (ver `slot_bit`).
+
+    Aceita a máscara de `load_professores` (devolvida como está), um dicionário {dia: slots} ou a
+    string legada 'Segunda,Terça,...' da tabela professores, que libera todos os horários dos dias listados.
+    """
+    if isinstance(disponibilidade, int):
+        return disponibilidade
+    n_slots = len(HORARIOS) if n_slots is None else n_slots
+    if isinstance(disponibilidade, dict):
+        return mask_from_slots(disponibilidade, dias_semana, n_slots)
+    if not disponibilidade:
+        return 0
+    todos = frozenset(range(n_slots))
+    return mask_from_slots({d.strip(): todos for d in disponibilidade.split(',') if d.strip()}, dias_semana, n_slots)
+
+
+def turma_mask(turma, dias_semana, n_slots):
+    """Máscara de horários da turma: o 3º campo da tupla (id, nome, máscara) ou a grade inteira."""
+    if len(turma) > 2 and turma[2] is not None:
+        return turma[2]
+    return full_mask(dias_semana, n_slots)
+
+
+def parse_preferencia(preferencias):
+    """Converte a string 'Materia:Dia' em (materia, dia); sem ':' não há preferência."""
+    if not preferencias or ':' not in preferencias:
+        return '', ''
+    pref_mat, pref_dia = preferencias.split(':', 1)
+    return pref_mat, pref_dia
+
+
+# Penalidade para descumprimento de preferência (higher penalty -> stronger preference);
+# também é o peso padrão de uma linha de professor_preferencias
+PREFERENCE_PENALTY = 5
+
+
+def parse_preferencias(preferencias, materias):
+    """Preferências do professor como tupla de (materia_id ou None, dia ou None, peso).
+
+    Aceita o formato de `load_professores` (devolvido como está) ou a string legada 'Materia:Dia',
+    convertida numa preferência de peso PREFERENCE_PENALTY.
+    """
+    if not isinstance(preferencias, str) and preferencias is not None:
+        return tuple(preferencias)
+    pref_mat, pref_dia = parse_preferencia(preferencias)
+    if not pref_mat and not pref_dia:
+        return ()
+    m_id = next((m[0] for m in materias if m[1] == pref_mat), None)
+    return ((m_id, pref_dia or None, PREFERENCE_PENALTY),)
+
+
+def preference_costs(professores, materias, dias_semana):
+    """Tabelas de custo por (professor, matéria) e (professor, dia).
+
+    O custo de uma aula é 1 + custo_materia[p, m] + custo_dia[p, d]. Uma matéria (ou dia) custa a
+    diferença entre o maior peso entre as preferências de matéria (dia) do professor e o seu
+    próprio peso (0 se não preferida): com uma única preferência de peso PREFERENCE_PENALTY, a
+    preferida custa 0 e as demais PREFERENCE_PENALTY.
+    """
+    custo_materia = {}
+    custo_dia = {}
+    for p in professores:
+        peso_materia = {}
+        peso_dia = {}
+        for m_id, dia, peso in parse_preferencias(p[3], materias):
+            if m_id is not None:
+                peso_materia[m_id] = max(peso_materia.get(m_id, 0), peso)
+            if dia:
+                peso_dia[dia] = max(peso_dia.get(dia, 0), peso)
+        topo = max(peso_materia.values(), default=0)
+        for m in materias:
+            custo_materia[p[0], m[0]] = topo - peso_materia.get(m[0], 0)
+        topo = max(peso_dia.values(), default=0)
+        for d in dias_semana:
+            custo_dia[p[0], d] = topo - peso_dia.get(d, 0)
+    return custo_materia, custo_dia
+
+
+def schedule_cost(professores, materias, dias_semana, atribuicoes):
+    """Custo de preferência de uma lista de atribuições (p, m, t, dia, slot), igual ao objetivo do MILP."""
+    custo_materia, custo_dia = preference_costs(professores, materias, dias_semana)
+    return sum(1 + custo_materia[p, m] + custo_dia[p, d] for p, m, _, d, _ in atribuicoes)
+
+
+def _dense_model_size(professores, materias, turmas, dias_semana, n_slots, disponibilidade):
+    """Tamanho do modelo original (produto cartesiano completo + linhas x == 0), para comparação."""
+    n_p, n_m, n_t, n_d = len(professores), len(materias), len(turmas), len(dias_semana)
+    slots_indisponiveis = sum(n_d * n_slots - disponibilidade[p[0]].bit_count() for p in professores)
+    return {
+        'variaveis_densas': n_p * n_m * n_t * n_d * n_slots,
+        'restricoes_densas': (n_m * n_t + n_p * n_d * n_slots + n_t * n_d * n_slots
+                              + slots_indisponiveis * n_m * n_t),
+    }
+
+
+def elastic_penalty(custo_materia, custo_dia, materias, turmas):
+    """Custo de cada aula não alocada no modo elástico.
+
+    Maior que o custo do cronograma completo mais caro possível, então o solver só deixa uma aula
+    de fora quando não há como encaixá-la: primeiro maximiza as aulas alocadas, depois as preferências.
+    """
+    pior_aula = 1 + max(custo_materia.values(), default=0) + max(custo_dia.values(), default=0)
+    return 1 + pior_aula * sum(m[2] for m in materias if m[2] > 0) * len(turmas)
+
+
+def add_carga_constraints(prob, objetivo, por_demanda, materias, turmas, elastic, penalidade):
+    """Restrições de carga horária de cada (matéria, turma); devolve (demandas_sem_professor, faltas).
+
+    No modo elástico cada restrição ganha uma variável de falta (aulas não alocadas), penalizada
+    no objetivo; `faltas` mapeia (m, t) -> variável e as demandas sem professor viram falta total.
+    """
+    demandas_sem_professor = []
+    faltas = {}
+    for m_id, _, carga in materias:
+        for t in turmas:
+            t_id = t[0]
+            termos = por_demanda.get((m_id, t_id))
+            if carga > 0 and elastic:
+                falta = pulp.LpVariable(f"falta_{m_id}_{t_id}", 0, carga, cat='Integer')
+                faltas[m_id, t_id] = falta
+                objetivo[falta] = penalidade
+                termos = dict(termos or {})
+                termos[falta] = 1
+            if not termos:
+                if carga > 0:
+                    demandas_sem_professor.append((m_id, t_id))
+                continue
+            prob += pulp.LpConstraint(pulp.LpAffineExpression(termos), pulp.LpConstraintEQ, rhs=carga)
+    return demandas_sem_professor, faltas
+
+
+def build_schedule_model(professores, materias, turmas, dias_semana, horarios, elastic=False):
+    """Monta o problema PuLP criando variáveis apenas para os dias/horários em que o professor está disponível.
+
+    As entidades são indexadas por id e as preferências são interpretadas uma única vez; o
+    objetivo e cada família de restrições são montados como `LpAffineExpression` a partir de
+    dicionários. Retorna (prob, x, stats); `stats` traz a contagem de variáveis/restrições do
+    modelo esparso e do modelo denso equivalente, além do tempo gasto em cada etapa. Com
+    `elastic`, `stats['faltas']` traz as variáveis de falta de `add_carga_constraints`.
+    """
+    tempos = {}
+    inicio = time.perf_counter()
+    n_slots = len(horarios)
+    slots = range(n_slots)
+    disponibilidade = {p[0]: parse_disponibilidade(p[2], dias_semana, n_slots) for p in professores}
+    # Horários em comum de cada par professor–turma (AND das máscaras)
+    pares = {(p_id, t[0]): mask & turma_mask(t, dias_semana, n_slots)
+             for p_id, mask in disponibilidade.items() for t in turmas}
+    custo_materia, custo_dia = preference_costs(professores, materias, dias_semana)
+    tempos['indices'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    prob = pulp.LpProblem("Agendamento_Escolar", pulp.LpMinimize)
+    keys = [(p_id, m[0], t[0], d, s)
+            for p_id in disponibilidade
+            for d_idx, d in enumerate(dias_semana)
+            for m in materias
+            for t in turmas
+            for s in slots if pares[p_id, t[0]] >> (d_idx * n_slots + s) & 1]
+    x = pulp.LpVariable.dicts("assign", keys, cat='Binary')
+    tempos['variaveis'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    objetivo = {x[key]: 1 + custo_materia[key[0], key[1]] + custo_dia[key[0], key[3]] for key in keys}
+    tempos['objetivo'] = time.perf_counter() - inicio
+
+    # Agrupa as chaves existentes uma única vez por família de restrição
+    inicio = time.perf_counter()
+    por_demanda = {}
+    por_professor = {}
+    por_turma = {}
+    for key in keys:
+        p_id, m_id, t_id, d, s = key
+        var = x[key]
+        por_demanda.setdefault((m_id, t_id), {})[var] = 1
+        por_professor.setdefault((p_id, d, s), {})[var] = 1
+        por_turma.setdefault((t_id, d, s), {})[var] = 1
+    tempos['agrupamento'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    penalidade = elastic_penalty(custo_materia, custo_dia, materias, turmas) if elastic else 0
+    demandas_sem_professor, faltas = add_carga_constraints(prob, objetivo, por_demanda, materias, turmas,
+                                                           elastic, penalidade)
+    prob.setObjective(pulp.LpAffineExpression(objetivo))
+    tempos['carga'] = time.perf_counter() - inicio
+
+    # Linhas com uma única variável binária são redundantes (x <= 1) e não são criadas
+    inicio = time.perf_counter()
+    for termos in por_professor.values():
+        if len(termos) > 1:
+            prob += pulp.LpConstraint(pulp.LpAffineExpression(termos), pulp.LpConstraintLE, rhs=1)
+    tempos['professor'] = time.perf_counter() - inicio
+
+    # Garantir que para cada turma, dia e horário haja no máximo UMA atribuição (evita dois professores no mesmo dia/horário para mesma turma)
+    inicio = time.perf_counter()
+    for termos in por_turma.values():
+        if len(termos) > 1:
+            prob += pulp.LpConstraint(pulp.LpAffineExpression(termos), pulp.LpConstraintLE, rhs=1)
+    tempos['turma'] = time.perf_counter() - inicio
+
+    stats = {
+        'variaveis': len(x) + len(faltas),
+        'restricoes': prob.numConstraints(),
+        'demandas_sem_professor': demandas_sem_professor,
+        'faltas': faltas,
+        'tempos': tempos,
+    }
+    stats.update(_dense_model_size(professores, materias, turmas, dias_semana, n_slots, disponibilidade))
+    return prob, x, stats
+
+
+def build_aggregated_model(professores, materias, turmas, dias_semana, horarios, elastic=False):
+    """Formulação agregada em dois níveis, equivalente a `build_schedule_model`.
+
+    - a[p, m, t] (inteira): quantas aulas de m o professor p dá para a turma t;
+    - v[p, t, d, s] (binária): o professor p está com a turma t no dia d, horário s.
+
+    Os conflitos de professor e de turma dependem só de v, e o custo separa-se em
+    custo_materia (sobre a) e 1 + custo_dia (sobre v). Dentro de uma turma as matérias podem ser
+    permutadas livremente entre os horários de cada professor, então qualquer solução (a, v) que
+    respeite sum_m a[p, m, t] == sum_ds v[p, t, d, s] vira um cronograma completo com o mesmo custo
+    (ver `aggregated_assignments`). O modelo tem P·T·(M + D·S) variáveis em vez de P·M·T·D·S.
+    Retorna (prob, variaveis, stats) com variaveis = {'a': ..., 'v': ...}.
+    """
+    tempos = {}
+    inicio = time.perf_counter()
+    n_slots = len(horarios)
+    slots = range(n_slots)
+    disponibilidade = {p[0]: parse_disponibilidade(p[2], dias_semana, n_slots) for p in professores}
+    pares = {(p_id, t[0]): mask & turma_mask(t, dias_semana, n_slots)
+             for p_id, mask in disponibilidade.items() for t in turmas}
+    custo_materia, custo_dia = preference_costs(professores, materias, dias_semana)
+    ativos = [p_id for p_id in disponibilidade if disponibilidade[p_id]]
+    tempos['indices'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    prob = pulp.LpProblem("Agendamento_Escolar", pulp.LpMinimize)
+    v_keys = [(p_id, t[0], d, s)
+              for p_id in ativos
+              for d_idx, d in enumerate(dias_semana)
+              for t in turmas
+              for s in slots if pares[p_id, t[0]] >> (d_idx * n_slots + s) & 1]
+    v = pulp.LpVariable.dicts("slot", v_keys, cat='Binary')
+    a = {}
+    for m_id, _, carga in materias:
+        if carga <= 0:
+            continue
+        for p_id in ativos:
+            for t in turmas:
+                if pares[p_id, t[0]]:
+                    a[p_id, m_id, t[0]] = pulp.LpVariable(f"aulas_{p_id}_{m_id}_{t[0]}", 0, carga, cat='Integer')
+    tempos['variaveis'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    objetivo = {var: custo_materia[p_id, m_id] for (p_id, m_id, _), var in a.items() if custo_materia[p_id, m_id]}
+    for key, var in v.items():
+        objetivo[var] = 1 + custo_dia[key[0], key[2]]
+    tempos['objetivo'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    por_demanda = {}
+    por_par = {}
+    for (p_id, m_id, t_id), var in a.items():
+        por_demanda.setdefault((m_id, t_id), {})[var] = 1
+        por_par.setdefault((p_id, t_id), {})[var] = 1
+    por_professor = {}
+    por_turma = {}
+    for key, var in v.items():
+        p_id, t_id, d, s = key
+        por_par.setdefault((p_id, t_id), {})[var] = -1
+        por_professor.setdefault((p_id, d, s), {})[var] = 1
+        por_turma.setdefault((t_id, d, s), {})[var] = 1
+    tempos['agrupamento'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    penalidade = elastic_penalty(custo_materia, custo_dia, materias, turmas) if elastic else 0
+    demandas_sem_professor, faltas = add_carga_constraints(prob, objetivo, por_demanda, materias, turmas,
+                                                           elastic, penalidade)
+    prob.setObjective(pulp.LpAffineExpression(objetivo))
+    tempos['carga'] = time.perf_counter() - inicio
+
+    # Horas de matérias do par (p, t) == horários ocupados pelo par
+    inicio = time.perf_counter()
+    for termos in por_par.values():
+        prob += pulp.LpConstraint(pulp.LpAffineExpression(termos), pulp.LpConstraintEQ, rhs=0)
+    tempos['ligacao'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    for termos in por_professor.values():
+        if len(termos) > 1:
+            prob += pulp.LpConstraint(pulp.LpAffineExpression(termos), pulp.LpConstraintLE, rhs=1)
+    tempos['professor'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    for termos in por_turma.values():
+        if len(termos) > 1:
+            prob += pulp.LpConstraint(pulp.LpAffineExpression(termos), pulp.LpConstraintLE, rhs=1)
+    tempos['turma'] = time.perf_counter() - inicio
+
+    stats = {
+        'variaveis': len(v) + len(a) + len(faltas),
+        'restricoes': prob.numConstraints(),
+        'demandas_sem_professor': demandas_sem_professor,
+        'faltas': faltas,
+        'tempos': tempos,
+    }
+    stats.update(_dense_model_size(professores, materias, turmas, dias_semana, n_slots, disponibilidade))
+    return prob, {'a': a, 'v': v}, stats
+
+
+def aggregated_assignments(variaveis):
+    """Converte a solução (a, v) da formulação agregada em chaves (p, m, t, dia, slot)."""
+    horarios_par = {}
+    for (p_id, t_id, d, s), var in variaveis['v'].items():
+        if var.varValue is not None and var.varValue > 0.5:
+            horarios_par.setdefault((p_id, t_id), []).append((d, s))
+    aulas_par = {}
+    for (p_id, m_id, t_id), var in variaveis['a'].items():
+        qtd = round(var.varValue or 0)
+        aulas_par.setdefault((p_id, t_id), []).extend([m_id] * qtd)
+    atribuicoes = []
+    for par, horarios_ocupados in horarios_par.items():
+        for (d, s), m_id in zip(horarios_ocupados, aulas_par.get(par, [])):
+            atribuicoes.append((par[0], m_id, par[1], d, s))
+    return atribuicoes
+
+
+def set_initial_values(formulation, variaveis, warm_start):
+    """Define a solução inicial a partir de chaves (p, m, t, dia, slot); retorna quantas foram usadas."""
+    if formulation == 'aggregated':
+        ocupados = {(p, t, d, s) for p, _, t, d, s in warm_start}
+        contagem = {}
+        for p, m, t, _, _ in warm_start:
+            contagem[p, m, t] = contagem.get((p, m, t), 0) + 1
+        for key, var in variaveis['v'].items():
+            var.setInitialValue(1 if key in ocupados else 0)
+        for key, var in variaveis['a'].items():
+            var.setInitialValue(contagem.get(key, 0))
+        return len(ocupados.intersection(variaveis['v']))
+    for key, var in variaveis.items():
+        var.setInitialValue(1 if key in warm_start else 0)
+    return len(warm_start.intersection(variaveis))
+
+
+# Formulações disponíveis: 'full' (x[p, m, t, d, s]) e 'aggregated' (a[p, m, t] + v[p, t, d, s])
+FORMULATIONS = ('full', 'aggregated')
+
+def solve_heuristic(professores, materias, turmas, dias_semana, horarios, time_limit=0.5, warm_start=None, seed=0,
+                    elastic=False):
+    """Motor heurístico em Python puro: construção gulosa + busca local limitada por tempo.
+
+    A construção aloca primeiro as aulas da turma com menor folga (horários livres com professor
+    disponível menos horas ainda pendentes), escolhendo o (professor, dia, horário) de menor custo
+    de preferência; aulas do `warm_start` ainda válidas são mantidas. A busca local aplica
+    movimentos (trocar professor/dia/horário de uma aula) e trocas (matérias ou horários entre duas
+    aulas da mesma turma, professores entre duas aulas no mesmo horário) até um ótimo local e, no
+    tempo restante, perturba a solução (remove e realoca algumas aulas) aceitando o que não piora.
+    Retorna (status, atribuicoes, stats) como `solve_component`; status 'Feasible' em caso de
+    sucesso (sem prova de otimalidade) ou 'Not Solved' se alguma carga não pôde ser alocada. Com
+    `elastic` as aulas que não couberam vão para `stats['faltas']` e o parcial é 'Feasible'.
+    """
+    tempos = {}
+    inicio = time.perf_counter()
+    rng = random.Random(seed)
+    n_slots = len(horarios)
+    slots = [(d, s) for d in dias_semana for s in range(n_slots)]
+    bit = {(d, s): slot_bit(d_idx, s, n_slots) for d_idx, d in enumerate(dias_semana) for s in range(n_slots)}
+    # Máscaras de horários em que cada professor / turma pode ter aula
+    livres = {p[0]: parse_disponibilidade(p[2], dias_semana, n_slots) for p in professores}
+    turma_livre = {t[0]: turma_mask(t, dias_semana, n_slots) for t in turmas}
+    custo_materia, custo_dia = preference_costs(professores, materias, dias_semana)
+    profs_no_slot = {(d, s): [p_id for p_id, mask in livres.items() if mask & bit[d, s]] for d, s in slots}
+    pendentes = {(m_id, t[0]): carga for m_id, _, carga in materias if carga > 0 for t in turmas}
+
+    aulas = {}          # (t, d, s) -> [p, m]
+    prof_ocupado = {}   # (p, d, s) -> t
+
+    def custo(p_id, m_id, d):
+        return 1 + custo_materia[p_id, m_id] + custo_dia[p_id, d]
+
+    def custo_total():
+        return sum(custo(p_id, m_id, d) for (_, d, _), (p_id, m_id) in aulas.items())
+
+    def alocar(p_id, m_id, t_id, d, s):
+        aulas[t_id, d, s] = [p_id, m_id]
+        prof_ocupado[p_id, d, s] = t_id
+
+    def remover(t_id, d, s):
+        p_id, m_id = aulas.pop((t_id, d, s))
+        del prof_ocupado[p_id, d, s]
+        return m_id
+
+    def melhor_posicao(m_id, t_id):
+        melhor = None
+        for d, s in slots:
+            if (t_id, d, s) in aulas or not turma_livre[t_id] & bit[d, s]:
+                continue
+            for p_id in profs_no_slot[d, s]:
+                if (p_id, d, s) not in prof_ocupado:
+                    c = custo(p_id, m_id, d)
+                    if melhor is None or c < melhor[0]:
+                        melhor = (c, p_id, d, s)
+        return melhor
+
+    for p_id, m_id, t_id, d, s in sorted(warm_start or ()):
+        if (pendentes.get((m_id, t_id), 0) > 0 and livres.get(p_id, 0) & turma_livre[t_id] & bit.get((d, s), 0)
+                and (t_id, d, s) not in aulas and (p_id, d, s) not in prof_ocupado):
+            alocar(p_id, m_id, t_id, d, s)
+            pendentes[m_id, t_id] -= 1
+
+    def folga(t_id):
+        livres_turma = sum(1 for d, s in slots if turma_livre[t_id] & bit[d, s] and (t_id, d, s) not in aulas
+                           and any((p_id, d, s) not in prof_ocupado for p_id in profs_no_slot[d, s]))
+        return livres_turma - sum(q for (_, t), q in pendentes.items() if t == t_id)
+
+    nao_alocadas = []
+    while True:
+        turmas_pendentes = {t_id for (_, t_id), q in pendentes.items() if q > 0}
+        if not turmas_pendentes:
+            break
+        t_id = min(sorted(turmas_pendentes), key=folga)
+        m_id = max((m for (m, t), q in pendentes.items() if t == t_id and q > 0),
+                   key=lambda m: (pendentes[m, t_id], -m))
+        melhor = melhor_posicao(m_id, t_id)
+        if melhor is None and _heuristic_repair(t_id, slots, profs_no_slot, aulas, prof_ocupado, livres,
+                                                  turma_livre, bit):
+            continue
+        if melhor is None:
+            nao_alocadas.append((m_id, t_id, pendentes[m_id, t_id]))
+            pendentes[m_id, t_id] = 0
+            continue
+        _, p_id, d, s = melhor
+        alocar(p_id, m_id, t_id, d, s)
+        pendentes[m_id, t_id] -= 1
+    tempos['construcao'] = time.perf_counter() - inicio
+    custo_inicial = custo_total()
+
+    inicio = time.perf_counter()
+    limite = inicio + (time_limit or 0)
+
+    def descida():
+        melhorou = True
+        while melhorou and time.perf_counter() < limite:
+            melhorou = False
+            # Movimento: realocar uma aula para outro professor/dia/horário mais barato
+            for (t_id, d, s) in list(aulas):
+                p_id, m_id = aulas[t_id, d, s]
+                atual = custo(p_id, m_id, d)
+                for d2, s2 in slots:
+                    if (d2, s2) != (d, s) and ((t_id, d2, s2) in aulas or not turma_livre[t_id] & bit[d2, s2]):
+                        continue
+                    p2 = next((p2 for p2 in profs_no_slot[d2, s2]
+                               if custo(p2, m_id, d2) < atual and (p2, d2, s2) not in prof_ocupado), None)
+                    if p2 is not None:
+                        remover(t_id, d, s)
+                        alocar(p2, m_id, t_id, d2, s2)
+                        melhorou = True
+                        break
+            # Trocas entre duas aulas da mesma turma: de matérias (ocupação não muda) ou de horários
+            por_turma = {}
+            for chave in aulas:
+                por_turma.setdefault(chave[0], []).append(chave)
+            for chaves in por_turma.values():
+                for i, k1 in enumerate(chaves):
+                    for k2 in chaves[i + 1:]:
+                        (p1, m1), (p2, m2) = aulas[k1], aulas[k2]
+                        if m1 != m2 and custo_materia[p1, m2] + custo_materia[p2, m1] < custo_materia[p1, m1] + custo_materia[p2, m2]:
+                            aulas[k1][1], aulas[k2][1] = m2, m1
+                            melhorou = True
+                            continue
+                        (t_id, d1, s1), (_, d2, s2) = k1, k2
+                        if (p1 != p2 and custo_dia[p1, d2] + custo_dia[p2, d1] < custo_dia[p1, d1] + custo_dia[p2, d2]
+                                and livres[p1] & bit[d2, s2] and livres[p2] & bit[d1, s1]
+                                and (p1, d2, s2) not in prof_ocupado and (p2, d1, s1) not in prof_ocupado):
+                            remover(*k1)
+                            remover(*k2)
+                            alocar(p2, m2, t_id, d1, s1)
+                            alocar(p1, m1, t_id, d2, s2)
+                            melhorou = True
+            # Troca de professores entre duas aulas no mesmo dia/horário (ambos disponíveis no dia)
+            por_slot = {}
+            for chave in aulas:
+                por_slot.setdefault(chave[1:], []).append(chave)
+            for chaves in por_slot.values():
+                for i, k1 in enumerate(chaves):
+                    for k2 in chaves[i + 1:]:
+                        (p1, m1), (p2, m2) = aulas[k1], aulas[k2]
+                        if custo_materia[p2, m1] + custo_materia[p1, m2] < custo_materia[p1, m1] + custo_materia[p2, m2]:
+                            aulas[k1][0], aulas[k2][0] = p2, p1
+                            prof_ocupado[p2, k1[1], k1[2]] = k1[0]
+                            prof_ocupado[p1, k2[1], k2[2]] = k2[0]
+                            melhorou = True
+
+    if elastic or not nao_alocadas:
+        descida()
+        melhor_custo = custo_total()
+        perturbacoes = 0
+        # Busca local iterada: remove algumas aulas, realoca pelo menor custo e mantém se não piorar.
+        # Custo == número de aulas significa todas as preferências atendidas (limite inferior).
+        while aulas and melhor_custo > len(aulas) and time.perf_counter() < limite:
+            copia_aulas = {k: list(v) for k, v in aulas.items()}
+            copia_ocupado = dict(prof_ocupado)
+            removidas = [(k[0], remover(*k)) for k in rng.sample(sorted(aulas), max(1, len(aulas) // 10))]
+            for t_id, m_id in removidas:
+                melhor = melhor_posicao(m_id, t_id)
+                if melhor is None:
+                    break
+                alocar(melhor[1], m_id, t_id, melhor[2], melhor[3])
+            else:
+                descida()
+            novo_custo = custo_total() if len(aulas) == len(copia_aulas) else None
+            if novo_custo is not None and novo_custo <= melhor_custo:
+                melhor_custo = novo_custo
+            else:
+                aulas, prof_ocupado = copia_aulas, copia_ocupado
+            perturbacoes += 1
+        tempos['perturbacoes'] = perturbacoes
+    tempos['busca_local'] = time.perf_counter() - inicio
+
+    atribuicoes = [(p_id, m_id, t_id, d, s) for (t_id, d, s), (p_id, m_id) in aulas.items()]
+    stats = {
+        'variaveis': 0,
+        'restricoes': 0,
+        'demandas_sem_professor': [(m_id, t_id) for m_id, t_id, _ in nao_alocadas],
+        'faltas': nao_alocadas,
+        'tempos': tempos,
+        'custo_inicial': custo_inicial,
+        'objetivo': custo_total(),
+    }
+    if nao_alocadas and not elastic:
+        return 'Not Solved', [], stats
+    return 'Feasible', atribuicoes, stats
+
+
+def _heuristic_repair(t_id, slots, profs_no_slot, aulas, prof_ocupado, livres, turma_livre, bit):
+    """Libera um professor para a turma `t_id`: num horário livre da turma, troca a aula que ocupa
+    um professor disponível por outro professor livre, ou a move para outro horário do mesmo professor."""
+    for d, s in slots:
+        if (t_id, d, s) in aulas or not turma_livre[t_id] & bit[d, s]:
+            continue
+        for p_id in profs_no_slot[d, s]:
+            t2 = prof_ocupado.get((p_id, d, s))
+            if t2 is None:
+                continue
+            _, m2 = aulas[t2, d, s]
+            for p2 in profs_no_slot[d, s]:
+                if (p2, d, s) not in prof_ocupado:
+                    aulas[t2, d, s][0] = p2
+                    del prof_ocupado[p_id, d, s]
+                    prof_ocupado[p2, d, s] = t2
+                    return True
+            for d2, s2 in slots:
+                if ((t2, d2, s2) not in aulas and livres[p_id] & turma_livre[t2] & bit[d2, s2]
+                        and (p_id, d2, s2) not in prof_ocupado):
+                    del aulas[t2, d, s]
+                    del prof_ocupado[p_id, d, s]
+                    aulas[t2, d2, s2] = [p_id, m2]
+                    prof_ocupado[p_id, d2, s2] = t2
+                    return True
+    return False
+
+
+# Motores de resolução: 'milp' (PuLP) e 'heuristic' (solve_heuristic)
+ENGINES = ('milp', 'heuristic')
+
+
+def format_horario(valor):
+    """Normaliza horários vindos do banco ('08:00:00', time ou timedelta do MySQL) para 'HH:MM:SS'."""
+    if isinstance(valor, timedelta):
+        total = int(valor.total_seconds())
+        return f"{total // 3600:02d}:{total % 3600 // 60:02d}:{total % 60:02d}"
+    if hasattr(valor, 'strftime'):
+        return valor.strftime('%H:%M:%S')
+    texto = str(valor)
+    return texto.zfill(8) if len(texto) == 7 else texto
+
+
+def load_warm_start(cursor, horarios):
+    """Lê o cronograma ativo e converte cada linha na chave (p, m, t, dia, slot) do modelo."""
+    slot_por_inicio = {inicio: s for s, (inicio, _) in enumerate(horarios)}
+    cursor.execute("""
+    SELECT c.professor_id, c.materia_id, c.turma_id, c.dia_semana, c.horario_inicio
+    FROM cronogramas c
+    JOIN cronograma_ativo a ON a.id = 1 AND c.versao_id = a.versao_id
+    """)
+    chaves = set()
+    for p_id, m_id, t_id, dia, inicio in cursor.fetchall():
+        s = slot_por_inicio.get(format_horario(inicio))
+        if s is not None:
+            chaves.add((p_id, m_id, t_id, dia, s))
+    return chaves
+
+
+def load_professores(cursor, materias, dias_semana, horarios, grade_mask=None):
+    """Lê os professores com disponibilidade e preferências já interpretadas, numa única passada.
+
+    Retorna tuplas (id, nome, disponibilidade, preferencias) com a disponibilidade como máscara de
+    bits sobre a grade (restrita a `grade_mask`) e preferencias = ((materia_id ou None, dia ou None,
+    peso), ...), prontas para os montadores do modelo sem nenhum parse nos laços. Professores ainda
+    sem linhas nas tabelas normalizadas (cadastrados por fora de `create_tables`) usam as colunas legadas.
+    """
+    n_slots = len(horarios)
+    grade_mask = full_mask(dias_semana, n_slots) if grade_mask is None else grade_mask
+    cursor.execute("SELECT id, nome, disponibilidade, preferencias FROM professores ORDER BY id")
+    linhas = cursor.fetchall()
+    disponibilidade = _load_slot_masks(
+        cursor, "SELECT professor_id, dia_semana, horario_inicio FROM professor_disponibilidade", dias_semana, horarios)
+    cursor.execute("SELECT DISTINCT professor_id FROM professor_disponibilidade")
+    com_linhas = {row[0] for row in cursor.fetchall()}
+    preferencias = {}
+    cursor.execute("SELECT professor_id, materia_id, dia_semana, peso FROM professor_preferencias ORDER BY id")
+    for p_id, m_id, dia, peso in cursor.fetchall():
+        preferencias.setdefault(p_id, []).append((m_id, dia or None, peso))
+    professores = []
+    for p_id, nome, disp_legado, pref_legado in linhas:
+        if p_id in com_linhas:
+            disp = disponibilidade.get(p_id, 0)
+        else:
+            disp = parse_disponibilidade(disp_legado, dias_semana, n_slots)
+        pref = tuple(preferencias[p_id]) if p_id in preferencias else parse_preferencias(pref_legado, materias)
+        professores.append((p_id, nome, disp & grade_mask, pref))
+    return professores
+
+
+def format_disponibilidade(mask, dias_semana=DIAS_SEMANA, horarios=HORARIOS, grade_mask=None):
+    """Resumo legível: 'Segunda, Terça 08:00/09:00' (dia inteiro da grade = só o nome do dia)."""
+    n_slots = len(horarios)
+    grade_mask = full_mask(dias_semana, n_slots) if grade_mask is None else grade_mask
+    dia_cheio = (1 << n_slots) - 1
+    partes = []
+    for d_idx, d in enumerate(dias_semana):
+        deslocamento = d_idx * n_slots
+        dia = mask >> deslocamento & dia_cheio
+        if not dia:
+            continue
+        if dia == grade_mask >> deslocamento & dia_cheio:
+            partes.append(d)
+        else:
+            partes.append(f"{d} " + "/".join(horarios[s][0][:5] for s in range(n_slots) if dia >> s & 1))
+    return ", ".join(partes)
+
+
+def format_preferencias(preferencias, materias):
+    """Resumo legível: 'Matemática:Terça (5); História (3)'."""
+    nomes = {m[0]: m[1] for m in materias}
+    partes = []
+    for m_id, dia, peso in preferencias:
+        alvo = ":".join(v for v in (nomes.get(m_id, ""), dia or "") if v)
+        partes.append(f"{alvo} ({peso})")
+    return "; ".join(partes)
+
+
+def find_components(professores, turmas, dias_semana, n_slots=None):
+    """Separa o problema em componentes independentes do grafo professor–turma.
+
+    As restrições acoplam variáveis por (matéria, turma), por professor e por turma; as matérias
+    não ligam turmas entre si. Assim, dois blocos só interagem se algum professor puder lecionar
+    em turmas de ambos — o que exige horários em comum (AND das máscaras não nulo). Retorna uma lista de (professores, turmas) por componente, ordenada pelo
+    menor id de turma; professores sem nenhuma turma candidata ficam de fora.
+    """
+    pai = {}
+
+    def raiz(no):
+        pai.setdefault(no, no)
+        while pai[no] != no:
+            pai[no] = pai[pai[no]]
+            no = pai[no]
+        return no
+
+    def unir(a, b):
+        ra, rb = raiz(a), raiz(b)
+        if ra != rb:
+            pai[rb] = ra
+
+    n_slots = len(HORARIOS) if n_slots is None else n_slots
+    for t in turmas:
+        raiz(('t', t[0]))
+    mascaras_turma = [(t[0], turma_mask(t, dias_semana, n_slots)) for t in turmas]
+    for p in professores:
+        disp = parse_disponibilidade(p[2], dias_semana, n_slots)
+        for t_id, mask in mascaras_turma:
+            if disp & mask:
+                unir(('p', p[0]), ('t', t_id))
+
+    grupos = {}
+    for t in turmas:
+        grupos.setdefault(raiz(('t', t[0])), ([], []))[1].append(t)
+    for p in professores:
+        if ('p', p[0]) in pai:
+            grupos[raiz(('p', p[0]))][0].append(p)
+    return sorted(grupos.values(), key=lambda g: min(t[0] for t in g[1]))
+
+
+def profile_call(pasta, nome, funcao, *args, **kwargs):
+    """Executa `funcao` sob cProfile e tracemalloc; retorna (resultado, arquivos gravados em `pasta`).
+
+    Grava <nome>.prof (para `python -m pstats` ou snakeviz), <nome>_cpu.txt com as funções de maior
+    tempo acumulado, <nome>.tracemalloc (`tracemalloc.Snapshot.load`) com a memória ainda alocada
+    ao final e <nome>_memoria.txt com o pico e as linhas que mais alocaram.
+    """
+    os.makedirs(pasta, exist_ok=True)
+    ja_rastreando = tracemalloc.is_tracing()
+    if not ja_rastreando:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        resultado = funcao(*args, **kwargs)
+    finally:
+        perfil.disable()
+        foto = tracemalloc.take_snapshot()
+        atual, pico = tracemalloc.get_traced_memory()
+        if not ja_rastreando:
+            tracemalloc.stop()
+    base = os.path.join(pasta, nome)
+    perfil.dump_stats(f"{base}.prof")
+    with open(f"{base}_cpu.txt", 'w', encoding='utf-8') as f:
+        pstats.Stats(perfil, stream=f).sort_stats('cumulative').print_stats(30)
+    foto.dump(f"{base}.tracemalloc")
+    with open(f"{base}_memoria.txt", 'w', encoding='utf-8') as f:
+        f.write(f"Pico: {pico / 2 ** 20:.1f} MiB; ainda alocado ao final: {atual / 2 ** 20:.1f} MiB\n\n")
+        f.writelines(f"{estatistica}\n" for estatistica in foto.statistics('lineno')[:25])
+    arquivos = [f"{base}{sufixo}" for sufixo in ('.prof', '_cpu.txt', '.tracemalloc', '_memoria.txt')]
+    logging.info(f"Perfil de {nome} gravado em {pasta}")
+    return resultado, arquivos
+
+
+def solve_component(professores, materias, turmas, dias_semana, horarios, solver_options=None, log_name='solver',
+                    warm_start=None):
+    """Monta e resolve o subproblema de um componente.
+
+    Retorna (status, atribuicoes, stats) apenas com tipos simples, para poder ser executada em
+    outro processo; `atribuicoes` é a lista de chaves (p, m, t, dia, slot) com valor 1. O status é
+    'Optimal', 'Feasible' (limite de tempo/gap atingido com solução inteira) ou o status do PuLP.
+    `warm_start` é um conjunto de chaves usado como solução inicial. `stats['faltas']` lista
+    (matéria, turma, aulas não alocadas), só preenchida no modo elástico. `stats` traz também
+    tempo_montagem, tempo_solver e nao_nulos; com `solver_options.profile_dir` a montagem roda sob
+    `profile_call` e `stats['perfis']` lista os arquivos gravados.
+    """
+    solver_options = solver_options or SolverOptions()
+    if solver_options.engine == 'heuristic':
+        inicio = time.perf_counter()
+        status, atribuicoes, stats = solve_heuristic(professores, materias, turmas, dias_semana, horarios,
+                                                     time_limit=solver_options.heuristic_time, warm_start=warm_start,
+                                                     elastic=solver_options.elastic)
+        stats['tempo_solver'] = time.perf_counter() - inicio
+        return status, atribuicoes, stats
+    montar = build_aggregated_model if solver_options.formulation == 'aggregated' else build_schedule_model
+    argumentos = (professores, materias, turmas, dias_semana, horarios)
+    inicio = time.perf_counter()
+    if solver_options.profile_dir:
+        (prob, variaveis, stats), perfis = profile_call(solver_options.profile_dir, f"{log_name}_montagem", montar,
+                                                        *argumentos, elastic=solver_options.elastic)
+    else:
+        prob, variaveis, stats = montar(*argumentos, elastic=solver_options.elastic)
+        perfis = []
+    stats['tempo_montagem'] = time.perf_counter() - inicio
+    # PuLP 3.3+ expõe prob.constraints() como lista; nas versões anteriores é um dicionário
+    restricoes = prob.constraints() if callable(prob.constraints) else prob.constraints.values()
+    stats['nao_nulos'] = sum(len(restricao) for restricao in restricoes)
+    stats['perfis'] = perfis
+    faltas = stats.pop('faltas')
+    stats['faltas'] = []
+    if stats['demandas_sem_professor'] and not solver_options.elastic:
+        return 'Infeasible', [], stats
+    if not prob.numConstraints():
+        return 'Optimal', [], stats
+    if warm_start:
+        stats['warm_start'] = set_initial_values(solver_options.formulation, variaveis, warm_start)
+    inicio = time.perf_counter()
+    prob.solve(solver_options.build(log_name, warm_start=bool(warm_start)))
+    stats['tempo_solver'] = time.perf_counter() - inicio
+    if prob.sol_status == pulp.LpSolutionOptimal:
+        status = 'Optimal'
+    elif prob.sol_status == pulp.LpSolutionIntegerFeasible:
+        status = 'Feasible'
+    else:
+        return pulp.LpStatus[prob.status], [], stats
+    stats['objetivo'] = pulp.value(prob.objective)
+    stats['faltas'] = [(m_id, t_id, round(var.varValue or 0)) for (m_id, t_id), var in faltas.items()
+                       if (var.varValue or 0) > 0.5]
+    if solver_options.formulation == 'aggregated':
+        atribuicoes = aggregated_assignments(variaveis)
+    else:
+        atribuicoes = [key for key, var in variaveis.items() if var.varValue is not None and var.varValue > 0.5]
+    return status, atribuicoes, stats
+
+
+def solve_components(componentes, materias, dias_semana, horarios, max_workers=None, solver_options=None,
+                     warm_start=None, progress=None):
+    """Resolve os componentes, em paralelo com `ProcessPoolExecutor` quando há mais de um.
+
+    `progress`, se informado, recebe o status de cada componente assim que ele termina.
+    """
+    def avisar(i, resultado):
+        if progress:
+            progress(f"Componente {i + 1}/{len(tarefas)}: {resultado[0]}")
+        return resultado
+
+    tarefas = []
+    for i, (profs, turmas) in enumerate(componentes):
+        ids_turmas = {t[0] for t in turmas}
+        inicial = {key for key in warm_start if key[2] in ids_turmas} if warm_start else None
+        tarefas.append((profs, materias, turmas, dias_semana, horarios, solver_options, f"solver_{i + 1}", inicial))
+    workers = min(len(tarefas), max_workers or os.cpu_count() or 1)
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futuros = {pool.submit(solve_component, *args): i for i, args in enumerate(tarefas)}
+                resultados = [None] * len(tarefas)
+                for f in as_completed(futuros):
+                    resultados[futuros[f]] = avisar(futuros[f], f.result())
+                return resultados
+        except (OSError, BrokenProcessPool) as e:
+            logging.warning(f"Pool de processos indisponível ({e}); resolvendo componentes em sequência")
+    return [avisar(i, solve_component(*args)) for i, args in enumerate(tarefas)]
+
+
+def begin_transaction(connection):
+    """Inicia uma transação explícita (MySQL ou adaptador SQLite), encerrando leituras pendentes."""
+    connection.commit()
+    connection.start_transaction()
+
+
+def persist_schedule(connection, atribuicoes, horarios, batch_size=None, retention=None, faltas=(), impressao=None):
+    """Grava as atribuições como uma nova versão de cronograma e a torna ativa.
+
+    Numa única transação: cria a versão em `cronograma_versoes`, insere as aulas com
+    `executemany` em lotes de `batch_size` (o conector MySQL converte cada lote em um INSERT
+    multi-linha) e troca o ponteiro `cronograma_ativo`. Leitores continuam vendo a versão
+    anterior até o commit; em caso de erro nada muda. Versões antigas além de `retention` são
+    removidas em seguida. `faltas` são as (matéria, turma, aulas) não alocadas de um cronograma
+    parcial, gravadas em `cronograma_faltas`. `impressao` (ver `schedule_fingerprint`) permite
+    reaproveitar a versão quando a mesma entrada voltar. Retorna o id da nova versão.
+    """
+    batch_size = batch_size or DB_INSERT_BATCH
+    cursor = connection.cursor()
+    begin_transaction(connection)
+    try:
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        cursor.execute("INSERT INTO cronograma_versoes (criado_em, total_aulas, impressao, usado_em) VALUES (%s, %s, %s, %s)",
+                       (agora, len(atribuicoes), impressao, agora))
+        versao_id = cursor.lastrowid
+        linhas = [(p_id, m_id, t_id, d, horarios[s][0], horarios[s][1], versao_id)
+                  for p_id, m_id, t_id, d, s in atribuicoes]
+        for i in range(0, len(linhas), batch_size):
+            cursor.executemany("""
+            INSERT INTO cronogramas (professor_id, materia_id, turma_id, dia_semana, horario_inicio, horario_fim, versao_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, linhas[i:i + batch_size])
+        if faltas:
+            cursor.executemany("INSERT INTO cronograma_faltas (versao_id, materia_id, turma_id, aulas) VALUES (%s, %s, %s, %s)",
+                               [(versao_id, m_id, t_id, qtd) for m_id, t_id, qtd in faltas])
+        cursor.execute("UPDATE cronograma_ativo SET versao_id = %s WHERE id = 1", (versao_id,))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    prune_schedule_versions(connection, retention)
+    return versao_id
+
+
+# Campos de SolverOptions que não mudam o cronograma resultante e ficam fora da impressão digital
+FINGERPRINT_IGNORA = ('keep_logs', 'log_dir', 'profile_dir', 'force_solve')
+
+
+def schedule_fingerprint(materias, dias_semana, horarios, grade_mask, turmas, professores, solver_options):
+    """Hash SHA-256 estável de tudo o que o solver recebe: grade, cargas, máscaras de horários,
+    preferências e as opções que afetam o resultado.
+
+    Usa as tuplas de `load_schedule_inputs` ordenadas por id e serializadas em JSON canônico.
+    Nomes ficam de fora: o cronograma guarda ids, então renomear uma turma não invalida o cache.
+    """
+    opcoes = {k: v for k, v in asdict(solver_options).items() if k not in FINGERPRINT_IGNORA}
+    dados = {
+        'grade': [list(dias_semana), [list(h) for h in horarios], grade_mask],
+        'materias': sorted([m_id, carga] for m_id, _, carga in materias),
+        'turmas': sorted([t_id, mascara] for t_id, _, mascara in turmas),
+        'professores': sorted(([p_id, mascara, [list(p) for p in prefs]] for p_id, _, mascara, prefs in professores),
+                              key=lambda p: p[0]),
+        'opcoes': opcoes,
+    }
+    texto = json.dumps(dados, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def reuse_cached_schedule(connection, impressao):
+    """Ativa a versão guardada com a mesma impressão digital, se houver, e marca o uso (LRU).
+
+    Retorna (versao_id, total_aulas, aulas não alocadas) ou None quando não há versão para reaproveitar.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT id, total_aulas FROM cronograma_versoes WHERE impressao = %s ORDER BY id DESC LIMIT 1",
+                   (impressao,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    versao_id, total = row
+    cursor.execute("SELECT COALESCE(SUM(aulas), 0) FROM cronograma_faltas WHERE versao_id = %s", (versao_id,))
+    faltas = int(cursor.fetchone()[0])
+    cursor.execute("UPDATE cronograma_versoes SET usado_em = %s WHERE id = %s",
+                   (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), versao_id))
+    cursor.execute("UPDATE cronograma_ativo SET versao_id = %s WHERE id = 1", (versao_id,))
+    connection.commit()
+    return versao_id, total, faltas
+
+
+def active_schedule_version(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT versao_id FROM cronograma_ativo WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def list_schedule_versions(connection):
+    """Lista (id, criado_em, total_aulas, ativa) das versões guardadas, da mais recente à mais antiga."""
+    ativa = active_schedule_version(connection)
+    cursor = connection.cursor()
+    cursor.execute("SELECT id, criado_em, total_aulas FROM cronograma_versoes ORDER BY id DESC")
+    return [(vid, criado_em, total, vid == ativa) for vid, criado_em, total in cursor.fetchall()]
+
+
+def activate_schedule_version(connection, versao_id):
+    """Rollback instantâneo: aponta o cronograma ativo para uma versão guardada."""
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM cronograma_versoes WHERE id = %s", (versao_id,))
+    if cursor.fetchone()[0] == 0:
+        raise ValueError(f"Versão de cronograma {versao_id} não existe")
+    cursor.execute("UPDATE cronograma_ativo SET versao_id = %s WHERE id = 1", (versao_id,))
+    connection.commit()
+
+
+def load_shortfall(connection, versao_id=None):
+    """Relatório de aulas não alocadas: (matéria, turma, aulas) da versão ativa ou de `versao_id`."""
+    cursor = connection.cursor()
+    if versao_id is None:
+        cursor.execute("SELECT versao_id FROM cronograma_ativo WHERE id = 1")
+        row = cursor.fetchone()
+        versao_id = row[0] if row else None
+    cursor.execute("""
+    SELECT m.nome, t.nome, f.aulas
+    FROM cronograma_faltas f
+    JOIN materias m ON f.materia_id = m.id
+    JOIN turmas t ON f.turma_id = t.id
+    WHERE f.versao_id = %s
+    ORDER BY t.nome, m.nome
+    """, (versao_id,))
+    return cursor.fetchall()
+
+
+# Linhas do cronograma buscadas por vez na aba Cronograma (o resto vem ao rolar a tabela)
+SCHEDULE_PAGE_SIZE = int(os.environ.get('SCHEDULE_PAGE_SIZE', '200'))
+
+
+def _schedule_filters(professor_id=None, turma_id=None, dia=None):
+    """Cláusula WHERE extra e parâmetros para filtrar o cronograma ativo no banco."""
+    condicoes, params = [], []
+    for coluna, valor in (('c.professor_id', professor_id), ('c.turma_id', turma_id), ('c.dia_semana', dia)):
+        if valor is not None:
+            condicoes.append(f"{coluna} = %s")
+            params.append(valor)
+    return "".join(f" AND {c}" for c in condicoes), params
+
+
+def _schedule_select(filtro='', ordem='dia'):
+    """A junção do cronograma ativo com professores, matérias e turmas, usada por todas as leituras.
+
+    Colunas: turma_id, dia, início, professor, matéria, turma, fim. `ordem` é 'dia' (grade: dia,
+    horário, turma), 'professor' (professor, dia, horário) ou 'turma' (turma, dia, horário).
+    """
+    ordem_dia = "CASE c.dia_semana " + " ".join(f"WHEN '{d}' THEN {i}" for i, d in enumerate(ORDEM_DIAS)) + " ELSE 99 END"
+    ordenacao = {
+        'dia': f"{ordem_dia}, c.horario_inicio, t.nome, c.turma_id",
+        'professor': f"p.nome, c.professor_id, {ordem_dia}, c.horario_inicio",
+        'turma': f"t.nome, c.turma_id, {ordem_dia}, c.horario_inicio",
+    }[ordem]
+    return f"""
+    SELECT c.turma_id, c.dia_semana, c.horario_inicio, p.nome, m.nome, t.nome, c.horario_fim
+    FROM cronogramas c
+    JOIN cronograma_ativo a ON a.id = 1 AND c.versao_id = a.versao_id
+    JOIN professores p ON c.professor_id = p.id
+    JOIN materias m ON c.materia_id = m.id
+    JOIN turmas t ON c.turma_id = t.id
+    WHERE 1 = 1{filtro}
+    ORDER BY {ordenacao}
+    """
+
+
+def load_schedule_rows(connection, ordem='dia'):
+    """Cronograma ativo inteiro como (professor, matéria, turma, dia, início, fim), para exportações e listagens."""
+    cursor = connection.cursor()
+    cursor.execute(_schedule_select(ordem=ordem))
+    return [(prof, mat, turma, dia, format_horario(ini), format_horario(fim))
+            for _, dia, ini, prof, mat, turma, fim in cursor.fetchall()]
+
+
+def load_schedule_page(connection, professor_id=None, turma_id=None, dia=None, limit=None, offset=0):
+    """Uma página do cronograma ativo, já filtrada e ordenada no banco.
+
+    Cada linha é (chave, (professor, matéria, turma, dia, início, fim)); a chave
+    'turma_id|dia|início' é única por versão (índice UNIQUE) e se mantém entre gerações, o que
+    permite à GUI atualizar só as aulas que mudaram (ver `plan_tree_updates`).
+    """
+    filtro, params = _schedule_filters(professor_id, turma_id, dia)
+    sql = _schedule_select(filtro, 'dia')
+    if limit is not None:
+        sql += " LIMIT %s OFFSET %s"
+        params += [limit, offset]
+    cursor = connection.cursor()
+    cursor.execute(sql, tuple(params))
+    return [(f"{t_id}|{dia}|{format_horario(ini)}", (prof, mat, turma, dia, format_horario(ini), format_horario(fim)))
+            for t_id, dia, ini, prof, mat, turma, fim in cursor.fetchall()]
+
+
+def count_schedule_rows(connection, professor_id=None, turma_id=None, dia=None):
+    filtro, params = _schedule_filters(professor_id, turma_id, dia)
+    cursor = connection.cursor()
+    cursor.execute(f"""
+    SELECT COUNT(*) FROM cronogramas c
+    JOIN cronograma_ativo a ON a.id = 1 AND c.versao_id = a.versao_id
+    WHERE 1 = 1{filtro}
+    """, tuple(params))
+    return cursor.fetchone()[0]
+
+
+def plan_tree_updates(exibidas, novas):
+    """Operações mínimas para levar uma Treeview das linhas `exibidas` às `novas`.
+
+    `exibidas` e `novas` são listas ordenadas de (chave, valores). Retorna a lista de operações
+    ('delete', [chaves]), ('update', chave, valores), ('move', chave, indice) e
+    ('insert', indice, chave, valores), a aplicar nessa ordem; linhas iguais não geram operação.
+    """
+    valores = dict(exibidas)
+    chaves_novas = {chave for chave, _ in novas}
+    removidas = [chave for chave, _ in exibidas if chave not in chaves_novas]
+    operacoes = [('delete', removidas)] if removidas else []
+    atual = [chave for chave, _ in exibidas if chave in chaves_novas]
+    for i, (chave, vals) in enumerate(novas):
+        if chave not in valores:
+            operacoes.append(('insert', i, chave, vals))
+            atual.insert(i, chave)
+            continue
+        if i >= len(atual) or atual[i] != chave:
+            operacoes.append(('move', chave, i))
+            atual.remove(chave)
+            atual.insert(i, chave)
+        if valores[chave] != vals:
+            operacoes.append(('update', chave, vals))
+    return operacoes
+
+
+# Linhas lidas por `fetchmany` na exportação em streaming
+EXPORT_FETCH_SIZE = int(os.environ.get('EXPORT_FETCH_SIZE', '1000'))
+# Formatos de texto de `export_schedule`; o XLSX tem função própria (`export_schedule_xlsx`)
+STREAM_EXPORT_FORMATS = ('csv', 'ndjson')
+EXPORT_FORMATS = STREAM_EXPORT_FORMATS + ('xlsx',)
+# Agrupamentos do XLSX: uma aba só, uma por turma ou uma por professor
+XLSX_SHEETS = ('unica', 'turma', 'professor')
+EXPORT_COLUNAS = ("Professor", "Matéria", "Turma", "Dia", "Início", "Fim")
+EXPORT_CHAVES = ("professor", "materia", "turma", "dia", "inicio", "fim")
+
+
+def stream_schedule_rows(connection, professor_id=None, turma_id=None, dia=None, batch_size=None, ordem='dia'):
+    """Gera as linhas (professor, matéria, turma, dia, início, fim) do cronograma ativo aos poucos.
+
+    Lê com `fetchmany(batch_size)`; no MySQL o cursor não é bufferizado, então as linhas vêm do
+    servidor conforme são consumidas e a memória não cresce com o tamanho do cronograma.
+    `ordem` segue `_schedule_select` ('turma'/'professor' agrupam as linhas para o XLSX por aba).
+    """
+    filtro, params = _schedule_filters(professor_id, turma_id, dia)
+    sqlite = getattr(connection, 'is_sqlite', False)
+    cursor = connection.cursor() if sqlite else connection.cursor(buffered=False)
+    cursor.execute(_schedule_select(filtro, ordem), tuple(params))
+    try:
+        while True:
+            lote = cursor.fetchmany(batch_size or EXPORT_FETCH_SIZE)
+            if not lote:
+                break
+            for _, dia_semana, ini, prof, mat, turma, fim in lote:
+                yield prof, mat, turma, dia_semana, format_horario(ini), format_horario(fim)
+    finally:
+        try:
+            cursor.close()
+        except Error:
+            # Exportação interrompida no meio: descarta o resto do resultado não bufferizado
+            connection.consume_results()
+
+
+def export_schedule(linhas, destino, formato='csv'):
+    """Escreve as linhas em CSV ou NDJSON à medida que chegam; retorna quantas foram escritas.
+
+    `destino` '-' é a saída padrão. Para arquivos, grava em `<destino>.tmp` e só renomeia no fim,
+    então uma exportação que falha no meio não deixa um arquivo truncado no lugar do anterior.
+    """
+    if formato not in STREAM_EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+    if destino == '-':
+        total = _write_export(linhas, sys.stdout, formato)
+        sys.stdout.flush()
+        return total
+    temporario = f"{destino}.tmp"
+    try:
+        with open(temporario, 'w', newline='', encoding='utf-8') as saida:
+            total = _write_export(linhas, saida, formato)
+    except BaseException:
+        os.remove(temporario)
+        raise
+    os.replace(temporario, destino)
+    return total
+
+
+def _write_export(linhas, saida, formato):
+    total = 0
+    if formato == 'csv':
+        writer = csv.writer(saida)
+        writer.writerow(EXPORT_COLUNAS)
+        for linha in linhas:
+            writer.writerow(linha)
+            total += 1
+    else:
+        for linha in linhas:
+            saida.write(json.dumps(dict(zip(EXPORT_CHAVES, linha)), ensure_ascii=False) + "\n")
+            total += 1
+    return total
+
+
+def xlsx_column_widths(connection):
+    """Larguras das colunas do XLSX calculadas antes de escrever qualquer linha.
+
+    No modo write-only do openpyxl as larguras vão no início da planilha, então não dá para
+    medi-las ao final. Como as colunas são nomes de professores, matérias e turmas, dias e
+    horários, o maior valor possível vem das tabelas de cadastro (poucas linhas), não do cronograma.
+    """
+    cursor = connection.cursor()
+    maiores = []
+    for tabela in ('professores', 'materias', 'turmas'):
+        cursor.execute(f"SELECT nome FROM {tabela}")
+        maiores.append(max((len(nome or "") for nome, in cursor.fetchall()), default=0))
+    dias, _, _ = load_time_grid(cursor)
+    maiores += [max((len(d) for d in dias), default=0), 8, 8]
+    # Mesma regra da versão anterior: texto mais longo (incluindo o cabeçalho) + 2, entre 12 e 40
+    return [min(max(max(len(titulo), maior) + 2, 12), 40) for titulo, maior in zip(EXPORT_COLUNAS, maiores)]
+
+
+def _xlsx_sheet_title(nome, usados):
+    """Nome de aba válido no Excel (até 31 caracteres, sem []:*?/\\) e sem repetir."""
+    base = "".join('_' if ch in '[]:*?/\\' else ch for ch in str(nome)).strip() or "Cronograma"
+    titulo, n = base[:31], 2
+    while titulo.lower() in usados:
+        sufixo = f" ({n})"
+        titulo, n = base[:31 - len(sufixo)] + sufixo, n + 1
+    usados.add(titulo.lower())
+    return titulo
+
+
+def export_schedule_xlsx(linhas, destino, abas='unica', larguras=None):
+    """Exporta para XLSX em streaming, com o `Workbook(write_only=True)` do openpyxl.
+
+    As linhas são escritas à medida que chegam, sem manter a planilha na memória. Com `abas`
+    'turma' ou 'professor' cada turma/professor ganha a sua aba numa única passada, então as
+    linhas precisam vir ordenadas por essa coluna (`stream_schedule_rows(..., ordem=abas)`).
+    `larguras` vem de `xlsx_column_widths`. Grava em `<destino>.tmp` e renomeia no fim; retorna
+    o número de linhas escritas. Levanta ImportError se o openpyxl não estiver instalado.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    if abas not in XLSX_SHEETS:
+        raise ValueError(f"Agrupamento de abas desconhecido: {abas}")
+    coluna_aba = {'turma': 2, 'professor': 0}.get(abas)
+    larguras = larguras or [12] * len(EXPORT_COLUNAS)
+    fonte = Font(bold=True, color="FFFFFF")
+    fundo = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
+    wb = Workbook(write_only=True)
+    usados = set()
+
+    def nova_aba(nome):
+        ws = wb.create_sheet(_xlsx_sheet_title(nome, usados))
+        for i, largura in enumerate(larguras, start=1):
+            ws.column_dimensions[get_column_letter(i)].width = largura
+        ws.freeze_panes = "A2"
+        cabecalho = []
+        for titulo in EXPORT_COLUNAS:
+            celula = WriteOnlyCell(ws, value=titulo)
+            celula.font = fonte
+            celula.fill = fundo
+            cabecalho.append(celula)
+        ws.append(cabecalho)
+        return ws
+
+    ws, atual, total = None, None, 0
+    for linha in linhas:
+        chave = linha[coluna_aba] if coluna_aba is not None else "Cronograma"
+        if ws is None or chave != atual:
+            ws, atual = nova_aba(chave), chave
+        ws.append(list(linha))
+        total += 1
+    if ws is None:
+        nova_aba("Cronograma")
+    temporario = f"{destino}.tmp"
+    try:
+        wb.save(temporario)
+        os.replace(temporario, destino)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    return total
+
+
+def resolve_entity_id(connection, tabela, valor):
+    """Converte o filtro da linha de comando (id numérico ou nome) no id de professor/turma."""
+    if valor is None or str(valor).isdigit():
+        return int(valor) if valor is not None else None
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT id FROM {tabela} WHERE nome = %s", (valor,))
+    ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        raise ValueError(f"'{valor}' não encontrado em {tabela}")
+    if len(ids) > 1:
+        raise ValueError(f"'{valor}' é ambíguo em {tabela} (ids {', '.join(map(str, ids))}); use o id")
+    return ids[0]
+
+
+class ScheduleRepository:
+    """Leituras do cronograma ativo com cache invalidado por um contador de geração.
+
+    Tabela, listagem, exportações e console leem daqui; o resultado de cada consulta fica guardado
+    junto com a geração em que foi lido e é reaproveitado até `invalidate()`, chamado depois de
+    qualquer escrita (geração, cadastro, edição, exclusão, rollback de versão). Escritas feitas
+    por fora (outro processo ou usuário) só aparecem depois de um `invalidate()`.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.geracao = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.geracao += 1
+            self._cache.clear()
+
+    def _cached(self, chave, carregar):
+        with self._lock:
+            geracao = self.geracao
+            if chave in self._cache:
+                self.hits += 1
+                return self._cache[chave]
+            self.misses += 1
+        valor = carregar()
+        with self._lock:
+            # Se houve invalidação durante a leitura, o valor já nasce velho e não é guardado
+            if geracao == self.geracao:
+                self._cache[chave] = valor
+        return valor
+
+    def rows(self, ordem='dia'):
+        return self._cached(('rows', ordem), lambda: load_schedule_rows(self.connection, ordem))
+
+    def page(self, professor_id=None, turma_id=None, dia=None, limit=None, offset=0):
+        return self._cached(('page', professor_id, turma_id, dia, limit, offset),
+                            lambda: load_schedule_page(self.connection, professor_id, turma_id, dia, limit, offset))
+
+    def count(self, professor_id=None, turma_id=None, dia=None):
+        return self._cached(('count', professor_id, turma_id, dia),
+                            lambda: count_schedule_rows(self.connection, professor_id, turma_id, dia))
+
+    def shortfall(self):
+        return self._cached(('shortfall',), lambda: load_shortfall(self.connection))
+
+    def metrics(self):
+        """Acertos e faltas do cache, para acompanhar a carga poupada ao banco."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'geracao': self.geracao,
+                'hits': self.hits,
+                'misses': self.misses,
+                'taxa_acerto': round(self.hits / total, 3) if total else 0.0,
+                'entradas': len(self._cache),
+            }
+
+
+def prune_schedule_versions(connection, retention=None):
+    """Remove versões antigas, mantendo a ativa e as `retention` usadas mais recentemente.
+
+    As versões guardadas são também o cache de `reuse_cached_schedule`, por isso a ordem é LRU:
+    `usado_em` (gravação ou último reaproveitamento) e, no empate, o id.
+    """
+    retention = SCHEDULE_RETENTION if retention is None else retention
+    ativa = active_schedule_version(connection)
+    cursor = connection.cursor()
+    cursor.execute("SELECT id FROM cronograma_versoes ORDER BY COALESCE(usado_em, criado_em) DESC, id DESC")
+    antigas = [vid for vid, in cursor.fetchall()[retention:] if vid != ativa]
+    if not antigas:
+        return 0
+    _delete_schedule_versions(cursor, antigas)
+    connection.commit()
+    logging.info(f"Versões de cronograma removidas pela retenção: {antigas}")
+    return len(antigas)
+
+
+def _delete_schedule_versions(cursor, versoes):
+    for vid in versoes:
+        cursor.execute("DELETE FROM cronogramas WHERE versao_id = %s", (vid,))
+        cursor.execute("DELETE FROM cronograma_faltas WHERE versao_id = %s", (vid,))
+        cursor.execute("DELETE FROM cronograma_versoes WHERE id = %s", (vid,))
+
+
+# Para cada cadastro: coluna em `cronogramas` e tabelas dependentes limpas junto com o registro
+ENTIDADES = {
+    'professores': ('professor_id', (('professor_disponibilidade', 'professor_id'),
+                                     ('professor_preferencias', 'professor_id'))),
+    'materias': ('materia_id', (('professor_preferencias', 'materia_id'), ('cronograma_faltas', 'materia_id'))),
+    'turmas': ('turma_id', (('turma_disponibilidade', 'turma_id'), ('cronograma_faltas', 'turma_id'))),
+}
+
+
+def delete_entity(connection, tabela, entity_id):
+    """Exclui um professor, matéria ou turma e as versões guardadas do cronograma que o usam.
+
+    As linhas de versões antigas continuam em `cronogramas` e, no MySQL, a FK sem ON DELETE
+    CASCADE recusaria a exclusão; essas versões deixam de ser válidas sem o registro e são
+    removidas na mesma transação. Se o cronograma ativo usa o registro, levanta ValueError e nada
+    muda: é preciso gerar um cronograma sem ele antes. Retorna as versões removidas.
+    """
+    coluna, dependentes = ENTIDADES[tabela]
+    ativa = active_schedule_version(connection)
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT DISTINCT versao_id FROM cronogramas WHERE {coluna} = %s", (entity_id,))
+    versoes = sorted(vid for vid, in cursor.fetchall())
+    if ativa in versoes:
+        raise ValueError(f"O registro está no cronograma ativo (versão {ativa}); "
+                         f"gere um novo cronograma sem ele antes de excluir.")
+    begin_transaction(connection)
+    try:
+        _delete_schedule_versions(cursor, versoes)
+        for dependente, coluna_dependente in dependentes:
+            cursor.execute(f"DELETE FROM {dependente} WHERE {coluna_dependente} = %s", (entity_id,))
+        cursor.execute(f"DELETE FROM {tabela} WHERE id = %s", (entity_id,))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    if versoes:
+        logging.info(f"Versões de cronograma removidas junto com {tabela} {entity_id}: {versoes}")
+    return versoes
+
+
+def capacity_problems(professores, materias, turmas, dias_semana, n_slots):
+    """Limites de capacidade óbvios, calculados com popcount das máscaras de horários."""
+    carga_turma = sum(m[2] for m in materias if m[2] > 0)
+    uniao_professores = 0
+    for p in professores:
+        uniao_professores |= p[2]
+    falhas = []
+    uniao_turmas = 0
+    for t in turmas:
+        mask = turma_mask(t, dias_semana, n_slots)
+        uniao_turmas |= mask
+        capacidade = (mask & uniao_professores).bit_count()
+        if carga_turma > capacidade:
+            falhas.append(f"Turma {t[1]}: carga horária ({carga_turma}) excede os horários com professor disponível ({capacidade})")
+    horas_professores = sum((p[2] & uniao_turmas).bit_count() for p in professores)
+    if carga_turma * len(turmas) > horas_professores:
+        falhas.append(f"Carga horária total ({carga_turma * len(turmas)}) excede as horas disponíveis dos "
+                      f"professores ({horas_professores})")
+    return falhas
+
+
+def _max_flow(n_nos, arestas, origem, destino):
+    """Fluxo máximo (Dinic) num grafo pequeno dado por arestas (u, v, capacidade).
+
+    Retorna (fluxo, alcancaveis): `alcancaveis` é o conjunto de nós ainda alcançáveis a partir da
+    origem no grafo residual, isto é, o lado da origem de um corte mínimo.
+    """
+    grafo = [[] for _ in range(n_nos)]
+    para, cap = [], []
+    for u, v, c in arestas:
+        grafo[u].append(len(para))
+        para.append(v)
+        cap.append(c)
+        grafo[v].append(len(para))
+        para.append(u)
+        cap.append(0)
+
+    def niveis_bfs():
+        nivel = [-1] * n_nos
+        nivel[origem] = 0
+        fila = deque([origem])
+        while fila:
+            u = fila.popleft()
+            for e in grafo[u]:
+                if cap[e] > 0 and nivel[para[e]] < 0:
+                    nivel[para[e]] = nivel[u] + 1
+                    fila.append(para[e])
+        return nivel
+
+    def empurrar(u, limite, nivel, proximo):
+        # DFS do caminho aumentante no grafo de níveis; `proximo` guarda a aresta da vez de cada nó
+        if u == destino:
+            return limite
+        while proximo[u] < len(grafo[u]):
+            e = grafo[u][proximo[u]]
+            v = para[e]
+            if cap[e] > 0 and nivel[v] == nivel[u] + 1:
+                enviado = empurrar(v, min(limite, cap[e]), nivel, proximo)
+                if enviado:
+                    cap[e] -= enviado
+                    cap[e ^ 1] += enviado
+                    return enviado
+            proximo[u] += 1
+        return 0
+
+    fluxo = 0
+    nivel = niveis_bfs()
+    while nivel[destino] >= 0:
+        proximo = [0] * n_nos
+        enviado = empurrar(origem, float('inf'), nivel, proximo)
+        while enviado:
+            fluxo += enviado
+            enviado = empurrar(origem, float('inf'), nivel, proximo)
+        nivel = niveis_bfs()
+    return fluxo, {u for u, lv in enumerate(nivel) if lv >= 0}
+
+
+def feasibility_problems(professores, materias, turmas, dias_semana, n_slots):
+    """Análise de viabilidade antes de montar o modelo; retorna mensagens (vazia se há solução).
+
+    Qualquer professor pode dar qualquer matéria, então o problema é viável exatamente quando o
+    fluxo origem -> turma (carga total) -> horário da turma (1) -> horário (nº de professores
+    disponíveis) -> destino satura todas as turmas. Antes do fluxo roda `capacity_problems`, que
+    aponta direto a turma sem horários suficientes. Se o fluxo não satura, o corte mínimo dá o
+    conjunto de turmas que viola a condição de Hall e os dias/professores que faltam.
+    """
+    falhas = capacity_problems(professores, materias, turmas, dias_semana, n_slots)
+    if falhas:
+        return falhas
+    carga_turma = sum(m[2] for m in materias if m[2] > 0)
+    if carga_turma == 0 or not turmas:
+        return []
+
+    mascaras_turma = [turma_mask(t, dias_semana, n_slots) for t in turmas]
+    uniao_turmas = 0
+    for mask in mascaras_turma:
+        uniao_turmas |= mask
+    bits = [b for b in range(len(dias_semana) * n_slots) if uniao_turmas >> b & 1]
+    professores_no_bit = {b: [p for p in professores if p[2] >> b & 1] for b in bits}
+    bits = [b for b in bits if professores_no_bit[b]]
+
+    # Nós: 0 = origem, 1..T = turmas, T+1..T+B = horários, T+B+1 = destino
+    n_turmas = len(turmas)
+    no_bit = {b: n_turmas + 1 + i for i, b in enumerate(bits)}
+    destino = n_turmas + len(bits) + 1
+    arestas = [(0, i + 1, carga_turma) for i in range(n_turmas)]
+    arestas += [(i + 1, no_bit[b], 1) for i, mask in enumerate(mascaras_turma) for b in bits if mask >> b & 1]
+    arestas += [(no_bit[b], destino, len(professores_no_bit[b])) for b in bits]
+    fluxo, alcancaveis = _max_flow(destino + 1, arestas, 0, destino)
+    demanda = carga_turma * n_turmas
+    if fluxo == demanda:
+        return []
+
+    curtas = [t for i, t in enumerate(turmas) if i + 1 in alcancaveis]
+    gargalo = [b for b in bits if no_bit[b] in alcancaveis]
+    falta = demanda - fluxo
+    falhas.append(f"Turmas {', '.join(t[1] for t in curtas)}: precisam de {carga_turma * len(curtas)} aulas, "
+                  f"mas os professores disponíveis nos horários delas só cobrem {carga_turma * len(curtas) - falta} "
+                  f"(faltam {falta})")
+    for d_idx, dia in enumerate(dias_semana):
+        do_dia = [b for b in gargalo if b // n_slots == d_idx]
+        if not do_dia:
+            continue
+        nomes = sorted({p[1] for b in do_dia for p in professores_no_bit[b]})
+        falhas.append(f"  {dia}: {len(do_dia)} horário(s) disputados, {sum(len(professores_no_bit[b]) for b in do_dia)} "
+                      f"professor-horário(s) livres ({', '.join(nomes)})")
+    return falhas
+
+
+def load_schedule_inputs(cursor):
+    """Carrega matérias, grade, turmas e professores no formato usado pelo solver."""
+    cursor.execute("SELECT id, nome, carga_horaria FROM materias")
+    materias = cursor.fetchall()
+    dias_semana, horarios, grade_mask = load_time_grid(cursor)
+    turmas = load_turmas(cursor, dias_semana, horarios, grade_mask)
+    professores = load_professores(cursor, materias, dias_semana, horarios, grade_mask)
+    return materias, dias_semana, horarios, grade_mask, turmas, professores
+
+
+def check_feasibility(connection):
+    """Roda a análise de viabilidade sobre os dados do banco (`--check`); retorna as mensagens."""
+    materias, dias_semana, horarios, _, turmas, professores = load_schedule_inputs(connection.cursor())
+    return feasibility_problems(professores, materias, turmas, dias_semana, len(horarios))
+
+
+def validate_assignments(atribuicoes, professores, turmas, dias_semana, n_slots):
+    """Validação pós-solução em memória com operações de bits: cada aula cai num horário permitido
+    ao professor e à turma, e nenhum professor ou turma tem duas aulas no mesmo bit."""
+    d_idx = {d: i for i, d in enumerate(dias_semana)}
+    disp_prof = {p[0]: p[2] for p in professores}
+    disp_turma = {t[0]: turma_mask(t, dias_semana, n_slots) for t in turmas}
+    ocupado_prof = {}
+    ocupado_turma = {}
+    problemas = []
+    for p_id, m_id, t_id, d, s in atribuicoes:
+        bit = slot_bit(d_idx[d], s, n_slots)
+        if not disp_prof.get(p_id, 0) & bit:
+            problemas.append(f"Professor {p_id} indisponível em {d} slot {s}")
+        if not disp_turma.get(t_id, 0) & bit:
+            problemas.append(f"Turma {t_id} sem aula permitida em {d} slot {s}")
+        if ocupado_prof.get(p_id, 0) & bit:
+            problemas.append(f"Professor {p_id} com duas aulas em {d} slot {s}")
+        if ocupado_turma.get(t_id, 0) & bit:
+            problemas.append(f"Turma {t_id} com duas aulas em {d} slot {s}")
+        ocupado_prof[p_id] = ocupado_prof.get(p_id, 0) | bit
+        ocupado_turma[t_id] = ocupado_turma.get(t_id, 0) | bit
+    return problemas
+
+
+# Função para otimizar o cronograma usando PuLP
+@dataclass
+class ScheduleResult:
+    """Resultado de `optimize_schedule`; verdadeiro quando um cronograma foi gravado.
+
+    `tempos` tem a duração de cada fase em segundos: carga_dados, cache, viabilidade, warm_start,
+    resolucao (relógio de `solve_components`), montagem e solver (somados entre os componentes,
+    que podem rodar em paralelo e passar da resolução), validacao, gravacao e total. `status` é o
+    do solver ('Optimal', 'Feasible', ...), Cached quando uma versão guardada com a mesma
+    `impressao` foi reativada sem resolver, ou NoData / Infeasible / Invalid / PersistError.
+    """
+    ok: bool = False
+    status: str = 'Not Solved'
+    versao_id: Optional[int] = None
+    aulas: int = 0
+    faltas: int = 0  # aulas não alocadas (modo elástico)
+    componentes: int = 0
+    variaveis: int = 0
+    restricoes: int = 0
+    nao_nulos: int = 0  # coeficientes não nulos nas restrições
+    objetivo: Optional[float] = None
+    impressao: Optional[str] = None  # ver schedule_fingerprint
+    tempos: dict = field(default_factory=dict)
+    perfis: list = field(default_factory=list)  # arquivos gravados por --profile
+    erro: Optional[str] = None
+    concluido_em: Optional[float] = None  # time.time()
+
+    def __bool__(self):
+        return self.ok
+
+    def to_dict(self):
+        return asdict(self)
+
+
+@contextmanager
+def _phase_timer(tempos, fase):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tempos[fase] = tempos.get(fase, 0.0) + time.perf_counter() - inicio
+
+
+def optimize_schedule(connection, max_workers=None, solver_options=None, progress=None, notify=None):
+    """Gera e grava um novo cronograma; retorna um `ScheduleResult` (verdadeiro em caso de sucesso).
+
+    `progress(etapa)` recebe a descrição de cada etapa (usado pela barra de progresso da GUI) e
+    `notify(titulo, mensagem, tipo)` substitui `show_message` quando a geração roda fora da
+    thread do Tk, como em `_generation_worker`. Se dados e opções não mudaram desde uma versão
+    guardada, ela volta a ser a ativa sem montar o modelo (a menos que `force_solve`).
+    """
+    notify = notify or show_message
+    progress = progress or (lambda etapa: None)
+    resultado = ScheduleResult()
+    tempos = resultado.tempos
+    inicio_total = time.perf_counter()
+
+    def concluir(status, ok=False, erro=None):
+        resultado.status, resultado.ok, resultado.erro = status, ok, erro
+        resultado.concluido_em = time.time()
+        tempos['total'] = time.perf_counter() - inicio_total
+        logging.info(f"Geração {status}: " + ", ".join(f"{fase}={valor * 1000:.1f}ms" for fase, valor in tempos.items()))
+        return resultado
+
+    cursor = connection.cursor()
+    progress("Carregando dados")
+    vazio = None
+    with _phase_timer(tempos, 'carga_dados'):
+        # Verificar se há dados suficientes
+        for tabela, mensagem in (('professores', "Nenhum professor cadastrado!"),
+                                 ('materias', "Nenhuma matéria cadastrada!"),
+                                 ('turmas', "Nenhuma turma cadastrada!")):
+            cursor.execute(f"SELECT COUNT(*) FROM {tabela}")
+            if cursor.fetchone()[0] == 0:
+                vazio = mensagem
+                break
+        else:
+            materias, dias_semana, horarios, grade_mask, turmas, professores = load_schedule_inputs(cursor)
+    if vazio:
+        notify("Erro", vazio, "error")
+        return concluir('NoData', erro=vazio)
+    solver_options = solver_options or SolverOptions.from_env()
+    logging.info(f"Grade horária: {len(dias_semana)} dias x {len(horarios)} horários ({grade_mask.bit_count()} slots)")
+
+    with _phase_timer(tempos, 'cache'):
+        resultado.impressao = schedule_fingerprint(materias, dias_semana, horarios, grade_mask, turmas, professores,
+                                                   solver_options)
+        em_cache = None if solver_options.force_solve else reuse_cached_schedule(connection, resultado.impressao)
+    if em_cache:
+        resultado.versao_id, resultado.aulas, resultado.faltas = em_cache
+        logging.info(f"Dados e opções iguais aos da versão {resultado.versao_id}; cronograma reaproveitado "
+                     f"sem resolver (use --force-solve para gerar de novo)")
+        notify("Sucesso", f"Nada mudou desde a última geração: versão {resultado.versao_id} reativada.", "info")
+        return concluir('Cached', ok=True)
+
+    progress("Analisando viabilidade")
+    # Dados inviáveis são recusados aqui, em milissegundos, em vez de deixar o CBC procurar à toa
+    with _phase_timer(tempos, 'viabilidade'):
+        falhas = feasibility_problems(professores, materias, turmas, dias_semana, len(horarios))
+    logging.info(f"Análise de viabilidade: {tempos['viabilidade'] * 1000:.1f}ms")
+    if falhas and solver_options.elastic:
+        logging.warning("Dados inviáveis; o modo elástico vai gravar um cronograma parcial:\n" + "\n".join(falhas))
+    elif falhas:
+        logging.error("Dados inviáveis:\n" + "\n".join(falhas))
+        notify("Erro", "Não há cronograma possível com os dados atuais:\n" + "\n".join(falhas), "error")
+        return concluir('Infeasible', erro="\n".join(falhas))
+
+    componentes = find_components(professores, turmas, dias_semana, len(horarios))
+    resultado.componentes = len(componentes)
+    logging.info(f"Problema decomposto em {len(componentes)} componente(s) independente(s)")
+    warm_start = None
+    if solver_options.warm_start:
+        with _phase_timer(tempos, 'warm_start'):
+            warm_start = load_warm_start(cursor, horarios)
+    if warm_start is not None:
+        logging.info(f"Warm start: {len(warm_start)} atribuições do cronograma atual")
+    progress(f"Resolvendo {len(componentes)} componente(s)")
+    with _phase_timer(tempos, 'resolucao'):
+        resultados = solve_components(componentes, materias, dias_semana, horarios,
+                                      max_workers=max_workers, solver_options=solver_options,
+                                      warm_start=warm_start, progress=progress)
+
+    assignments = []
+    faltas = []
+    tempos['montagem'] = tempos['solver'] = 0.0
+    for i, (status, atribuicoes, stats) in enumerate(resultados):
+        if solver_options.engine == 'heuristic':
+            logging.info(f"Componente {i + 1}: heurística, custo {stats['objetivo']} "
+                         f"(construção: {stats['custo_inicial']}), status {status}")
+        else:
+            logging.info(
+                f"Componente {i + 1}: {stats['variaveis']} variáveis (denso: {stats['variaveis_densas']}), "
+                f"{stats['restricoes']} restrições (denso: {stats['restricoes_densas']}), "
+                f"{stats.get('nao_nulos', 0)} não nulos, status {status}"
+            )
+        logging.info("Tempos de montagem: " + ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in stats['tempos'].items()))
+        resultado.variaveis += stats['variaveis']
+        resultado.restricoes += stats['restricoes']
+        resultado.nao_nulos += stats.get('nao_nulos', 0)
+        tempos['montagem'] += stats.get('tempo_montagem', 0.0)
+        tempos['solver'] += stats.get('tempo_solver', 0.0)
+        resultado.perfis.extend(stats.get('perfis', ()))
+        if stats.get('objetivo') is not None:
+            resultado.objetivo = (resultado.objetivo or 0) + stats['objetivo']
+        if stats['demandas_sem_professor'] and not solver_options.elastic:
+            logging.error(f"Demandas sem professor disponível: {stats['demandas_sem_professor']}")
+        if status == 'Feasible':
+            # Na heurística 'Feasible' é o status normal de sucesso (não há prova de otimalidade)
+            if solver_options.engine != 'heuristic':
+                logging.warning("Limite do solver atingido; usando a melhor solução viável encontrada")
+        elif status != 'Optimal':
+            logging.error(f"Solver status: {status}")
+            notify("Erro", "Não foi possível gerar um cronograma. Verifique os dados inseridos!", "error")
+            return concluir(status, erro=f"Componente {i + 1}: {status}")
+        assignments.extend(atribuicoes)
+        faltas.extend(stats['faltas'])
+    status = 'Feasible' if any(r[0] == 'Feasible' for r in resultados) else 'Optimal'
+
+    with _phase_timer(tempos, 'validacao'):
+        problemas = validate_assignments(assignments, professores, turmas, dias_semana, len(horarios))
+    if problemas:
+        msg = "Cronograma inválido:\n" + "\n".join(problemas[:20])
+        logging.error(msg)
+        notify("Erro", msg, "error")
+        return concluir('Invalid', erro=msg)
+
+    progress("Gravando cronograma")
+    try:
+        with _phase_timer(tempos, 'gravacao'):
+            versao_id = persist_schedule(connection, assignments, horarios, faltas=faltas,
+                                         impressao=resultado.impressao)
+    except Exception as e:
+        logging.error(f"Erro ao gravar cronograma: {e}")
+        notify("Erro", f"Falha ao gravar o cronograma: {e}", "error")
+        return concluir('PersistError', erro=str(e))
+    resultado.versao_id = versao_id
+    resultado.aulas = len(assignments)
+    resultado.faltas = sum(f[2] for f in faltas)
+    logging.info(f"{len(assignments)} aulas gravadas na versão {versao_id} (ativa)")
+    if faltas:
+        nomes_m = {m[0]: m[1] for m in materias}
+        nomes_t = {t[0]: t[1] for t in turmas}
+        relatorio = "\n".join(f"{nomes_t[t_id]} / {nomes_m[m_id]}: faltam {qtd} aula(s)"
+                               for m_id, t_id, qtd in sorted(faltas, key=lambda f: (nomes_t[f[1]], nomes_m[f[0]])))
+        logging.warning(f"Cronograma parcial: {resultado.faltas} aula(s) sem horário\n{relatorio}")
+        notify("Aviso", f"Cronograma parcial gravado. Aulas não alocadas:\n{relatorio}", "warning")
+        return concluir(status, ok=True)
+    notify("Sucesso", "Cronograma gerado com sucesso!", "info")
+    logging.info("Cronograma gerado e salvo no banco")
+    return concluir(status, ok=True)
+
+
+def verify_schedule(connection, versao_id=None):
+    """Procura aulas em conflito (mesmo slot de turma ou de professor) numa versão do cronograma.
+
+    Com os índices UNIQUE de `cronogramas` o banco já recusa esses conflitos na gravação, então esta
+    varredura saiu do caminho de `optimize_schedule`; serve para auditar bancos antigos (`--verify`).
+    Retorna a lista de mensagens de conflito (vazia quando está tudo certo).
+    """
+    versao_id = versao_id if versao_id is not None else active_schedule_version(connection)
+    cursor = connection.cursor()
+    conflitos = []
+    for coluna, rotulo in (('turma_id', 'Turma'), ('professor_id', 'Professor')):
+        cursor.execute(f"""
+        SELECT {coluna}, dia_semana, horario_inicio, COUNT(*) as cnt
+        FROM cronogramas
+        WHERE versao_id = %s
+        GROUP BY {coluna}, dia_semana, horario_inicio
+        HAVING cnt > 1
+        """, (versao_id,))
+        for entidade, dia, inicio, cnt in cursor.fetchall():
+            conflitos.append(f"{rotulo} {entidade} {dia} {format_horario(inicio)} -> {cnt} atribuições")
+    return conflitos
+
+# Arquivo de métricas Prometheus regravado a cada geração (ex.: textfile collector do node_exporter)
+METRICS_FILE = os.environ.get('SCHEDULE_METRICS_FILE', '').strip()
+
+
+def _prometheus_escape(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_lines(nome, tipo, ajuda, amostras):
+    """Uma métrica no formato texto do Prometheus; `amostras` é [(rótulos, valor)]."""
+    linhas = [f"# HELP school_schedule_{nome} {ajuda}", f"# TYPE school_schedule_{nome} {tipo}"]
+    for rotulos, valor in amostras:
+        texto = ",".join(f'{chave}="{_prometheus_escape(v)}"' for chave, v in rotulos.items())
+        linhas.append(f"school_schedule_{nome}{{{texto}}} {valor}" if texto else f"school_schedule_{nome} {valor}")
+    return linhas
+
+
+def prometheus_metrics(resultado):
+    """Métricas da última geração (`ScheduleResult`) no formato texto do Prometheus."""
+    linhas = []
+    linhas += prometheus_lines('last_success', 'gauge', "1 se a última geração gravou um cronograma",
+                               [({}, int(resultado.ok))])
+    linhas += prometheus_lines('last_status', 'gauge', "Status da última geração (solver ou motivo da recusa)",
+                               [({'status': resultado.status}, 1)])
+    linhas += prometheus_lines('last_phase_seconds', 'gauge', "Duração de cada fase da última geração",
+                               [({'phase': fase}, f"{valor:.6f}") for fase, valor in resultado.tempos.items()])
+    for nome, ajuda, valor in (
+            ('last_components', "Componentes independentes resolvidos", resultado.componentes),
+            ('last_model_variables', "Variáveis do modelo (soma dos componentes)", resultado.variaveis),
+            ('last_model_constraints', "Restrições do modelo (soma dos componentes)", resultado.restricoes),
+            ('last_model_nonzeros', "Coeficientes não nulos nas restrições", resultado.nao_nulos),
+            ('last_lessons', "Aulas gravadas", resultado.aulas),
+            ('last_shortfall_lessons', "Aulas não alocadas (modo elástico)", resultado.faltas)):
+        linhas += prometheus_lines(nome, 'gauge', ajuda, [({}, valor)])
+    if resultado.objetivo is not None:
+        linhas += prometheus_lines('last_objective', 'gauge', "Valor da função objetivo (preferências e penalidade das faltas)",
+                                   [({}, resultado.objetivo)])
+    if resultado.concluido_em is not None:
+        linhas += prometheus_lines('last_run_timestamp_seconds', 'gauge', "Fim da última geração (epoch)",
+                                   [({}, f"{resultado.concluido_em:.3f}")])
+    return "\n".join(linhas) + "\n"
+
+
+def write_metrics_file(caminho, texto):
+    """Grava as métricas em `caminho` via arquivo temporário + rename, para o coletor nunca ler pela metade."""
+    temporario = f"{caminho}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        f.write(texto)
+    os.replace(temporario, caminho)
+
+
+def _run_generation(fila, solver_options, sqlite_path=None):
+    """Abre a própria conexão, gera o cronograma e publica ('progresso', etapa) e
+    ('mensagem', titulo, texto, tipo) na fila; retorna o `ScheduleResult`."""
+    try:
+        with db_connection(sqlite_path) as conn:
+            return optimize_schedule(conn, solver_options=solver_options,
+                                     progress=lambda etapa: fila.put(('progresso', etapa)),
+                                     notify=lambda titulo, texto, tipo="info": fila.put(('mensagem', titulo, texto, tipo)))
+    except Exception as e:
+        logging.exception("Falha na geração do cronograma")
+        fila.put(('mensagem', "Erro", f"Falha na geração do cronograma: {e}", "error"))
+        return ScheduleResult(status='Error', erro=str(e), concluido_em=time.time())
+
+
+def _generation_worker(fila, solver_options, sqlite_path=None):
+    """Processo de `GenerationJob`: gera o cronograma e termina com ('fim', ok) na fila."""
+    if hasattr(os, 'setpgrp'):
+        # CBC e o pool de componentes herdam o grupo, então o cancelamento encerra todos juntos
+        os.setpgrp()
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    ok = False
+    try:
+        ok = bool(_run_generation(fila, solver_options, sqlite_path))
+    finally:
+        fila.put(('fim', ok))
+
+
+class GenerationJob:
+    """Geração de cronograma num processo separado, para não travar a GUI.
+
+    O processo abre a sua própria conexão (SQLite em `sqlite_path` ou `create_connection`) e envia
+    eventos pela fila: ('progresso', etapa), ('mensagem', titulo, texto, tipo) e ('fim', ok).
+    `poll()` é chamado pelo `root.after` da GUI e nunca bloqueia; `cancel()` encerra o processo e o
+    CBC. Como a gravação é uma única transação, cancelar no meio não deixa versão pela metade.
+    """
+
+    def __init__(self, solver_options=None, sqlite_path=None):
+        self.solver_options = solver_options or SolverOptions.from_env()
+        self.sqlite_path = sqlite_path
+        self.resultado = None  # None enquanto roda; depois True/False
+        self.cancelado = False
+        self.etapa = "Iniciando"
+        self.inicio = None
+        self._fila = None
+        self._processo = None
+
+    def start(self):
+        contexto = multiprocessing.get_context('spawn')
+        self._fila = contexto.Queue()
+        self._processo = contexto.Process(target=_generation_worker, name='gerar-cronograma',
+                                          args=(self._fila, self.solver_options, self.sqlite_path))
+        self.inicio = time.monotonic()
+        self._processo.start()
+        return self
+
+    @property
+    def running(self):
+        return self.resultado is None
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.inicio if self.inicio is not None else 0.0
+
+    def poll(self):
+        """Eventos recebidos desde a última chamada; detecta também o fim inesperado do processo."""
+        eventos = []
+        while True:
+            try:
+                evento = self._fila.get_nowait()
+            except queue.Empty:
+                break
+            eventos.append(evento)
+            if evento[0] == 'progresso':
+                self.etapa = evento[1]
+            elif evento[0] == 'fim':
+                self.resultado = evento[1]
+        if self.resultado is not None:
+            self._processo.join(timeout=1)
+        elif not self._processo.is_alive():
+            self.resultado = False
+            eventos.append(('mensagem', "Erro", (f"O processo de geração terminou inesperadamente "
+                                                 f"(código {self._processo.exitcode})."), "error"))
+        return eventos
+
+    def cancel(self, timeout=5):
+        """Encerra a geração (SIGTERM ao grupo do processo, incluindo o CBC; SIGKILL se não sair)."""
+        if not self.running:
+            return
+        self.cancelado = True
+        self.resultado = False
+        try:
+            os.killpg(self._processo.pid, signal.SIGTERM)
+        except (AttributeError, OSError):
+            self._processo.terminate()
+        self._processo.join(timeout)
+        if self._processo.is_alive():
+            self._processo.kill()
+            self._processo.join()
+        logging.info(f"Geração de cronograma cancelada após {self.elapsed:.1f}s")
+
+
+# Intervalo de atualização da barra de progresso da GUI durante a geração (ms)
+GENERATION_POLL_MS = 200
 
-# Função para criar a conexão com o banco de dados
-def create_connection():
-    connection = None
-    try:
-        connection = mysql.connector.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            passwd=DB_PASSWORD,
-            database=DB_NAME
-        )
-        logging.info("Conexão com MySQL DB bem-sucedida")
-    except Error as e:
-        logging.error(f"Erro ao conectar ao MySQL DB: '{e}'")
-        # Fallback para um banco SQLite em memória quando o MySQL não está disponível (útil para testes/CI)
+# Modo serviço (--serve): API HTTP/JSON para o Deployment do Kubernetes
+SERVE_HOST = os.environ.get('SERVE_HOST', '0.0.0.0')
+SERVE_PORT = int(os.environ.get('SERVE_PORT', '8080'))
+# Gerações simultâneas (processos do pool); cada uma já paraleliza os componentes por conta própria
+SERVE_SOLVE_WORKERS = int(os.environ.get('SERVE_SOLVE_WORKERS', '1'))
+# Jobs terminados guardados para consulta em /jobs; os mais antigos saem primeiro
+SERVE_JOB_HISTORY = int(os.environ.get('SERVE_JOB_HISTORY', '100'))
+SERVE_READ_TIMEOUT = 10  # segundos para o cliente enviar a requisição
+SERVE_MAX_BODY = 64 * 1024
+
+# Campos de SolverOptions que um POST /jobs pode sobrescrever, com o tipo esperado
+SERVE_JOB_OPTIONS = {
+    'time_limit': float, 'gap_rel': float, 'threads': int, 'heuristic_time': float,
+    'warm_start': bool, 'elastic': bool, 'formulation': str, 'engine': str, 'force_solve': bool,
+}
+
+
+def parse_job_options(dados, base):
+    """Valida o corpo de POST /jobs e retorna uma cópia de `base` com as opções pedidas.
+
+    Levanta ValueError para campos desconhecidos, tipos errados ou valores fora de
+    FORMULATIONS/ENGINES; `null` volta o limite numérico para o padrão do solver.
+    """
+    if not isinstance(dados, dict):
+        raise ValueError("O corpo deve ser um objeto JSON")
+    desconhecidos = sorted(set(dados) - set(SERVE_JOB_OPTIONS))
+    if desconhecidos:
+        raise ValueError(f"Opções desconhecidas: {', '.join(desconhecidos)}")
+    valores = {}
+    for nome, valor in dados.items():
+        tipo = SERVE_JOB_OPTIONS[nome]
+        if tipo in (int, float) and valor is None and nome != 'heuristic_time':
+            valores[nome] = None
+        elif tipo is bool and isinstance(valor, bool) or tipo is str and isinstance(valor, str):
+            valores[nome] = valor
+        elif tipo in (int, float) and isinstance(valor, (int, float)) and not isinstance(valor, bool) \
+                and (tipo is float or float(valor).is_integer()) and valor >= 0:
+            valores[nome] = tipo(valor)
+        else:
+            raise ValueError(f"Valor inválido para {nome}: {valor!r}")
+    if valores.get('formulation', base.formulation) not in FORMULATIONS:
+        raise ValueError(f"formulation deve ser uma de: {', '.join(FORMULATIONS)}")
+    if valores.get('engine', base.engine) not in ENGINES:
+        raise ValueError(f"engine deve ser uma de: {', '.join(ENGINES)}")
+    return replace(base, **valores)
+
+
+def load_entities(connection):
+    """Professores, matérias e turmas como dicionários prontos para JSON."""
+    cursor = connection.cursor()
+    materias, dias_semana, horarios, grade_mask, turmas, professores = load_schedule_inputs(cursor)
+    cursor.execute("SELECT id, ano FROM turmas")
+    anos = dict(cursor.fetchall())
+    return {
+        'professores': [{'id': p_id, 'nome': nome,
+                         'disponibilidade': format_disponibilidade(mask, dias_semana, horarios, grade_mask),
+                         'preferencias': format_preferencias(prefs, materias)}
+                        for p_id, nome, mask, prefs in professores],
+        'materias': [{'id': m_id, 'nome': nome, 'carga_horaria': carga} for m_id, nome, carga in materias],
+        'turmas': [{'id': t_id, 'nome': nome, 'ano': anos.get(t_id),
+                    'disponibilidade': format_disponibilidade(mask, dias_semana, horarios, grade_mask)}
+                   for t_id, nome, mask in turmas],
+    }
+
+
+def _with_connection(sqlite_path, funcao, *args):
+    """Roda `funcao(conexao, *args)` numa conexão própria (SQLite em `sqlite_path` ou do pool)."""
+    with db_connection(sqlite_path) as conn:
+        return funcao(conn, *args)
+
+
+def _drain_events(fila):
+    eventos = []
+    while True:
         try:
-            sqlite_conn = sqlite3.connect(':memory:')
-            # opcional: retornar linhas como tuplas/objetos compatíveis
-            sqlite_conn.row_factory = None
+            eventos.append(fila.get_nowait())
+        except queue.Empty:
+            return eventos
 
-            class SQLiteCursorAdapter:
-                def __init__(self, cur):
-                    self._cur = cur
 
-                def execute(self, sql, params=None):
-                    if params is None:
-                        return self._cur.execute(sql)
-                    # traduzir placeholders MySQL (%s) para qmark do sqlite (?)
-                    q = sql.replace('%s', '?')
-                    return self._cur.execute(q, params)
+def _serve_worker_init():
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 
-                def executemany(self, sql, seq_of_params):
-                    q = sql.replace('%s', '?')
-                    return self._cur.executemany(q, seq_of_params)
 
-                def fetchone(self):
-                    return self._cur.fetchone()
+class SolveJob:
+    """Pedido de geração na fila do modo serviço: pendente -> executando -> concluido | falhou."""
 
-                def fetchall(self):
-                    return self._cur.fetchall()
+    def __init__(self, job_id, solver_options):
+        self.id = job_id
+        self.solver_options = solver_options
+        self.chave = json.dumps(asdict(solver_options), sort_keys=True)
+        self.status = 'pendente'
+        self.etapa = "Na fila"
+        self.pedidos = 1  # pedidos idênticos agrupados neste job enquanto ele esperava
+        self.mensagens = []
+        self.versao_id = None
+        self.resultado = None  # ScheduleResult devolvido pelo processo de geração
+        self.criado = time.time()
+        self.inicio = None
+        self.fim = None
 
-                def __getattr__(self, name):
-                    return getattr(self._cur, name)
+    @property
+    def terminado(self):
+        return self.status in ('concluido', 'falhou')
 
-            class SQLiteConnectionAdapter:
-                def __init__(self, conn):
-                    self._conn = conn
-                    self.is_sqlite = True
+    def to_dict(self):
+        def data(instante):
+            return datetime.fromtimestamp(instante).isoformat(timespec='seconds') if instante else None
+        return {
+            'id': self.id,
+            'status': self.status,
+            'etapa': self.etapa,
+            'pedidos': self.pedidos,
+            'versao_id': self.versao_id,
+            'mensagens': [{'titulo': titulo, 'texto': texto, 'tipo': tipo} for titulo, texto, tipo in self.mensagens],
+            'opcoes': {nome: getattr(self.solver_options, nome) for nome in SERVE_JOB_OPTIONS},
+            'criado_em': data(self.criado),
+            'iniciado_em': data(self.inicio),
+            'concluido_em': data(self.fim),
+            'duracao': round(self.fim - self.inicio, 3) if self.fim and self.inicio else None,
+            'resultado': self.resultado.to_dict() if self.resultado is not None else None,
+        }
 
-                def cursor(self):
-                    return SQLiteCursorAdapter(self._conn.cursor())
 
-                def commit(self):
-                    return self._conn.commit()
+class SolveQueue:
+    """Fila asyncio de gerações do modo serviço; os solves rodam num ProcessPoolExecutor.
 
-                def close(self):
-                    return self._conn.close()
+    `submit` nunca bloqueia: o job entra na fila e `SERVE_SOLVE_WORKERS` tarefas o entregam ao
+    pool, acompanhando o progresso por uma fila do Manager sem travar o event loop. Um pedido
+    idêntico (mesmas opções) a um job ainda pendente é agrupado nele em vez de gerar de novo;
+    depois que o job começa, um pedido igual vira um novo job, porque os dados podem ter mudado.
+    O `ScheduleResult` do último job terminado fica em `ultimo` (para `/metrics`) e, com
+    `metrics_file`, é gravado também no formato Prometheus.
+    """
 
-            connection = SQLiteConnectionAdapter(sqlite_conn)
-            logging.info("Fallback: usando banco SQLite em memória para testes")
-        except Exception as se:
-            logging.error(f"Erro ao criar DB SQLite de fallback: {se}")
-            connection = None
-    return connection
+    def __init__(self, solver_options=None, sqlite_path=None, workers=None, history=None, metrics_file=None):
+        self.solver_options = solver_options or SolverOptions.from_env()
+        self.sqlite_path = sqlite_path
+        self.workers = workers or SERVE_SOLVE_WORKERS
+        self.history = SERVE_JOB_HISTORY if history is None else history
+        self.metrics_file = metrics_file
+        self.ultimo = None
+        self.totais = {'ok': 0, 'falha': 0}
+        self.jobs = {}
+        self._pendentes = {}
+        self._proximo_id = 1
+        self._fila = None
+        self._executor = None
+        self._manager = None
+        self._tarefas = []
 
-# Função para criar as tabelas no banco de dados
-def create_tables(connection):
-    cursor = connection.cursor()
+    def _novo_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_serve_worker_init)
 
-    # Suporte a SQLite de fallback (usado em CI quando MySQL não está disponível)
-    if getattr(connection, 'is_sqlite', False):
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS professores (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL,
-            disponibilidade TEXT,
-            preferencias TEXT
-        )
-        """)
+    async def start(self):
+        self._manager = multiprocessing.get_context('spawn').Manager()
+        self._executor = self._novo_executor()
+        self._fila = asyncio.Queue()
+        self._tarefas = [asyncio.create_task(self._consumir()) for _ in range(self.workers)]
+        return self
 
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS materias (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL,
-            carga_horaria INTEGER NOT NULL
-        )
-        """)
+    async def close(self):
+        for tarefa in self._tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*self._tarefas, return_exceptions=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._manager.shutdown()
 
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS turmas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL,
-            ano INTEGER NOT NULL
-        )
-        """)
+    def submit(self, solver_options=None):
+        """Enfileira uma geração; retorna (job, novo), com novo=False quando o pedido foi agrupado."""
+        job = SolveJob(str(self._proximo_id), solver_options or self.solver_options)
+        existente = self._pendentes.get(job.chave)
+        if existente is not None:
+            existente.pedidos += 1
+            return existente, False
+        self._proximo_id += 1
+        self.jobs[job.id] = job
+        self._pendentes[job.chave] = job
+        self._fila.put_nowait(job)
+        self._descartar_antigos()
+        return job, True
 
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS cronogramas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            professor_id INTEGER,
-            materia_id INTEGER,
-            turma_id INTEGER,
-            dia_semana TEXT,
-            horario_inicio TEXT,
-            horario_fim TEXT
-        )
-        """)
-    else:
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS professores (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            nome VARCHAR(100) NOT NULL,
-            disponibilidade TEXT,
-            preferencias TEXT
-        )
-        """)
+    def counts(self):
+        contagem = {'pendente': 0, 'executando': 0, 'concluido': 0, 'falhou': 0}
+        for job in self.jobs.values():
+            contagem[job.status] += 1
+        return contagem
 
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS materias (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            nome VARCHAR(100) NOT NULL,
-            carga_horaria INT NOT NULL
-        )
-        """)
+    def _descartar_antigos(self):
+        terminados = [job_id for job_id, job in self.jobs.items() if job.terminado]
+        for job_id in terminados[:max(0, len(terminados) - self.history)]:
+            del self.jobs[job_id]
 
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS turmas (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            nome VARCHAR(50) NOT NULL,
-            ano INT NOT NULL
-        )
-        """)
+    async def _consumir(self):
+        while True:
+            job = await self._fila.get()
+            self._pendentes.pop(job.chave, None)
+            try:
+                await self._executar(job)
+            except Exception as e:
+                # Erro fora do solve (banco, Manager, bug): o job falha, mas esta tarefa segue consumindo a fila
+                logging.error(f"Job {job.id} falhou: {e}")
+                job.mensagens.append(("Erro", f"Falha na geração: {e}", "error"))
+                if not job.terminado:
+                    job.status = 'falhou'
+                    job.etapa = "Falhou"
+                    job.fim = time.time()
+                    self.totais['falha'] += 1
+            finally:
+                self._descartar_antigos()
 
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS cronogramas (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            professor_id INT,
-            materia_id INT,
-            turma_id INT,
-            dia_semana VARCHAR(20),
-            horario_inicio TIME,
-            horario_fim TIME,
-            FOREIGN KEY (professor_id) REFERENCES professores(id),
-            FOREIGN KEY (materia_id) REFERENCES materias(id),
-            FOREIGN KEY (turma_id) REFERENCES turmas(id)
-        )
-        """)
+    async def _executar(self, job):
+        loop = asyncio.get_running_loop()
+        job.status = 'executando'
+        job.etapa = "Iniciando"
+        job.inicio = time.time()
+        eventos = self._manager.Queue()
+        futuro = loop.run_in_executor(self._executor, _run_generation, eventos, job.solver_options, self.sqlite_path)
+        try:
+            while True:
+                await asyncio.wait({futuro}, timeout=GENERATION_POLL_MS / 1000)
+                for evento in await asyncio.to_thread(_drain_events, eventos):
+                    if evento[0] == 'progresso':
+                        job.etapa = evento[1]
+                    else:
+                        job.mensagens.append(evento[1:])
+                if futuro.done():
+                    job.resultado = futuro.result()
+                    break
+        except BrokenProcessPool as e:
+            logging.error(f"Pool de geração quebrou no job {job.id}: {e}")
+            job.mensagens.append(("Erro", f"O processo de geração terminou inesperadamente: {e}", "error"))
+            job.resultado = ScheduleResult(status='Error', erro=str(e), concluido_em=time.time())
+            self._executor = self._novo_executor()
+        finally:
+            ok = bool(job.resultado)
+            job.fim = time.time()
+            job.status = 'concluido' if ok else 'falhou'
+            job.etapa = "Concluído" if ok else "Falhou"
+            self.totais['ok' if ok else 'falha'] += 1
+        job.versao_id = job.resultado.versao_id
+        self.ultimo = job.resultado
+        logging.info(f"Job {job.id} {job.status} em {job.fim - job.inicio:.1f}s")
+        if self.metrics_file:
+            try:
+                await asyncio.to_thread(write_metrics_file, self.metrics_file, prometheus_metrics(job.resultado))
+            except OSError as e:
+                logging.error(f"Não foi possível gravar as métricas em {self.metrics_file}: {e}")
 
-    connection.commit()
-    print("Tabelas criadas com sucesso")
 
-# Função para mostrar mensagem (compatível com CI/headless)
-def show_message(title, message, type="info"):
-    try:
-        import tkinter.messagebox as mb
-        if type == "info":
-            mb.showinfo(title, message)
-        elif type == "error":
-            mb.showerror(title, message)
-    except (ImportError, _tkinter.TclError):
-        logging.info(f"{title}: {message} (Modo headless)")
+class ScheduleService:
+    """API HTTP/JSON do modo serviço sobre `asyncio.start_server`, sem dependências novas.
 
-# Função para otimizar o cronograma usando PuLP
-def optimize_schedule(connection):
-    cursor = connection.cursor()
-    
-    # Verificar se há dados suficientes
-    cursor.execute("SELECT COUNT(*) FROM professores")
-    if cursor.fetchone()[0] == 0:
-        show_message("Erro", "Nenhum professor cadastrado!", "error")
-        return
-    cursor.execute("SELECT COUNT(*) FROM materias")
-    if cursor.fetchone()[0] == 0:
-        show_message("Erro", "Nenhuma matéria cadastrada!", "error")
-        return
-    cursor.execute("SELECT COUNT(*) FROM turmas")
-    if cursor.fetchone()[0] == 0:
-        show_message("Erro", "Nenhuma turma cadastrada!", "error")
-        return
-    
-    cursor.execute("SELECT id, nome, disponibilidade, preferencias FROM professores")
-    professores = cursor.fetchall()
-    
-    cursor.execute("SELECT id, nome, carga_horaria FROM materias")
-    materias = cursor.fetchall()
-    
-    cursor.execute("SELECT id, nome FROM turmas")
-    turmas = cursor.fetchall()
-    
-    dias_semana = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta']
-    
-    horarios = [
-        ('08:00:00', '09:00:00'),
-        ('09:00:00', '10:00:00'),
-        ('10:00:00', '11:00:00'),
-        ('11:00:00', '12:00:00')
-    ]
-    
-    # Basic feasibility check: ensure total required slots <= available slots
-    total_slots = len(dias_semana) * len(horarios) * len(turmas)
-    total_required = sum(m[2] for m in materias)
-    if total_required > total_slots:
-        show_message("Erro", f"Carga horária total ({total_required}) excede slots disponíveis ({total_slots})", "error")
-        return False
+    Leituras do banco rodam em threads (`asyncio.to_thread`) com conexão própria e as gerações
+    vão para a `SolveQueue`, então o event loop nunca espera pelo banco nem pelo CBC. Cada
+    requisição é respondida e a conexão fechada (`Connection: close`).
 
-    prob = pulp.LpProblem("Agendamento_Escolar", pulp.LpMinimize)
+        GET  /health                  estado da fila
+        GET  /professores | /materias | /turmas
+        GET  /cronograma?professor=&turma=&dia=&limit=&offset=
+        GET  /cronograma/faltas | /cronograma/versoes
+        POST /jobs                    {"engine": "heuristic", "elastic": true, ...} -> 202 + job
+        GET  /jobs | /jobs/<id>
+        GET  /metrics                 texto Prometheus: fila, gerações e a última geração
+    """
 
-    x = pulp.LpVariable.dicts("assign", 
-                              ((p[0], m[0], t[0], d, s) 
-                               for p in professores 
-                               for m in materias 
-                               for t in turmas 
-                               for d in dias_semana 
-                               for s in range(len(horarios))),
-                              cat='Binary')
-
-    # Penalidade para descumprimento de preferência (higher penalty -> stronger preference)
-    penalty = 5
-    obj = []
-    for key in x:
-        p_id, m_id, t_id, d, s = key
-        prof = next((prof for prof in professores if prof[0] == p_id), None)
-        penal = 0
-        if prof and prof[3]:
-            pref = prof[3]
-            if ':' in pref:
+    ROTAS = ('health', 'professores', 'materias', 'turmas', 'cronograma', 'jobs', 'metrics')
+
+    def __init__(self, fila, sqlite_path=None):
+        self.fila = fila
+        self.sqlite_path = sqlite_path
+
+    async def _ler(self, funcao, *args):
+        return await asyncio.to_thread(_with_connection, self.sqlite_path, funcao, *args)
+
+    @staticmethod
+    def _cronograma(connection, params):
+        def primeiro(nome):
+            valores = params.get(nome)
+            return valores[0] if valores else None
+        filtros = {
+            'professor_id': resolve_entity_id(connection, 'professores', primeiro('professor')),
+            'turma_id': resolve_entity_id(connection, 'turmas', primeiro('turma')),
+            'dia': primeiro('dia'),
+        }
+        limit = int(primeiro('limit') or SCHEDULE_PAGE_SIZE)
+        offset = int(primeiro('offset') or 0)
+        if limit < 1 or offset < 0:
+            raise ValueError("limit deve ser positivo e offset não negativo")
+        return {
+            'total': count_schedule_rows(connection, **filtros),
+            'limit': limit,
+            'offset': offset,
+            'aulas': [dict(zip(EXPORT_CHAVES, valores))
+                      for _, valores in load_schedule_page(connection, limit=limit, offset=offset, **filtros)],
+        }
+
+    def metrics(self):
+        linhas = prometheus_lines('jobs', 'gauge', "Jobs de geração por status",
+                                  [({'status': status}, n) for status, n in self.fila.counts().items()])
+        linhas += prometheus_lines('solves_total', 'counter', "Gerações terminadas desde o início do serviço",
+                                   [({'result': r}, n) for r, n in self.fila.totais.items()])
+        texto = "\n".join(linhas) + "\n"
+        return texto + prometheus_metrics(self.fila.ultimo) if self.fila.ultimo is not None else texto
+
+    async def dispatch(self, metodo, caminho, params, corpo):
+        """Atende uma requisição já lida; retorna (status HTTP, objeto JSON ou texto)."""
+        partes = [p for p in caminho.split('/') if p]
+        if metodo == 'GET':
+            if partes == ['health']:
+                return 200, {'status': 'ok', 'jobs': self.fila.counts()}
+            if len(partes) == 1 and partes[0] in ('professores', 'materias', 'turmas'):
+                return 200, (await self._ler(load_entities))[partes[0]]
+            if partes == ['cronograma']:
+                return 200, await self._ler(self._cronograma, params)
+            if partes == ['cronograma', 'faltas']:
+                return 200, [{'materia': mat, 'turma': tur, 'aulas': qtd}
+                             for mat, tur, qtd in await self._ler(load_shortfall)]
+            if partes == ['cronograma', 'versoes']:
+                return 200, [{'id': vid, 'criado_em': str(criado_em), 'total_aulas': total, 'ativa': ativa}
+                             for vid, criado_em, total, ativa in await self._ler(list_schedule_versions)]
+            if partes == ['metrics']:
+                return 200, self.metrics()
+            if partes == ['jobs']:
+                return 200, [job.to_dict() for job in self.fila.jobs.values()]
+            if len(partes) == 2 and partes[0] == 'jobs':
+                job = self.fila.jobs.get(partes[1])
+                return (200, job.to_dict()) if job else (404, {'erro': f"Job {partes[1]} não encontrado"})
+        elif metodo == 'POST' and partes == ['jobs']:
+            opcoes = parse_job_options(json.loads(corpo or b'{}'), self.fila.solver_options)
+            job, novo = self.fila.submit(opcoes)
+            return (202 if novo else 200), job.to_dict()
+        if partes and partes[0] in self.ROTAS:
+            return 405, {'erro': f"Método {metodo} não permitido em {caminho}"}
+        return 404, {'erro': f"Rota {caminho} não encontrada"}
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                requisicao = await asyncio.wait_for(self._ler_requisicao(reader), SERVE_READ_TIMEOUT)
+            except (TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                return
+            if isinstance(requisicao, int):
+                status, resposta = requisicao, {'erro': HTTPStatus(requisicao).phrase}
+            else:
                 try:
-                    pref_mat, pref_dia = pref.split(':', 1)
-                except Exception:
-                    pref_mat, pref_dia = '', ''
-                mat_nome = next((mat[1] for mat in materias if mat[0] == m_id), "")
-                # penalize mismatch; if both match prefer strongly
-                if pref_mat and mat_nome != pref_mat:
-                    penal += penalty
-                if pref_dia and d != pref_dia:
-                    penal += penalty
-        # base cost 1 for an assignment; add penal when preference not matched
-        obj.append(x[key] * (1 + penal))
-    prob += pulp.lpSum(obj)
+                    status, resposta = await self.dispatch(*requisicao)
+                except ValueError as e:
+                    status, resposta = 400, {'erro': str(e)}
+                except (Error, sqlite3.Error) as e:
+                    logging.error(f"Erro de banco na API: {e}")
+                    status, resposta = 503, {'erro': f"Banco de dados indisponível: {e}"}
+                except Exception as e:
+                    logging.exception("Erro inesperado na API")
+                    status, resposta = 500, {'erro': str(e)}
+            if isinstance(resposta, str):
+                corpo, tipo = resposta.encode('utf-8'), "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                corpo = json.dumps(resposta, ensure_ascii=False, default=str).encode('utf-8')
+                tipo = "application/json; charset=utf-8"
+            writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                         f"Content-Type: {tipo}\r\n"
+                         f"Content-Length: {len(corpo)}\r\n"
+                         "Connection: close\r\n\r\n".encode('latin-1') + corpo)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
 
-    for m_id, _, carga in materias:
-        for t_id, _ in turmas:
-            prob += pulp.lpSum(x[p[0], m_id, t_id, d, s] 
-                               for p in professores 
-                               for d in dias_semana 
-                               for s in range(len(horarios))) == carga
+    @staticmethod
+    async def _ler_requisicao(reader):
+        """Lê linha de requisição, cabeçalhos e corpo; retorna (método, caminho, params, corpo) ou um status de erro."""
+        linha = (await reader.readline()).decode('latin-1').split()
+        if len(linha) != 3:
+            return 400
+        metodo, alvo, _ = linha
+        cabecalhos = {}
+        while True:
+            cabecalho = await reader.readline()
+            if cabecalho in (b'\r\n', b'\n', b''):
+                break
+            nome, _, valor = cabecalho.decode('latin-1').partition(':')
+            cabecalhos[nome.strip().lower()] = valor.strip()
+        try:
+            tamanho = int(cabecalhos.get('content-length', 0))
+        except ValueError:
+            return 400
+        if tamanho > SERVE_MAX_BODY:
+            return 413
+        corpo = await reader.readexactly(tamanho) if tamanho else b''
+        url = urlsplit(alvo)
+        return metodo.upper(), url.path, parse_qs(url.query), corpo
 
-    for p in professores:
-        p_id = p[0]
-        for d in dias_semana:
-            for s in range(len(horarios)):
-                prob += pulp.lpSum(x[p_id, m[0], t[0], d, s] 
-                                   for m in materias 
-                                   for t in turmas) <= 1
 
-    # Garantir que para cada turma, dia e horário haja no máximo UMA atribuição (evita dois professores no mesmo dia/horário para mesma turma)
-    for t in turmas:
-        t_id = t[0]
-        for d in dias_semana:
-            for s in range(len(horarios)):
-                prob += pulp.lpSum(x[p[0], m[0], t_id, d, s]
-                                   for p in professores
-                                   for m in materias) <= 1
+async def start_service(host=None, port=None, solver_options=None, sqlite_path=None, metrics_file=None):
+    """Sobe a fila de gerações e o servidor HTTP; retorna (servidor, fila) já escutando."""
+    fila = await SolveQueue(solver_options, sqlite_path, metrics_file=metrics_file).start()
+    servico = ScheduleService(fila, sqlite_path)
+    servidor = await asyncio.start_server(servico.handle, host or SERVE_HOST, SERVE_PORT if port is None else port)
+    return servidor, fila
 
-    for p in professores:
-        p_id = p[0]
-        disp = p[2].split(',') if p[2] else []
-        for d in dias_semana:
-            if d not in disp:
-                for m in materias:
-                    for t in turmas:
-                        for s in range(len(horarios)):
-                            prob += x[p_id, m[0], t[0], d, s] == 0
-
-    prob.solve(pulp.PULP_CBC_CMD(msg=0))
-
-    if pulp.LpStatus[prob.status] != 'Optimal':
-        logging.error(f"Solver status: {pulp.LpStatus[prob.status]}")
-        show_message("Erro", "Não foi possível gerar um cronograma. Verifique os dados inseridos!", "error")
-        return False
-
-    cursor.execute("DELETE FROM cronogramas")
-    for var in x:
-        if pulp.value(x[var]) == 1:
-            p_id, m_id, t_id, d, s = var
-            inicio, fim = horarios[s]
-            cursor.execute("""
-            INSERT INTO cronogramas (professor_id, materia_id, turma_id, dia_semana, horario_inicio, horario_fim)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """, (p_id, m_id, t_id, d, inicio, fim))
-    
-    connection.commit()
-    show_message("Sucesso", "Cronograma gerado com sucesso!", "info")
-    logging.info("Cronograma gerado e salvo no banco")
-    # Verificação pós-solução: detectar conflitos residuais (duas atribuições no mesmo slot)
+
+async def serve(host=None, port=None, solver_options=None, sqlite_path=None, metrics_file=None):
+    """Modo serviço (`--serve`): atende até SIGTERM/SIGINT e então fecha o servidor e o pool."""
+    servidor, fila = await start_service(host, port, solver_options, sqlite_path, metrics_file)
+    enderecos = ", ".join(f"{s.getsockname()[0]}:{s.getsockname()[1]}" for s in servidor.sockets)
+    logging.info(f"API do cronograma escutando em {enderecos} ({fila.workers} geração(ões) simultânea(s))")
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sinal, parar.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C interrompe asyncio.run normalmente
     try:
-        # Por turma/dia/horário
-        cursor.execute("""
-        SELECT turma_id, dia_semana, horario_inicio, COUNT(*) as cnt
-        FROM cronogramas
-        GROUP BY turma_id, dia_semana, horario_inicio
-        HAVING cnt > 1
-        """)
-        conflicts = cursor.fetchall()
-        if conflicts:
-            msg = "Conflitos detectados por turma/dia/horário:\n"
-            for tid, dia, inicio, cnt in conflicts:
-                msg += f"- Turma {tid} {dia} {inicio} -> {cnt} atribuições\n"
-            logging.error(msg)
-            show_message("Conflitos", msg, "error")
-            return False
-
-        # Por professor/dia/horário (double-booking)
-        cursor.execute("""
-        SELECT professor_id, dia_semana, horario_inicio, COUNT(*) as cnt
-        FROM cronogramas
-        GROUP BY professor_id, dia_semana, horario_inicio
-        HAVING cnt > 1
-        """)
-        prof_conf = cursor.fetchall()
-        if prof_conf:
-            msg = "Conflitos de professor (double-booking):\n"
-            for pid, dia, inicio, cnt in prof_conf:
-                msg += f"- Professor {pid} {dia} {inicio} -> {cnt} atribuições\n"
-            logging.error(msg)
-            show_message("Conflitos", msg, "error")
-            return False
-    except Exception as e:
-        logging.error(f"Erro ao verificar conflitos: {e}")
+        await parar.wait()
+    finally:
+        servidor.close()
+        await servidor.wait_closed()
+        await fila.close()
+        logging.info("API do cronograma encerrada")
 
-    return True
 
 # GUI para o diretor inserir dados
 class SchoolApp:
-    def __init__(self, root, connection):
+    def __init__(self, root, connection, solver_options=None):
         _ensure_tkinter()
         if tk is None or ttk is None:
             raise RuntimeError("Tkinter não está disponível neste ambiente (modo headless).")
         self.root = root
         self.conn = connection
+        self.solver_options = solver_options or SolverOptions.from_env()
+        self.job = None
+        self.schedule_repo = ScheduleRepository(connection)
+        self.dias_semana, self.horarios, self.grade_mask = load_time_grid(self.conn.cursor())
         self.root.title("Sistema de Agendamento Escolar")
         self.root.geometry("900x700")
         self.root.configure(bg="#f0f4f8")
@@ -424,36 +3326,42 @@ class SchoolApp:
         self.setup_schedule_frame()
 
         # Botão para gerar cronograma
-        self.generate_btn = ttk.Button(root, text="Gerar Cronograma Otimizado", command=self.generate, style='TButton')
-        self.generate_btn.pack(pady=10)
+        gerar_frame = ttk.Frame(root)
+        gerar_frame.pack(pady=10)
+        self.generate_btn = ttk.Button(gerar_frame, text="Gerar Cronograma Otimizado", command=self.generate, style='TButton')
+        self.generate_btn.pack(side='left', padx=6)
+        # Modo elástico: com dados inviáveis grava o cronograma parcial e o relatório de aulas não alocadas
+        self.elastic_var = tk.BooleanVar(value=self.solver_options.elastic)
+        ttk.Checkbutton(gerar_frame, text="Aceitar cronograma parcial", variable=self.elastic_var).pack(side='left', padx=6)
+        # Sem mudanças nos dados, a geração reativa a versão guardada; marcado, resolve de novo
+        self.force_var = tk.BooleanVar(value=self.solver_options.force_solve)
+        ttk.Checkbutton(gerar_frame, text="Forçar nova geração", variable=self.force_var).pack(side='left', padx=6)
+
+        # Progresso da geração em segundo plano: etapa, tempo decorrido e cancelamento
+        progresso_frame = ttk.Frame(root)
+        progresso_frame.pack(fill='x', padx=20)
+        self.progress_bar = ttk.Progressbar(progresso_frame, mode='indeterminate', length=200)
+        self.progress_bar.pack(side='left', padx=6)
+        self.progress_label = ttk.Label(progresso_frame, text="")
+        self.progress_label.pack(side='left', padx=6)
+        self.cancel_btn = ttk.Button(progresso_frame, text="Cancelar", command=self.cancel_generation, state='disabled')
+        self.cancel_btn.pack(side='right', padx=6)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # Área para exibir cronograma
         self.text_area = tk.Text(root, height=18, width=100, font=("Consolas", 11), bg="#f8fafc", fg="#222", borderwidth=2, relief="groove")
         self.text_area.pack(pady=10, padx=20)
 
     def setup_prof_frame(self):
-        dias_semana = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta']
         ttk.Label(self.prof_frame, text="Nome do Professor:").grid(row=0, column=0, padx=10, pady=10, sticky="w")
         self.prof_nome = tk.Entry(self.prof_frame, font=("Segoe UI", 11))
         self.prof_nome.grid(row=0, column=1, padx=10, pady=10, sticky="ew")
 
-        ttk.Label(self.prof_frame, text="Disponibilidade (selecione):").grid(row=1, column=0, padx=10, pady=10, sticky="w")
-        self.prof_disp_vars = {}
-        dias_frame = ttk.Frame(self.prof_frame)
-        dias_frame.grid(row=1, column=1, padx=0, pady=0, sticky="w")
-        for i, dia in enumerate(dias_semana):
-            var = tk.BooleanVar()
-            cb = ttk.Checkbutton(dias_frame, text=dia, variable=var)
-            cb.pack(side="left", padx=2)
-            self.prof_disp_vars[dia] = var
-
-        ttk.Label(self.prof_frame, text="Preferência (Matéria):").grid(row=2, column=0, padx=10, pady=10, sticky="w")
-        self.prof_pref_mat = tk.Entry(self.prof_frame, font=("Segoe UI", 11))
-        self.prof_pref_mat.grid(row=2, column=1, padx=10, pady=10, sticky="ew")
+        ttk.Label(self.prof_frame, text="Disponibilidade (dia/horário):").grid(row=1, column=0, padx=10, pady=10, sticky="nw")
+        self.prof_disp_vars = self.build_availability_grid(self.prof_frame, row=1)
 
-        ttk.Label(self.prof_frame, text="Preferência (Dia da Semana):").grid(row=3, column=0, padx=10, pady=10, sticky="w")
-        self.prof_pref_dia = ttk.Combobox(self.prof_frame, values=dias_semana, state="readonly", font=("Segoe UI", 11))
-        self.prof_pref_dia.grid(row=3, column=1, padx=10, pady=10, sticky="ew")
+        ttk.Label(self.prof_frame, text="Preferências:").grid(row=2, column=0, padx=10, pady=10, sticky="nw")
+        self.prof_prefs, self.clear_prof_prefs = self.build_preferences_editor(self.prof_frame, row=2)
 
         ttk.Button(self.prof_frame, text="Adicionar Professor", command=self.add_prof).grid(row=4, column=0, columnspan=2, pady=15)
         ttk.Button(self.prof_frame, text="Limpar Campos", command=self.clear_prof).grid(row=5, column=0, columnspan=2, pady=5)
@@ -511,17 +3419,20 @@ class SchoolApp:
         self.tur_ano = tk.Entry(self.tur_frame, font=("Segoe UI", 11))
         self.tur_ano.grid(row=1, column=1, padx=10, pady=10, sticky="ew")
 
-        ttk.Button(self.tur_frame, text="Adicionar Turma", command=self.add_tur).grid(row=2, column=0, columnspan=2, pady=15)
-        ttk.Button(self.tur_frame, text="Limpar Campos", command=self.clear_tur).grid(row=3, column=0, columnspan=2, pady=5)
+        ttk.Label(self.tur_frame, text="Horários da turma:").grid(row=2, column=0, padx=10, pady=10, sticky="nw")
+        self.tur_disp_vars = self.build_availability_grid(self.tur_frame, row=2, disponibilidade=self.grade_mask)
+
+        ttk.Button(self.tur_frame, text="Adicionar Turma", command=self.add_tur).grid(row=3, column=0, columnspan=2, pady=15)
+        ttk.Button(self.tur_frame, text="Limpar Campos", command=self.clear_tur).grid(row=4, column=0, columnspan=2, pady=5)
 
         cols = ("id", "nome", "ano")
         self.tur_tree = ttk.Treeview(self.tur_frame, columns=cols, show='headings', height=6)
         for c in cols:
             self.tur_tree.heading(c, text=c.capitalize())
-        self.tur_tree.grid(row=4, column=0, columnspan=2, padx=10, pady=10, sticky='nsew')
+        self.tur_tree.grid(row=5, column=0, columnspan=2, padx=10, pady=10, sticky='nsew')
 
         btn_frame = ttk.Frame(self.tur_frame)
-        btn_frame.grid(row=5, column=0, columnspan=2, pady=5)
+        btn_frame.grid(row=6, column=0, columnspan=2, pady=5)
         ttk.Button(btn_frame, text="Editar Selecionado", command=self.edit_tur).pack(side='left', padx=5)
         ttk.Button(btn_frame, text="Excluir Selecionado", command=self.delete_tur).pack(side='left', padx=5)
         ttk.Button(btn_frame, text="Atualizar Lista", command=self.refresh_tur_list).pack(side='left', padx=5)
@@ -535,75 +3446,149 @@ class SchoolApp:
         ttk.Button(self.data_frame, text="Atualizar Lista", command=self.list_data).pack(pady=5)
 
     def setup_schedule_frame(self):
-        # Treeview para exibir o cronograma como tabela
+        # Filtros aplicados no banco: só a parte visível do cronograma é buscada
+        filtro_frame = ttk.Frame(self.schedule_frame)
+        filtro_frame.pack(fill='x', padx=8, pady=(8, 0))
+        self.schedule_filters = {}
+        for rotulo in ("Professor", "Turma", "Dia"):
+            ttk.Label(filtro_frame, text=f"{rotulo}:").pack(side='left', padx=(6, 2))
+            combo = ttk.Combobox(filtro_frame, state='readonly', width=16, values=["Todos"])
+            combo.current(0)
+            combo.bind("<<ComboboxSelected>>", lambda e: self.refresh_schedule_table(reset=True))
+            combo.pack(side='left')
+            self.schedule_filters[rotulo] = combo
+        self.schedule_filter_ids = {"Professor": [None], "Turma": [None], "Dia": [None]}
+        self.schedule_count_label = ttk.Label(filtro_frame, text="")
+        self.schedule_count_label.pack(side='right', padx=6)
+
+        # Treeview para exibir o cronograma como tabela, carregada por páginas ao rolar
+        tabela_frame = ttk.Frame(self.schedule_frame)
+        tabela_frame.pack(fill='both', expand=True, padx=8, pady=8)
         cols = ("professor", "materia", "turma", "dia", "inicio", "fim")
-        self.schedule_tree = ttk.Treeview(self.schedule_frame, columns=cols, show='headings')
+        self.schedule_tree = ttk.Treeview(tabela_frame, columns=cols, show='headings')
         for c in cols:
             hdr = c.capitalize()
             self.schedule_tree.heading(c, text=hdr)
             self.schedule_tree.column(c, width=120, anchor='center')
-        self.schedule_tree.pack(fill='both', expand=True, padx=8, pady=8)
+        self.schedule_scroll = ttk.Scrollbar(tabela_frame, orient='vertical', command=self.schedule_tree.yview)
+        self.schedule_tree.configure(yscrollcommand=self.on_schedule_scroll)
+        self.schedule_scroll.pack(side='right', fill='y')
+        self.schedule_tree.pack(side='left', fill='both', expand=True)
+        self.schedule_rows = []  # (chave, valores) exibidos, na ordem da tabela
+        self.schedule_total = 0
+
+        # Aulas não alocadas da versão ativa (cronograma parcial do modo elástico)
+        ttk.Label(self.schedule_frame, text="Aulas não alocadas:").pack(anchor='w', padx=8)
+        cols = ("turma", "materia", "faltam")
+        self.shortfall_tree = ttk.Treeview(self.schedule_frame, columns=cols, show='headings', height=4)
+        for c in cols:
+            self.shortfall_tree.heading(c, text=c.capitalize())
+            self.shortfall_tree.column(c, width=120, anchor='center')
+        self.shortfall_tree.pack(fill='x', padx=8, pady=(0, 8))
 
         btn_frame = ttk.Frame(self.schedule_frame)
         btn_frame.pack(pady=6)
-        ttk.Button(btn_frame, text="Atualizar Cronograma", command=self.refresh_schedule_table).pack(side='left', padx=6)
+        ttk.Button(btn_frame, text="Atualizar Cronograma", command=self.reload_schedule_table).pack(side='left', padx=6)
         ttk.Button(btn_frame, text="Exportar CSV", command=self.export_schedule_csv).pack(side='left', padx=6)
         ttk.Button(btn_frame, text="Exportar XLSX", command=self.export_schedule_xlsx).pack(side='left', padx=6)
 
-    def refresh_schedule_table(self):
+    def current_schedule_filters(self):
+        filtros = {}
+        for rotulo, chave in (("Professor", 'professor_id'), ("Turma", 'turma_id'), ("Dia", 'dia')):
+            indice = self.schedule_filters[rotulo].current()
+            filtros[chave] = self.schedule_filter_ids[rotulo][max(indice, 0)]
+        return filtros
+
+    def refresh_schedule_filters(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id, nome FROM professores ORDER BY nome")
+        professores = cursor.fetchall()
+        cursor.execute("SELECT id, nome FROM turmas ORDER BY nome")
+        turmas = cursor.fetchall()
+        opcoes = {"Professor": professores, "Turma": turmas, "Dia": [(d, d) for d in self.dias_semana]}
+        for rotulo, itens in opcoes.items():
+            combo = self.schedule_filters[rotulo]
+            selecionado = self.schedule_filter_ids[rotulo][max(combo.current(), 0)]
+            self.schedule_filter_ids[rotulo] = [None] + [i for i, _ in itens]
+            combo.configure(values=["Todos"] + [nome for _, nome in itens])
+            ids = self.schedule_filter_ids[rotulo]
+            combo.current(ids.index(selecionado) if selecionado in ids else 0)
+
+    def apply_schedule_rows(self, novas):
+        # Aplica só a diferença: sem apagar e reinserir a tabela inteira (e sem piscar)
+        tree = self.schedule_tree
+        for operacao in plan_tree_updates(self.schedule_rows, novas):
+            if operacao[0] == 'delete':
+                tree.delete(*operacao[1])
+            elif operacao[0] == 'update':
+                tree.item(operacao[1], values=operacao[2])
+            elif operacao[0] == 'move':
+                tree.move(operacao[1], '', operacao[2])
+            else:
+                tree.insert('', operacao[1], iid=operacao[2], values=operacao[3])
+        self.schedule_rows = novas
+
+    def update_schedule_count(self):
+        self.schedule_count_label.configure(text=f"Mostrando {len(self.schedule_rows)} de {self.schedule_total} aulas")
+
+    def on_schedule_scroll(self, primeiro, ultimo):
+        self.schedule_scroll.set(primeiro, ultimo)
+        # Perto do fim da parte carregada: busca a próxima página
+        if float(ultimo) > 0.9 and len(self.schedule_rows) < self.schedule_total:
+            self.root.after_idle(self.load_next_schedule_page)
+
+    def load_next_schedule_page(self):
+        if len(self.schedule_rows) >= self.schedule_total:
+            return
         try:
-            for iid in self.schedule_tree.get_children():
-                self.schedule_tree.delete(iid)
-            cursor = self.conn.cursor()
-            cursor.execute("""
-            SELECT p.nome, m.nome, t.nome, c.dia_semana, c.horario_inicio, c.horario_fim
-            FROM cronogramas c
-            JOIN professores p ON c.professor_id = p.id
-            JOIN materias m ON c.materia_id = m.id
-            JOIN turmas t ON c.turma_id = t.id
-            ORDER BY CASE c.dia_semana
-                WHEN 'Segunda' THEN 1
-                WHEN 'Terça' THEN 2
-                WHEN 'Quarta' THEN 3
-                WHEN 'Quinta' THEN 4
-                WHEN 'Sexta' THEN 5
-                ELSE 99 END, c.horario_inicio, p.nome
-            """)
-            for prof, mat, turma, dia, ini, fim in cursor.fetchall():
-                self.schedule_tree.insert('', 'end', values=(prof, mat, turma, dia, str(ini), str(fim)))
+            pagina = self.schedule_repo.page(limit=SCHEDULE_PAGE_SIZE, offset=len(self.schedule_rows),
+                                             **self.current_schedule_filters())
+        except Exception as e:
+            logging.error(f"Falha ao carregar mais linhas do cronograma: {e}")
+            return
+        conhecidas = {chave for chave, _ in self.schedule_rows}
+        pagina = [linha for linha in pagina if linha[0] not in conhecidas]
+        for chave, valores in pagina:
+            self.schedule_tree.insert('', 'end', iid=chave, values=valores)
+        self.schedule_rows = self.schedule_rows + pagina
+        if not pagina:
+            self.schedule_total = len(self.schedule_rows)
+        self.update_schedule_count()
+
+    def reload_schedule_table(self):
+        # Botão "Atualizar Cronograma": descarta o cache para ver também escritas feitas por fora
+        self.schedule_repo.invalidate()
+        self.refresh_schedule_table()
+
+    def refresh_schedule_table(self, reset=False):
+        try:
+            ensure_connection(self.conn)
+            self.refresh_schedule_filters()
+            filtros = self.current_schedule_filters()
+            # Recarrega o mesmo número de linhas já exibidas (ou uma página, ao trocar o filtro)
+            limite = SCHEDULE_PAGE_SIZE if reset else max(SCHEDULE_PAGE_SIZE, len(self.schedule_rows))
+            self.schedule_total = self.schedule_repo.count(**filtros)
+            self.apply_schedule_rows(self.schedule_repo.page(limit=limite, **filtros))
+            if reset:
+                self.schedule_tree.yview_moveto(0)
+            self.update_schedule_count()
+            for iid in self.shortfall_tree.get_children():
+                self.shortfall_tree.delete(iid)
+            for mat, turma, qtd in self.schedule_repo.shortfall():
+                self.shortfall_tree.insert('', 'end', values=(turma, mat, qtd))
+            logging.debug(f"Cache do cronograma: {self.schedule_repo.metrics()}")
         except Exception as e:
             logging.error(f"Falha ao atualizar tabela de cronograma: {e}")
 
     def export_schedule_csv(self):
         # Exporta o cronograma atual para CSV simples no diretório atual
         try:
-            import csv
-            rows = []
-            cursor = self.conn.cursor()
-            cursor.execute("""
-            SELECT p.nome, m.nome, t.nome, c.dia_semana, c.horario_inicio, c.horario_fim
-            FROM cronogramas c
-            JOIN professores p ON c.professor_id = p.id
-            JOIN materias m ON c.materia_id = m.id
-            JOIN turmas t ON c.turma_id = t.id
-            ORDER BY CASE c.dia_semana
-                WHEN 'Segunda' THEN 1
-                WHEN 'Terça' THEN 2
-                WHEN 'Quarta' THEN 3
-                WHEN 'Quinta' THEN 4
-                WHEN 'Sexta' THEN 5
-                ELSE 99 END, c.horario_inicio, p.nome
-            """)
-            rows = cursor.fetchall()
+            rows = self.schedule_repo.rows()
             if not rows:
                 show_message("Info", "Nenhum cronograma para exportar.", "info")
                 return
             fname = f"cronograma_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            with open(fname, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(["Professor", "Matéria", "Turma", "Dia", "Início", "Fim"])
-                for r in rows:
-                    writer.writerow(r)
+            export_schedule(rows, fname, 'csv')
             show_message("Sucesso", f"Cronograma exportado para {fname}", "info")
         except Exception as e:
             logging.error(f"Erro ao exportar CSV: {e}")
@@ -611,69 +3596,118 @@ class SchoolApp:
 
     def export_schedule_xlsx(self):
         try:
-            try:
-                from openpyxl import Workbook
-                from openpyxl.styles import Font, PatternFill
-            except Exception:
-                show_message("Erro", "openpyxl não está instalado. Instale com: pip install openpyxl", "error")
-                return
-
-            cursor = self.conn.cursor()
-            cursor.execute("""
-            SELECT p.nome, m.nome, t.nome, c.dia_semana, c.horario_inicio, c.horario_fim
-            FROM cronogramas c
-            JOIN professores p ON c.professor_id = p.id
-            JOIN materias m ON c.materia_id = m.id
-            JOIN turmas t ON c.turma_id = t.id
-            ORDER BY CASE c.dia_semana
-                WHEN 'Segunda' THEN 1
-                WHEN 'Terça' THEN 2
-                WHEN 'Quarta' THEN 3
-                WHEN 'Quinta' THEN 4
-                WHEN 'Sexta' THEN 5
-                ELSE 99 END, c.horario_inicio, p.nome
-            """)
-            rows = cursor.fetchall()
+            rows = self.schedule_repo.rows()
             if not rows:
                 show_message("Info", "Nenhum cronograma para exportar.", "info")
                 return
-
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Cronograma"
-            headers = ["Professor", "Matéria", "Turma", "Dia", "Início", "Fim"]
-            header_font = Font(bold=True, color="FFFFFF")
-            header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-            ws.append(headers)
-            for col in range(1, len(headers) + 1):
-                cell = ws.cell(row=1, column=col)
-                cell.font = header_font
-                cell.fill = header_fill
-
-            for r in rows:
-                ws.append([r[0], r[1], r[2], r[3], str(r[4]), str(r[5])])
-
-            # Ajusta largura das colunas
-            for column_cells in ws.columns:
-                length = max(len(str(cell.value or "")) for cell in column_cells)
-                ws.column_dimensions[column_cells[0].column_letter].width = min(max(length + 2, 12), 40)
-
-            # Freeze header
-            ws.freeze_panes = "A2"
-
             fname = f"cronograma_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            wb.save(fname)
+            export_schedule_xlsx(rows, fname, larguras=xlsx_column_widths(self.conn))
             show_message("Sucesso", f"Cronograma exportado para {fname}", "info")
+        except ImportError:
+            show_message("Erro", "openpyxl não está instalado. Instale com: pip install openpyxl", "error")
         except Exception as e:
             logging.error(f"Erro ao exportar XLSX: {e}")
             show_message("Erro", f"Falha ao exportar XLSX: {e}", "error")
 
+    def build_availability_grid(self, parent, row, disponibilidade=0):
+        """Grade de checkboxes dia x horário (só os slots que existem na grade_horaria); o botão do
+        dia marca/desmarca o dia inteiro. Retorna {(dia_idx, slot): BooleanVar}."""
+        n_slots = len(self.horarios)
+        grade = ttk.Frame(parent)
+        grade.grid(row=row, column=1, padx=0, pady=0, sticky="w")
+        variaveis = {}
+        for s, (inicio, _) in enumerate(self.horarios):
+            ttk.Label(grade, text=inicio[:5]).grid(row=s + 1, column=0, padx=4, sticky="e")
+        for d_idx, dia in enumerate(self.dias_semana):
+            do_dia = []
+            for s in range(n_slots):
+                bit = slot_bit(d_idx, s, n_slots)
+                if not self.grade_mask & bit:
+                    continue
+                var = tk.BooleanVar(value=bool(disponibilidade & bit))
+                ttk.Checkbutton(grade, variable=var).grid(row=s + 1, column=d_idx + 1)
+                variaveis[d_idx, s] = var
+                do_dia.append(var)
+
+            def alternar(do_dia=do_dia):
+                marcar = not all(var.get() for var in do_dia)
+                for var in do_dia:
+                    var.set(marcar)
+
+            ttk.Button(grade, text=dia, width=8, command=alternar).grid(row=0, column=d_idx + 1, padx=2)
+        return variaveis
+
+    def mask_from_vars(self, variaveis):
+        mask = 0
+        for (d_idx, s), var in variaveis.items():
+            if var.get():
+                mask |= slot_bit(d_idx, s, len(self.horarios))
+        return mask
+
+    def build_preferences_editor(self, parent, row, preferencias=()):
+        """Lista editável de preferências (matéria e/ou dia, com peso). Retorna (itens, limpar):
+        a lista de (materia_id, dia, peso) mantida em sincronia com o Listbox e a função que a esvazia."""
+        frame = ttk.Frame(parent)
+        frame.grid(row=row, column=1, padx=10, pady=6, sticky="ew")
+        itens = list(preferencias)
+        materias = {}
+
+        def carregar_materias():
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT id, nome, carga_horaria FROM materias ORDER BY nome")
+            materias.clear()
+            materias.update({m[1]: m for m in cursor.fetchall()})
+            mat_cb['values'] = [""] + list(materias)
+
+        mat_cb = ttk.Combobox(frame, state="readonly", width=18, postcommand=carregar_materias)
+        mat_cb.grid(row=0, column=0, padx=2)
+        dia_cb = ttk.Combobox(frame, values=[""] + list(self.dias_semana), state="readonly", width=10)
+        dia_cb.grid(row=0, column=1, padx=2)
+        peso_sb = tk.Spinbox(frame, from_=1, to=20, width=4)
+        peso_sb.delete(0, tk.END)
+        peso_sb.insert(0, str(PREFERENCE_PENALTY))
+        peso_sb.grid(row=0, column=2, padx=2)
+        lista = tk.Listbox(frame, height=3, width=48)
+        lista.grid(row=1, column=0, columnspan=3, pady=4, sticky="ew")
+
+        def redesenhar():
+            lista.delete(0, tk.END)
+            for pref in itens:
+                lista.insert(tk.END, format_preferencias([pref], list(materias.values())))
+
+        def adicionar():
+            nome, dia = mat_cb.get(), dia_cb.get()
+            if not nome and not dia:
+                show_message("Erro", "Escolha uma matéria e/ou um dia para a preferência.", "error")
+                return
+            try:
+                peso = int(peso_sb.get())
+            except ValueError:
+                show_message("Erro", "O peso deve ser um número inteiro.", "error")
+                return
+            itens.append((materias[nome][0] if nome else None, dia or None, peso))
+            redesenhar()
+
+        def remover():
+            for i in reversed(lista.curselection()):
+                del itens[i]
+            redesenhar()
+
+        ttk.Button(frame, text="Adicionar preferência", command=adicionar).grid(row=0, column=3, padx=4)
+        ttk.Button(frame, text="Remover selecionada", command=remover).grid(row=1, column=3, padx=4, sticky="n")
+        def limpar():
+            itens.clear()
+            redesenhar()
+
+        carregar_materias()
+        redesenhar()
+        return itens, limpar
+
     def clear_prof(self):
         self.prof_nome.delete(0, tk.END)
         for var in self.prof_disp_vars.values():
             var.set(False)
-        self.prof_pref_mat.delete(0, tk.END)
-        self.prof_pref_dia.set("")
+        self.clear_prof_prefs()
 
     def clear_mat(self):
         self.mat_nome.delete(0, tk.END)
@@ -682,21 +3716,24 @@ class SchoolApp:
     def clear_tur(self):
         self.tur_nome.delete(0, tk.END)
         self.tur_ano.delete(0, tk.END)
+        for var in self.tur_disp_vars.values():
+            var.set(True)
 
     def add_prof(self):
         nome = self.prof_nome.get().strip()
-        disp = [dia for dia, var in self.prof_disp_vars.items() if var.get()]
-        disp_str = ','.join(disp)
-        pref_mat = self.prof_pref_mat.get().strip()
-        pref_dia = self.prof_pref_dia.get().strip()
-        pref = f"{pref_mat}:{pref_dia}" if pref_mat and pref_dia else ""
         if not nome:
             show_message("Erro", "O nome do professor é obrigatório!", "error")
             return
         try:
             cursor = self.conn.cursor()
-            cursor.execute("INSERT INTO professores (nome, disponibilidade, preferencias) VALUES (%s, %s, %s)", (nome, disp_str, pref))
+            # Disponibilidade e preferências ficam nas tabelas normalizadas; as colunas legadas ficam vazias
+            cursor.execute("INSERT INTO professores (nome, disponibilidade, preferencias) VALUES (%s, %s, %s)", (nome, '', ''))
+            pid = cursor.lastrowid
+            save_professor_availability(self.conn, pid, self.mask_from_vars(self.prof_disp_vars),
+                                        self.dias_semana, self.horarios, commit=False)
+            save_professor_preferences(self.conn, pid, self.prof_prefs, commit=False)
             self.conn.commit()
+            self.schedule_repo.invalidate()
             show_message("Sucesso", f"Professor '{nome}' adicionado!", "info")
             self.clear_prof()
             self.refresh_prof_list()
@@ -720,6 +3757,7 @@ class SchoolApp:
             cursor = self.conn.cursor()
             cursor.execute("INSERT INTO materias (nome, carga_horaria) VALUES (%s, %s)", (nome, carga))
             self.conn.commit()
+            self.schedule_repo.invalidate()
             show_message("Sucesso", f"Matéria '{nome}' adicionada!", "info")
             self.clear_mat()
             self.refresh_mat_list()
@@ -742,7 +3780,10 @@ class SchoolApp:
         try:
             cursor = self.conn.cursor()
             cursor.execute("INSERT INTO turmas (nome, ano) VALUES (%s, %s)", (nome, ano))
+            save_turma_availability(self.conn, cursor.lastrowid, self.mask_from_vars(self.tur_disp_vars),
+                                    self.dias_semana, self.horarios, self.grade_mask, commit=False)
             self.conn.commit()
+            self.schedule_repo.invalidate()
             show_message("Sucesso", f"Turma '{nome}' adicionada!", "info")
             self.clear_tur()
             self.refresh_tur_list()
@@ -754,8 +3795,11 @@ class SchoolApp:
         cursor = self.conn.cursor()
 
         self.data_text.insert(tk.END, "Professores:\n")
-        cursor.execute("SELECT nome, disponibilidade, preferencias FROM professores")
-        for nome, disp, pref in cursor.fetchall():
+        cursor.execute("SELECT id, nome, carga_horaria FROM materias")
+        materias = cursor.fetchall()
+        for _, nome, disp, pref in load_professores(cursor, materias, self.dias_semana, self.horarios, self.grade_mask):
+            disp = format_disponibilidade(disp, self.dias_semana, self.horarios, self.grade_mask)
+            pref = format_preferencias(pref, materias)
             self.data_text.insert(tk.END, f"- {nome} (Disp: {disp or 'Nenhuma'}, Pref: {pref or 'Nenhuma'})\n")
 
         self.data_text.insert(tk.END, "\nMatérias:\n")
@@ -769,11 +3813,57 @@ class SchoolApp:
             self.data_text.insert(tk.END, f"- {nome} (Ano: {ano})\n")
 
     def generate(self):
-        # Limpa apenas cronogramas antigos antes de gerar novo cronograma
-        cursor = self.conn.cursor()
-        cursor.execute("DELETE FROM cronogramas")
-        self.conn.commit()
-        ok = optimize_schedule(self.conn)
+        # O cronograma ativo continua visível durante a geração; a nova versão só o substitui no commit
+        if self.job is not None and self.job.running:
+            return
+        ensure_connection(self.conn)
+        self.solver_options.elastic = self.elastic_var.get()
+        self.solver_options.force_solve = self.force_var.get()
+        sqlite_path = getattr(self.conn, 'path', None) if getattr(self.conn, 'is_sqlite', False) else None
+        if sqlite_path == ':memory:':
+            # Outro processo não enxerga um banco em memória: gera aqui mesmo, como antes
+            self.finish_generation(optimize_schedule(self.conn, solver_options=self.solver_options))
+            return
+        self.job = GenerationJob(self.solver_options, sqlite_path).start()
+        self.generate_btn.configure(state='disabled')
+        self.cancel_btn.configure(state='normal')
+        self.progress_bar.start(10)
+        self.root.after(GENERATION_POLL_MS, self.poll_generation)
+
+    def poll_generation(self):
+        job = self.job
+        for evento in job.poll():
+            if evento[0] == 'mensagem':
+                show_message(*evento[1:])
+        if job.running:
+            self.progress_label.configure(text=f"{job.etapa} — {job.elapsed:.0f}s")
+            self.root.after(GENERATION_POLL_MS, self.poll_generation)
+        elif not job.cancelado:
+            self.progress_label.configure(text=f"Concluído em {job.elapsed:.0f}s" if job.resultado
+                                          else f"Falhou após {job.elapsed:.0f}s")
+            self.finish_generation(job.resultado)
+
+    def cancel_generation(self):
+        if self.job is None or not self.job.running:
+            return
+        self.job.cancel()
+        self.progress_label.configure(text=f"Cancelado após {self.job.elapsed:.0f}s")
+        self.finish_generation(False)
+
+    def on_close(self):
+        # Não deixa o processo de geração (e o CBC) órfão ao fechar a janela
+        if self.job is not None and self.job.running:
+            self.job.cancel()
+        logging.info(f"Cache do cronograma: {self.schedule_repo.metrics()}")
+        self.root.destroy()
+
+    def finish_generation(self, ok):
+        self.progress_bar.stop()
+        self.generate_btn.configure(state='normal')
+        self.cancel_btn.configure(state='disabled')
+        # Encerra a leitura aberta nesta conexão para enxergar a versão gravada pelo outro processo
+        ensure_connection(self.conn).commit()
+        self.schedule_repo.invalidate()
         if ok:
             # Atualiza a aba de tabela e seleciona-a
             self.refresh_schedule_table()
@@ -787,16 +3877,7 @@ class SchoolApp:
 
     def display_schedules(self):
         self.text_area.delete(1.0, tk.END)
-        cursor = self.conn.cursor()
-        cursor.execute("""
-        SELECT p.nome, m.nome, t.nome, c.dia_semana, c.horario_inicio, c.horario_fim
-        FROM cronogramas c
-        JOIN professores p ON c.professor_id = p.id
-        JOIN materias m ON c.materia_id = m.id
-        JOIN turmas t ON c.turma_id = t.id
-        ORDER BY p.nome, c.dia_semana, c.horario_inicio
-        """)
-        results = cursor.fetchall()
+        results = self.schedule_repo.rows('professor')
         if not results:
             self.text_area.insert(tk.END, "Nenhum cronograma gerado ainda.\n")
             return
@@ -814,9 +3895,11 @@ class SchoolApp:
             for iid in self.prof_tree.get_children():
                 self.prof_tree.delete(iid)
             cursor = self.conn.cursor()
-            cursor.execute("SELECT id, nome, disponibilidade, preferencias FROM professores ORDER BY id")
-            for pid, nome, disp, pref in cursor.fetchall():
-                self.prof_tree.insert('', 'end', iid=str(pid), values=(pid, nome, disp or '', pref or ''))
+            cursor.execute("SELECT id, nome, carga_horaria FROM materias")
+            materias = cursor.fetchall()
+            for pid, nome, disp, pref in load_professores(cursor, materias, self.dias_semana, self.horarios, self.grade_mask):
+                disp = format_disponibilidade(disp, self.dias_semana, self.horarios, self.grade_mask)
+                self.prof_tree.insert('', 'end', iid=str(pid), values=(pid, nome, disp, format_preferencias(pref, materias)))
         except Exception as e:
             logging.error(f"Falha ao atualizar lista de professores: {e}")
 
@@ -827,12 +3910,14 @@ class SchoolApp:
             return
         pid = int(sel[0])
         cursor = self.conn.cursor()
-        cursor.execute("SELECT nome, disponibilidade, preferencias FROM professores WHERE id = %s", (pid,))
-        row = cursor.fetchone()
+        cursor.execute("SELECT id, nome, carga_horaria FROM materias")
+        materias = cursor.fetchall()
+        professores = load_professores(cursor, materias, self.dias_semana, self.horarios, self.grade_mask)
+        row = next((p for p in professores if p[0] == pid), None)
         if not row:
             show_message("Erro", "Professor não encontrado.", "error")
             return
-        nome, disp, pref = row
+        _, nome, disp, pref = row
 
         win = tk.Toplevel(self.root)
         win.title("Editar Professor")
@@ -842,42 +3927,27 @@ class SchoolApp:
         nome_e.grid(row=0, column=1, padx=8, pady=6)
         nome_e.insert(0, nome)
 
-        dias_semana = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta']
-        ttk.Label(win, text="Disponibilidade:").grid(row=1, column=0, padx=8, pady=6, sticky='w')
-        disp_vars = {}
-        dias_frame = ttk.Frame(win)
-        dias_frame.grid(row=1, column=1, padx=0, pady=0, sticky='w')
-        cur_disp = disp.split(',') if disp else []
-        for i, d in enumerate(dias_semana):
-            var = tk.BooleanVar(value=(d in cur_disp))
-            cb = ttk.Checkbutton(dias_frame, text=d, variable=var)
-            cb.pack(side='left', padx=2)
-            disp_vars[d] = var
-
-        ttk.Label(win, text="Preferência (Matéria):").grid(row=2, column=0, padx=8, pady=6, sticky='w')
-        pref_mat_e = tk.Entry(win, font=("Segoe UI", 11))
-        pref_mat_e.grid(row=2, column=1, padx=8, pady=6)
-        pref_dia_e = ttk.Combobox(win, values=dias_semana, state='readonly')
-        pref_dia_e.grid(row=3, column=1, padx=8, pady=6)
-        if pref and ':' in pref:
-            pm, pd = pref.split(':', 1)
-            pref_mat_e.insert(0, pm)
-            pref_dia_e.set(pd)
+        ttk.Label(win, text="Disponibilidade:").grid(row=1, column=0, padx=8, pady=6, sticky='nw')
+        disp_vars = self.build_availability_grid(win, row=1, disponibilidade=disp)
+
+        ttk.Label(win, text="Preferências:").grid(row=2, column=0, padx=8, pady=6, sticky='nw')
+        prefs, _ = self.build_preferences_editor(win, row=2, preferencias=pref)
 
         def save():
             new_nome = nome_e.get().strip()
-            new_disp = [d for d, v in disp_vars.items() if v.get()]
-            new_pref_mat = pref_mat_e.get().strip()
-            new_pref_dia = pref_dia_e.get().strip()
-            new_pref = f"{new_pref_mat}:{new_pref_dia}" if new_pref_mat and new_pref_dia else ""
             try:
                 cursor.execute("UPDATE professores SET nome=%s, disponibilidade=%s, preferencias=%s WHERE id=%s",
-                               (new_nome, ','.join(new_disp), new_pref, pid))
+                               (new_nome, '', '', pid))
+                save_professor_availability(self.conn, pid, self.mask_from_vars(disp_vars),
+                                            self.dias_semana, self.horarios, commit=False)
+                save_professor_preferences(self.conn, pid, prefs, commit=False)
                 self.conn.commit()
+                self.schedule_repo.invalidate()
                 win.destroy()
                 self.refresh_prof_list()
                 show_message("Sucesso", "Professor atualizado.", "info")
             except Exception as e:
+                self.conn.rollback()
                 show_message("Erro", f"Falha ao atualizar professor: {e}", "error")
 
         ttk.Button(win, text="Salvar", command=save).grid(row=4, column=0, pady=10)
@@ -892,11 +3962,12 @@ class SchoolApp:
         if not messagebox.askyesno("Confirmar", "Excluir o professor selecionado?"):
             return
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("DELETE FROM professores WHERE id=%s", (pid,))
-            self.conn.commit()
+            delete_entity(self.conn, 'professores', pid)
+            self.schedule_repo.invalidate()
             self.refresh_prof_list()
             show_message("Sucesso", "Professor excluído.", "info")
+        except ValueError as e:
+            show_message("Aviso", f"Não foi possível excluir: {e}", "warning")
         except Exception as e:
             show_message("Erro", f"Falha ao excluir professor: {e}", "error")
 
@@ -942,6 +4013,7 @@ class SchoolApp:
                 c = int(carga_e.get().strip())
                 cursor.execute("UPDATE materias SET nome=%s, carga_horaria=%s WHERE id=%s", (n, c, mid))
                 self.conn.commit()
+                self.schedule_repo.invalidate()
                 win.destroy()
                 self.refresh_mat_list()
                 show_message("Sucesso", "Matéria atualizada.", "info")
@@ -960,11 +4032,12 @@ class SchoolApp:
         if not messagebox.askyesno("Confirmar", "Excluir a matéria selecionada?"):
             return
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("DELETE FROM materias WHERE id=%s", (mid,))
-            self.conn.commit()
+            delete_entity(self.conn, 'materias', mid)
+            self.schedule_repo.invalidate()
             self.refresh_mat_list()
             show_message("Sucesso", "Matéria excluída.", "info")
+        except ValueError as e:
+            show_message("Aviso", f"Não foi possível excluir: {e}", "warning")
         except Exception as e:
             show_message("Erro", f"Falha ao excluir matéria: {e}", "error")
 
@@ -1003,21 +4076,28 @@ class SchoolApp:
         ano_e = tk.Entry(win, font=("Segoe UI", 11))
         ano_e.grid(row=1, column=1, padx=8, pady=6)
         ano_e.insert(0, str(ano))
+        mask = next(t[2] for t in load_turmas(cursor, self.dias_semana, self.horarios, self.grade_mask) if t[0] == tid)
+        ttk.Label(win, text="Horários:").grid(row=2, column=0, padx=8, pady=6, sticky='nw')
+        disp_vars = self.build_availability_grid(win, row=2, disponibilidade=mask)
 
         def save():
             n = nome_e.get().strip()
             try:
                 a = int(ano_e.get().strip())
                 cursor.execute("UPDATE turmas SET nome=%s, ano=%s WHERE id=%s", (n, a, tid))
+                save_turma_availability(self.conn, tid, self.mask_from_vars(disp_vars),
+                                        self.dias_semana, self.horarios, self.grade_mask, commit=False)
                 self.conn.commit()
+                self.schedule_repo.invalidate()
                 win.destroy()
                 self.refresh_tur_list()
                 show_message("Sucesso", "Turma atualizada.", "info")
             except Exception as e:
+                self.conn.rollback()
                 show_message("Erro", f"Falha ao atualizar turma: {e}", "error")
 
-        ttk.Button(win, text="Salvar", command=save).grid(row=2, column=0, pady=10)
-        ttk.Button(win, text="Cancelar", command=win.destroy).grid(row=2, column=1, pady=10)
+        ttk.Button(win, text="Salvar", command=save).grid(row=3, column=0, pady=10)
+        ttk.Button(win, text="Cancelar", command=win.destroy).grid(row=3, column=1, pady=10)
 
     def delete_tur(self):
         sel = self.tur_tree.selection()
@@ -1028,27 +4108,21 @@ class SchoolApp:
         if not messagebox.askyesno("Confirmar", "Excluir a turma selecionada?"):
             return
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("DELETE FROM turmas WHERE id=%s", (tid,))
-            self.conn.commit()
+            delete_entity(self.conn, 'turmas', tid)
+            self.schedule_repo.invalidate()
             self.refresh_tur_list()
             show_message("Sucesso", "Turma excluída.", "info")
+        except ValueError as e:
+            show_message("Aviso", f"Não foi possível excluir: {e}", "warning")
         except Exception as e:
             show_message("Erro", f"Falha ao excluir turma: {e}", "error")
 
 
-def print_schedule_console(connection):
-    cursor = connection.cursor()
-    cursor.execute("""
-    SELECT p.nome, m.nome, t.nome, c.dia_semana, c.horario_inicio, c.horario_fim
-    FROM cronogramas c
-    JOIN professores p ON c.professor_id = p.id
-    JOIN materias m ON c.materia_id = m.id
-    JOIN turmas t ON c.turma_id = t.id
-    ORDER BY p.nome, c.dia_semana, c.horario_inicio
-    """)
-    rows = cursor.fetchall()
-    if not rows:
+def print_schedule_console(connection, repositorio=None):
+    repositorio = repositorio or ScheduleRepository(connection)
+    rows = repositorio.rows('professor')
+    faltas = repositorio.shortfall()
+    if not rows and not faltas:
         print("Nenhum cronograma gerado ainda.")
         return
     current = None
@@ -1057,6 +4131,10 @@ def print_schedule_console(connection):
             print(f"\nCronograma para {prof}:")
             current = prof
         print(f"- {dia}: {mat} para {tur} das {ini} às {fim}")
+    if faltas:
+        print("\nAulas não alocadas (cronograma parcial):")
+        for mat, tur, qtd in faltas:
+            print(f"- {tur}: {mat} ({qtd} aula(s))")
 
 
 def seed_sample_data(conn):
@@ -1069,9 +4147,9 @@ def seed_sample_data(conn):
     # Professores
     cursor.execute("INSERT INTO professores (nome, disponibilidade, preferencias) VALUES (%s, %s, %s)", ("Robson", "Segunda,Terça,Quarta", "Devops:Quarta"))
     cursor.execute("INSERT INTO professores (nome, disponibilidade, preferencias) VALUES (%s, %s, %s)", ("Belloni", "Segunda,Terça,Quarta", "TikTok:Terça"))
-    # Materias
-    cursor.execute("INSERT INTO materias (nome, carga_horaria) VALUES (%s, %s)", ("Devops", 10))
-    cursor.execute("INSERT INTO materias (nome, carga_horaria) VALUES (%s, %s)", ("TikTok", 10))
+    # Materias: a turma só tem aula quando há professor (Segunda a Quarta, 12 horários na grade padrão)
+    cursor.execute("INSERT INTO materias (nome, carga_horaria) VALUES (%s, %s)", ("Devops", 5))
+    cursor.execute("INSERT INTO materias (nome, carga_horaria) VALUES (%s, %s)", ("TikTok", 5))
     # Turmas
     cursor.execute("INSERT INTO turmas (nome, ano) VALUES (%s, %s)", ("Oitavo", 2))
     conn.commit()
@@ -1082,23 +4160,162 @@ def main():
     parser = argparse.ArgumentParser(description='School Scheduler')
     parser.add_argument('--headless', action='store_true', help='Run in headless mode (no GUI)')
     parser.add_argument('--seed-sample', action='store_true', help='Seed sample data before running (headless recommended)')
+    parser.add_argument('--solver', help='PuLP solver name, e.g. PULP_CBC_CMD, HiGHS_CMD (env SOLVER_NAME)')
+    parser.add_argument('--time-limit', type=float, help='Solver time limit in seconds (env SOLVER_TIME_LIMIT)')
+    parser.add_argument('--gap-rel', type=float, help='Relative MIP gap tolerance, e.g. 0.01 (env SOLVER_GAP_REL)')
+    parser.add_argument('--threads', type=int, help='Solver threads (env SOLVER_THREADS)')
+    parser.add_argument('--keep-solver-logs', action='store_true', help='Write solver logs to SOLVER_LOG_DIR (env SOLVER_KEEP_LOGS)')
+    parser.add_argument('--warm-start', action='store_true', help='Start the solver from the current schedule (env SOLVER_WARM_START)')
+    parser.add_argument('--formulation', choices=FORMULATIONS, help='MILP formulation (env SOLVER_FORMULATION)')
+    parser.add_argument('--engine', choices=ENGINES, help='Scheduling engine: MILP or fast heuristic (env SOLVER_ENGINE)')
+    parser.add_argument('--elastic', action='store_true', help='Save a partial schedule and a shortfall report when the data is infeasible (env SOLVER_ELASTIC)')
+    parser.add_argument('--force-solve', action='store_true',
+                        help='Solve even if the inputs match a stored schedule version (env SOLVER_FORCE_SOLVE)')
+    parser.add_argument('--list-versions', action='store_true', help='List stored schedule versions and exit')
+    parser.add_argument('--activate-version', type=int, metavar='ID', help='Make a stored schedule version active (rollback) and exit')
+    parser.add_argument('--verify', action='store_true', help='Scan the active schedule for double-bookings and exit')
+    parser.add_argument('--check', action='store_true', help='Run the pre-solve feasibility analysis and exit')
+    parser.add_argument('--serve', action='store_true', help='Run the HTTP/JSON API with a solve job queue (env SERVE_HOST, SERVE_PORT)')
+    parser.add_argument('--host', help='Bind address for --serve (default 0.0.0.0)')
+    parser.add_argument('--port', type=int, help='Port for --serve (default 8080)')
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help='Write Prometheus metrics of each solve to PATH (env SCHEDULE_METRICS_FILE)')
+    parser.add_argument('--profile', nargs='?', const='profiles', metavar='DIR',
+                        help='Capture cProfile and tracemalloc snapshots of model building into DIR (default ./profiles; env SOLVER_PROFILE_DIR)')
+    sub = parser.add_subparsers(dest='comando')
+    exportar = sub.add_parser('export', help='Stream the active schedule to CSV or NDJSON and exit (no display needed)')
+    exportar.add_argument('-o', '--output', help="Output file, '-' for stdout (default cronograma_<timestamp>.<format>)")
+    exportar.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help='Output format (default csv)')
+    exportar.add_argument('--professor', help='Only lessons of this professor (id or name)')
+    exportar.add_argument('--turma', help='Only lessons of this turma (id or name)')
+    exportar.add_argument('--dia', help='Only lessons on this day, e.g. Segunda')
+    exportar.add_argument('--batch-size', type=int, help='Rows per fetchmany (env EXPORT_FETCH_SIZE)')
+    exportar.add_argument('--sheets', choices=XLSX_SHEETS, default='unica',
+                          help='XLSX only: one sheet, one per turma or one per professor (default unica)')
     args = parser.parse_args()
 
+    solver_options = SolverOptions.from_env()
+    if args.solver:
+        solver_options.solver = args.solver
+    if args.time_limit is not None:
+        solver_options.time_limit = args.time_limit
+    if args.gap_rel is not None:
+        solver_options.gap_rel = args.gap_rel
+    if args.threads is not None:
+        solver_options.threads = args.threads
+    if args.keep_solver_logs:
+        solver_options.keep_logs = True
+    if args.warm_start:
+        solver_options.warm_start = True
+    if args.formulation:
+        solver_options.formulation = args.formulation
+    if args.engine:
+        solver_options.engine = args.engine
+    if args.elastic:
+        solver_options.elastic = True
+    if args.profile:
+        solver_options.profile_dir = args.profile
+    if args.force_solve:
+        solver_options.force_solve = True
+    metrics_file = args.metrics_file or METRICS_FILE or None
+
+    # Só a GUI e o modo serviço vivem o bastante para compensar um pool; o resto abre conexões diretas
+    avulso = (args.comando == 'export' or args.headless or args.list_versions or args.verify or args.check
+              or args.activate_version is not None)
+    if args.serve or not avulso:
+        init_pool()
     conn = create_connection()
     if not conn:
         logging.error("Não foi possível conectar ao banco de dados. Saindo.")
         sys.exit(1)
-    create_tables(conn)
+    # Na exportação para a saída padrão, só as linhas exportadas podem ir para o stdout
+    with redirect_stdout(sys.stderr if args.comando == 'export' else sys.stdout):
+        create_tables(conn)
+
+    if args.comando == 'export':
+        destino = args.output or f"cronograma_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{args.format}"
+        try:
+            filtros = {
+                'professor_id': resolve_entity_id(conn, 'professores', args.professor),
+                'turma_id': resolve_entity_id(conn, 'turmas', args.turma),
+                'dia': args.dia,
+            }
+            if args.format == 'xlsx':
+                if destino == '-':
+                    raise ValueError("XLSX não pode ser escrito na saída padrão; use -o ARQUIVO")
+                ordem = args.sheets if args.sheets != 'unica' else 'dia'
+                total = export_schedule_xlsx(stream_schedule_rows(conn, batch_size=args.batch_size, ordem=ordem, **filtros),
+                                             destino, args.sheets, xlsx_column_widths(conn))
+            else:
+                total = export_schedule(stream_schedule_rows(conn, batch_size=args.batch_size, **filtros),
+                                        destino, args.format)
+        except ImportError:
+            logging.error("openpyxl não está instalado. Instale com: pip install openpyxl")
+            conn.close()
+            sys.exit(1)
+        except (ValueError, OSError, Error, sqlite3.Error) as e:
+            logging.error(f"Falha ao exportar o cronograma: {e}")
+            conn.close()
+            sys.exit(1)
+        logging.info(f"{total} aulas exportadas para {'a saída padrão' if destino == '-' else destino}")
+        conn.close()
+        return
+
+    if args.list_versions:
+        for versao_id, criado_em, total, ativa in list_schedule_versions(conn):
+            marca = " (ativa)" if ativa else ""
+            print(f"{versao_id}\t{criado_em}\t{total} aulas{marca}")
+        conn.close()
+        return
+    if args.verify:
+        conflitos = verify_schedule(conn)
+        for linha in conflitos:
+            print(linha)
+        print(f"{len(conflitos)} conflitos no cronograma ativo")
+        conn.close()
+        sys.exit(1 if conflitos else 0)
+    if args.check:
+        falhas = check_feasibility(conn)
+        for linha in falhas:
+            print(linha)
+        print("Dados inviáveis" if falhas else "Nenhum impedimento encontrado")
+        conn.close()
+        sys.exit(1 if falhas else 0)
+    if args.activate_version is not None:
+        try:
+            activate_schedule_version(conn, args.activate_version)
+        except ValueError as e:
+            logging.error(str(e))
+            conn.close()
+            sys.exit(1)
+        print(f"Versão {args.activate_version} ativada")
+        conn.close()
+        return
+
+    if args.serve:
+        if args.seed_sample:
+            seed_sample_data(conn)
+        sqlite_path = conn.path if getattr(conn, 'is_sqlite', False) else None
+        conn.close()
+        if sqlite_path == ':memory:':
+            # Leituras e gerações usam conexões próprias, que não enxergam um banco em memória
+            logging.error("O modo serviço precisa do MySQL ou de um SQLite em arquivo (SQLITE_PATH).")
+            sys.exit(1)
+        try:
+            asyncio.run(serve(args.host, args.port, solver_options, sqlite_path, metrics_file))
+        except KeyboardInterrupt:
+            pass
+        return
 
     if args.headless:
         if args.seed_sample:
             seed_sample_data(conn)
-        # ensure cronogramas is clean
-        cur = conn.cursor()
-        cur.execute("DELETE FROM cronogramas")
-        conn.commit()
-        ok = optimize_schedule(conn)
-        if ok:
+        resultado = optimize_schedule(conn, solver_options=solver_options)
+        if metrics_file:
+            write_metrics_file(metrics_file, prometheus_metrics(resultado))
+        if resultado.perfis:
+            logging.info("Perfis da montagem: " + ", ".join(resultado.perfis))
+        if resultado:
             print_schedule_console(conn)
         conn.close()
         return
@@ -1114,7 +4331,7 @@ def main():
 
     try:
         root = tk.Tk()
-        SchoolApp(root, conn)
+        SchoolApp(root, conn, solver_options=solver_options)
         root.mainloop()
     except _tkinter.TclError as e:
         logging.error(f"Erro ao iniciar GUI: {e}")
@@ -0,0 +1,586 @@
+"""Benchmarks do otimizador de cronogramas (school_schedule.py).
+
+Cada subcomando gera uma instância sintética no banco configurado (MySQL ou o fallback SQLite),
+executa o cenário e imprime os resultados em JSON. `sweep` roda o pipeline inteiro de
+`optimize_schedule` etapa por etapa numa série de tamanhos e grava um relatório JSON com o commit,
+que `compare` confronta com o de outro commit para achar regressões.
+
+Uso, a partir da raiz do repositório:
+
+    python scripts/benchmark.py warm-start --professores 30 --materias 6 --turmas 6
+    python scripts/benchmark.py heuristic --tamanhos 20x5x4 40x8x8 60x12x15
+    python scripts/benchmark.py persist --linhas 1000 10000
+    python scripts/benchmark.py xlsx --linhas 10000 50000
+    python scripts/benchmark.py sweep --tamanhos 20x6x6 40x8x12 80x10x24 --aperto 0.7 -o base.json
+    python scripts/benchmark.py compare base.json atual.json --tolerancia 0.2
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+
+try:
+    import resource  # pico de memória (RSS) do processo; indisponível no Windows
+except ImportError:
+    resource = None
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import school_schedule as ss
+
+# Linhas do log do CBC que indicam a primeira solução inteira (heurística, MIPStart ou B&B)
+FIRST_SOLUTION_RE = re.compile(r"Solution found of|MIPStart provided solution|Integer solution of")
+
+
+def clear_instance(cursor):
+    """Apaga cadastros e cronogramas (versões e faltas incluídas) antes de gerar outra instância."""
+    cursor.execute("UPDATE cronograma_ativo SET versao_id = NULL")
+    for tabela in ("cronogramas", "cronograma_faltas", "cronograma_versoes", "professor_disponibilidade",
+                   "professor_preferencias", "turma_disponibilidade", "professores", "materias", "turmas"):
+        cursor.execute(f"DELETE FROM {tabela}")
+
+
+def generate_instance(conn, professores=30, materias=6, turmas=6, carga=2, dias_por_professor=3, seed=42):
+    """Popula professores/matérias/turmas com disponibilidade e preferências aleatórias."""
+    rng = random.Random(seed)
+    cursor = conn.cursor()
+    clear_instance(cursor)
+    nomes_materias = [f"Materia {i + 1}" for i in range(materias)]
+    for nome in nomes_materias:
+        cursor.execute("INSERT INTO materias (nome, carga_horaria) VALUES (%s, %s)", (nome, carga))
+    for i in range(turmas):
+        cursor.execute("INSERT INTO turmas (nome, ano) VALUES (%s, %s)", (f"Turma {i + 1}", 1 + i % 9))
+    for i in range(professores):
+        dias = sorted(rng.sample(ss.DIAS_SEMANA, dias_por_professor), key=ss.DIAS_SEMANA.index)
+        pref = f"{rng.choice(nomes_materias)}:{rng.choice(ss.DIAS_SEMANA)}"
+        cursor.execute("INSERT INTO professores (nome, disponibilidade, preferencias) VALUES (%s, %s, %s)",
+                       (f"Professor {i + 1}", ','.join(dias), pref))
+    conn.commit()
+
+
+def generate_school(conn, professores=30, materias=8, turmas=10, aperto=0.6, disponibilidade=0.6,
+                    preferencias=2, seed=42):
+    """Escola sintética gravada direto nas tabelas normalizadas, sobre a grade de `grade_horaria`.
+
+    Cada professor fica disponível numa fração `disponibilidade` dos slots da grade, sorteados, e
+    recebe até `preferencias` preferências (matéria, dia ou ambos) com peso de 1 a 9. `aperto` é a
+    fração da capacidade gargalo (slots de professor ou de turma, o que for menor) ocupada pela
+    carga: 1.0 exige usar tudo, valores baixos deixam folga. A carga de cada turma é dividida entre
+    as matérias com alguma variação, no mínimo 1 aula por matéria. Retorna o resumo da instância.
+    """
+    rng = random.Random(seed)
+    cursor = conn.cursor()
+    clear_instance(cursor)
+    dias_semana, horarios, grade_mask = ss.load_time_grid(cursor)
+    bits = [b for b in range(grade_mask.bit_length()) if grade_mask >> b & 1]
+    por_professor = min(len(bits), max(1, round(disponibilidade * len(bits))))
+    capacidade = min(professores * por_professor, turmas * len(bits))
+    por_turma = max(materias, int(aperto * capacidade / turmas))
+    cargas = [por_turma // materias + (i < por_turma % materias) for i in range(materias)]
+    for _ in range(materias):
+        i, j = rng.randrange(materias), rng.randrange(materias)
+        if cargas[i] > 1:
+            cargas[i] -= 1
+            cargas[j] += 1
+
+    materia_ids = []
+    for i, carga in enumerate(cargas):
+        cursor.execute("INSERT INTO materias (nome, carga_horaria) VALUES (%s, %s)", (f"Materia {i + 1}", carga))
+        materia_ids.append(cursor.lastrowid)
+    for i in range(turmas):
+        cursor.execute("INSERT INTO turmas (nome, ano) VALUES (%s, %s)", (f"Turma {i + 1}", 1 + i % 9))
+    for i in range(professores):
+        cursor.execute("INSERT INTO professores (nome, disponibilidade, preferencias) VALUES (%s, %s, %s)",
+                       (f"Professor {i + 1}", "", ""))
+        p_id = cursor.lastrowid
+        mask = sum(1 << b for b in rng.sample(bits, por_professor))
+        ss.save_professor_availability(conn, p_id, mask, dias_semana, horarios, commit=False)
+        escolhidas = []
+        for _ in range(rng.randint(0, preferencias)):
+            m_id, dia = rng.choice(materia_ids), rng.choice(dias_semana)
+            escolhidas.append(rng.choice([(m_id, None), (None, dia), (m_id, dia)]) + (rng.randint(1, 9),))
+        ss.save_professor_preferences(conn, p_id, escolhidas, commit=False)
+    conn.commit()
+    aulas = turmas * sum(cargas)
+    return {
+        'professores': professores,
+        'materias': materias,
+        'turmas': turmas,
+        'slots': len(bits),
+        'aulas': aulas,
+        'capacidade_professores': professores * por_professor,
+        'capacidade_turmas': turmas * len(bits),
+        'aperto': round(aulas / capacidade, 3),
+    }
+
+
+def load_inputs(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, nome, disponibilidade, preferencias FROM professores")
+    professores = cursor.fetchall()
+    cursor.execute("SELECT id, nome, carga_horaria FROM materias")
+    materias = cursor.fetchall()
+    cursor.execute("SELECT id, nome FROM turmas")
+    turmas = cursor.fetchall()
+    return professores, materias, turmas
+
+
+def timed_solve(professores, materias, turmas, options, log_name, warm_start=None):
+    """Resolve um componente acompanhando o log do CBC para medir o tempo até a 1ª solução viável."""
+    log_path = os.path.join(options.log_dir, f"{log_name}.log")
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    primeira = {}
+    fim = threading.Event()
+    inicio = time.perf_counter()
+
+    def acompanhar_log():
+        while not fim.is_set() and 'tempo' not in primeira:
+            try:
+                with open(log_path, encoding='utf-8', errors='replace') as f:
+                    if FIRST_SOLUTION_RE.search(f.read()):
+                        primeira['tempo'] = time.perf_counter() - inicio
+            except FileNotFoundError:
+                pass
+            time.sleep(0.005)
+
+    observador = threading.Thread(target=acompanhar_log, daemon=True)
+    observador.start()
+    status, atribuicoes, _ = ss.solve_component(professores, materias, turmas, ss.DIAS_SEMANA, ss.HORARIOS,
+                                                options, log_name, warm_start=warm_start)
+    total = time.perf_counter() - inicio
+    fim.set()
+    observador.join()
+    return {
+        'status': status,
+        'tempo_primeira_solucao': primeira.get('tempo'),
+        'tempo_total': total,
+        'atribuicoes': len(atribuicoes),
+    }, set(atribuicoes)
+
+
+def bench_warm_start(args):
+    conn = ss.create_connection()
+    ss.create_tables(conn)
+    generate_instance(conn, args.professores, args.materias, args.turmas, args.carga, seed=args.seed)
+    log_dir = tempfile.mkdtemp(prefix='bench_warm_')
+    options = ss.SolverOptions(time_limit=args.time_limit, keep_logs=True, log_dir=log_dir)
+
+    professores, materias, turmas = load_inputs(conn)
+    base, anterior = timed_solve(professores, materias, turmas, options, 'base')
+    if base['status'] not in ('Optimal', 'Feasible'):
+        print(json.dumps({'erro': f"instância base sem solução ({base['status']})"}))
+        return
+
+    # "Regenera" a instância: o professor com mais aulas perde um dia de disponibilidade
+    aulas = {}
+    for p_id, _, _, dia, _ in anterior:
+        aulas[p_id, dia] = aulas.get((p_id, dia), 0) + 1
+    (p_alterado, dia_removido), _ = max(aulas.items(), key=lambda kv: kv[1])
+    professores = [
+        (p[0], p[1], ','.join(d for d in p[2].split(',') if d != dia_removido), p[3]) if p[0] == p_alterado else p
+        for p in professores
+    ]
+
+    instancia = {k: v for k, v in vars(args).items() if k != 'func'}
+    resultados = {'instancia': instancia, 'alteracao': {'professor_id': p_alterado, 'dia_removido': dia_removido}}
+    for rotulo, inicial in (('sem_warm_start', None), ('com_warm_start', anterior)):
+        execucoes = [timed_solve(professores, materias, turmas, options, rotulo, warm_start=inicial)[0]
+                     for _ in range(args.repeticoes)]
+        resultados[rotulo] = {
+            'status': [e['status'] for e in execucoes],
+            'tempo_primeira_solucao': _media(e['tempo_primeira_solucao'] for e in execucoes),
+            'tempo_total': _media(e['tempo_total'] for e in execucoes),
+        }
+    conn.close()
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+
+def bench_heuristic(args):
+    """Compara custo e tempo do motor heurístico com o MILP (formulação agregada) em vários tamanhos."""
+    conn = ss.create_connection()
+    ss.create_tables(conn)
+    resultados = []
+    for tamanho in args.tamanhos:
+        n_prof, n_mat, n_tur = (int(v) for v in tamanho.split('x'))
+        generate_instance(conn, n_prof, n_mat, n_tur, args.carga, seed=args.seed)
+        professores, materias, turmas = load_inputs(conn)
+        linha = {'tamanho': tamanho}
+        motores = (
+            ('milp', ss.SolverOptions(formulation='aggregated', time_limit=args.time_limit)),
+            ('heuristica', ss.SolverOptions(engine='heuristic', heuristic_time=args.heuristic_time)),
+        )
+        for rotulo, options in motores:
+            inicio = time.perf_counter()
+            status, _, stats = ss.solve_component(professores, materias, turmas, ss.DIAS_SEMANA, ss.HORARIOS, options)
+            linha[rotulo] = {'status': status, 'custo': stats.get('objetivo'),
+                             'tempo': round(time.perf_counter() - inicio, 4)}
+        custo_milp, custo_heur = linha['milp']['custo'], linha['heuristica']['custo']
+        if custo_milp and custo_heur is not None:
+            linha['gap'] = round((custo_heur - custo_milp) / custo_milp, 4)
+        resultados.append(linha)
+    conn.close()
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+
+def bench_persist(args):
+    """Vazão de gravação do cronograma: um INSERT por aula (como antes) vs `persist_schedule` em lotes."""
+    conn = ss.create_connection()
+    ss.create_tables(conn)
+    # Atribuições sem conflito (os índices UNIQUE recusam double-booking): o par i de
+    # professor/turma ocupa todos os slots da semana, então são necessários linhas/slots pares.
+    slots = [(d, s) for d in ss.DIAS_SEMANA for s in range(len(ss.HORARIOS))]
+    pares = -(-max(args.linhas) // len(slots))
+    generate_instance(conn, professores=pares, materias=10, turmas=pares, seed=args.seed)
+    professores, materias, turmas = load_inputs(conn)
+    rng = random.Random(args.seed)
+    resultados = []
+    for n in args.linhas:
+        atribuicoes = [(professores[i // len(slots)][0], rng.choice(materias)[0], turmas[i // len(slots)][0],
+                        *slots[i % len(slots)]) for i in range(n)]
+
+        # Caminho antigo (um INSERT por aula) numa versão descartável, para não apagar as linhas das
+        # versões guardadas nem deixar cronograma_ativo apontando para uma versão vazia
+        cursor = conn.cursor()
+        inicio = time.perf_counter()
+        cursor.execute("INSERT INTO cronograma_versoes (criado_em, total_aulas) VALUES (%s, %s)",
+                       (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), n))
+        descartavel = cursor.lastrowid
+        for p_id, m_id, t_id, d, s in atribuicoes:
+            cursor.execute("""
+            INSERT INTO cronogramas (professor_id, materia_id, turma_id, dia_semana, horario_inicio, horario_fim, versao_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (p_id, m_id, t_id, d, ss.HORARIOS[s][0], ss.HORARIOS[s][1], descartavel))
+        conn.commit()
+        por_linha = time.perf_counter() - inicio
+        cursor.execute("DELETE FROM cronogramas WHERE versao_id = %s", (descartavel,))
+        cursor.execute("DELETE FROM cronograma_versoes WHERE id = %s", (descartavel,))
+        conn.commit()
+
+        inicio = time.perf_counter()
+        ss.persist_schedule(conn, atribuicoes, ss.HORARIOS, batch_size=args.batch_size)
+        em_lote = time.perf_counter() - inicio
+
+        resultados.append({
+            'linhas': n,
+            'backend': 'sqlite' if getattr(conn, 'is_sqlite', False) else 'mysql',
+            'insert_por_linha': {'tempo': round(por_linha, 4), 'linhas_por_s': round(n / por_linha)},
+            'executemany_em_lotes': {'tempo': round(em_lote, 4), 'linhas_por_s': round(n / em_lote)},
+        })
+    conn.close()
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+
+def _seed_schedule(conn, n, seed):
+    """Grava uma versão ativa com `n` aulas sem conflito (mesmo esquema de `bench_persist`)."""
+    slots = [(d, s) for d in ss.DIAS_SEMANA for s in range(len(ss.HORARIOS))]
+    pares = -(-n // len(slots))
+    generate_instance(conn, professores=pares, materias=10, turmas=pares, seed=seed)
+    professores, materias, turmas = load_inputs(conn)
+    rng = random.Random(seed)
+    atribuicoes = [(professores[i // len(slots)][0], rng.choice(materias)[0], turmas[i // len(slots)][0],
+                    *slots[i % len(slots)]) for i in range(n)]
+    ss.persist_schedule(conn, atribuicoes, ss.HORARIOS)
+
+
+def _xlsx_em_memoria(conn, destino):
+    """Exportação XLSX anterior: fetchall, Workbook em memória e larguras medidas célula a célula."""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill
+    rows = ss.load_schedule_rows(conn)
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Cronograma"
+    ws.append(list(ss.EXPORT_COLUNAS))
+    for col in range(1, len(ss.EXPORT_COLUNAS) + 1):
+        ws.cell(row=1, column=col).font = Font(bold=True, color="FFFFFF")
+        ws.cell(row=1, column=col).fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
+    for r in rows:
+        ws.append(list(r))
+    for column_cells in ws.columns:
+        length = max(len(str(cell.value or "")) for cell in column_cells)
+        ws.column_dimensions[column_cells[0].column_letter].width = min(max(length + 2, 12), 40)
+    ws.freeze_panes = "A2"
+    wb.save(destino)
+    return len(rows)
+
+
+def _xlsx_streaming(conn, destino, abas):
+    ordem = abas if abas != 'unica' else 'dia'
+    return ss.export_schedule_xlsx(ss.stream_schedule_rows(conn, ordem=ordem), destino, abas,
+                                   ss.xlsx_column_widths(conn))
+
+
+def _medir(funcao, *args):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    linhas = funcao(*args)
+    tempo = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'linhas': linhas, 'tempo': round(tempo, 4), 'pico_memoria_mb': round(pico / 2 ** 20, 2)}
+
+
+def bench_xlsx(args):
+    """Tempo e pico de memória (tracemalloc) do XLSX em memória vs `export_schedule_xlsx` em streaming."""
+    conn = ss.create_connection()
+    ss.create_tables(conn)
+    pasta = tempfile.mkdtemp(prefix='bench_xlsx_')
+    resultados = []
+    for n in args.linhas:
+        _seed_schedule(conn, n, args.seed)
+        destino = os.path.join(pasta, f"{n}.xlsx")
+        linha = {'linhas': n, 'em_memoria': _medir(_xlsx_em_memoria, conn, destino)}
+        for abas in args.abas:
+            linha[f'streaming_{abas}'] = _medir(_xlsx_streaming, conn, destino, abas)
+        resultados.append(linha)
+    conn.close()
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+
+ETAPAS = ('carga_dados', 'viabilidade', 'montagem', 'resolucao', 'persistencia', 'verificacao')
+
+
+def _pico_rss_mb():
+    """Pico de RSS deste processo. O do CBC fica de fora: no Linux o ru_maxrss dos filhos conta a
+    cópia do Python feita no fork antes do exec, o que tornaria o número enganoso."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KiB; macOS, bytes
+    return round(pico / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 1)
+
+
+def run_pipeline(tamanho, config):
+    """Executa gerar -> carregar -> viabilidade -> montar/resolver -> gravar -> verificar para um tamanho.
+
+    Roda num processo novo (ver `bench_sweep`), então o pico de RSS vale só para este tamanho. Os
+    componentes são resolvidos em sequência aqui mesmo, e a montagem do modelo é separada da
+    resolução pelo `tempo_montagem` que `solve_component` informa.
+    """
+    n_prof, n_mat, n_tur = (int(v) for v in tamanho.split('x'))
+    conn = ss.create_connection()
+    with redirect_stdout(sys.stderr):
+        ss.create_tables(conn)
+    instancia = generate_school(conn, n_prof, n_mat, n_tur, config['aperto'], config['disponibilidade'],
+                                seed=config['seed'])
+    options = ss.SolverOptions(time_limit=config['time_limit'], formulation=config['formulation'],
+                               engine=config['engine'], heuristic_time=config['heuristic_time'],
+                               elastic=config['elastic'])
+    tempos = dict.fromkeys(ETAPAS, 0.0)
+    resultado = {'tamanho': tamanho, 'backend': 'sqlite' if getattr(conn, 'is_sqlite', False) else 'mysql',
+                 'instancia': instancia, 'tempos': tempos}
+
+    inicio = time.perf_counter()
+    materias, dias_semana, horarios, _, turmas, professores = ss.load_schedule_inputs(conn.cursor())
+    tempos['carga_dados'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    falhas = ss.feasibility_problems(professores, materias, turmas, dias_semana, len(horarios))
+    tempos['viabilidade'] = time.perf_counter() - inicio
+    resultado['inviavel'] = bool(falhas)
+
+    status = 'Infeasible'
+    if not falhas or options.elastic:
+        componentes = ss.find_components(professores, turmas, dias_semana, len(horarios))
+        atribuicoes, faltas, situacoes = [], [], []
+        resultado.update(componentes=len(componentes), variaveis=0, restricoes=0, custo=0)
+        for profs, turmas_comp in componentes:
+            inicio = time.perf_counter()
+            situacao, atrib, stats = ss.solve_component(profs, materias, turmas_comp, dias_semana, horarios, options)
+            total = time.perf_counter() - inicio
+            montagem = stats.get('tempo_montagem', 0.0)
+            tempos['montagem'] += montagem
+            tempos['resolucao'] += total - montagem
+            resultado['variaveis'] += stats['variaveis']
+            resultado['restricoes'] += stats['restricoes']
+            resultado['custo'] += stats.get('objetivo') or 0
+            situacoes.append(situacao)
+            atribuicoes.extend(atrib)
+            faltas.extend(stats['faltas'])
+        falhou = [s for s in situacoes if s not in ('Optimal', 'Feasible')]
+        status = falhou[0] if falhou else 'Feasible' if 'Feasible' in situacoes else 'Optimal'
+        resultado.update(aulas=len(atribuicoes), faltas=sum(f[2] for f in faltas))
+        if not falhou:
+            inicio = time.perf_counter()
+            ss.persist_schedule(conn, atribuicoes, horarios, faltas=faltas)
+            tempos['persistencia'] = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            problemas = ss.validate_assignments(atribuicoes, professores, turmas, dias_semana, len(horarios))
+            problemas += ss.verify_schedule(conn)
+            tempos['verificacao'] = time.perf_counter() - inicio
+            resultado['conflitos'] = len(problemas)
+    conn.close()
+    resultado['status'] = status
+    resultado['tempos'] = {etapa: round(valor, 4) for etapa, valor in tempos.items()}
+    resultado['tempo_total'] = round(sum(tempos.values()), 4)
+    resultado['pico_rss_mb'] = _pico_rss_mb()
+    return resultado
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _gravar_json(dados, destino):
+    texto = json.dumps(dados, indent=2, ensure_ascii=False)
+    if destino in (None, '-'):
+        print(texto)
+        return
+    with open(destino, 'w', encoding='utf-8') as f:
+        f.write(texto + '\n')
+    print(f"Relatório gravado em {destino}", file=sys.stderr)
+
+
+def bench_sweep(args):
+    """Tempos por etapa e pico de memória de `optimize_schedule` numa série de tamanhos, em JSON."""
+    config = {
+        'aperto': args.aperto,
+        'disponibilidade': args.disponibilidade,
+        'seed': args.seed,
+        'engine': args.engine,
+        'formulation': args.formulation,
+        'time_limit': args.time_limit,
+        'heuristic_time': args.heuristic_time,
+        'elastic': args.elastic,
+    }
+    resultados = []
+    for tamanho in args.tamanhos:
+        # Um processo por tamanho: o pico de RSS de um não contamina o do próximo
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            resultado = pool.submit(run_pipeline, tamanho, config).result()
+        print(f"{tamanho}: {resultado['status']} em {resultado['tempo_total']}s", file=sys.stderr)
+        resultados.append(resultado)
+    _gravar_json({
+        'commit': _git_commit(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': config,
+        'resultados': resultados,
+    }, args.output)
+
+
+def compare_reports(base, atual, tolerancia=0.2, minimo=0.05):
+    """Compara dois relatórios do `sweep` tamanho a tamanho, etapa a etapa.
+
+    Uma etapa regride quando fica mais de `tolerancia` (fração) mais lenta e a diferença passa de
+    `minimo` segundos, para que ruído em etapas de milissegundos não dispare alarme. Mudança de
+    status (ex.: Optimal -> Feasible por limite de tempo) também conta como regressão.
+    """
+    anteriores = {r['tamanho']: r for r in base['resultados']}
+    linhas = []
+    for r in atual['resultados']:
+        antes = anteriores.get(r['tamanho'])
+        if antes is None:
+            continue
+        etapas = {}
+        for etapa in ETAPAS + ('tempo_total',):
+            t0 = antes['tempos'][etapa] if etapa in ETAPAS else antes[etapa]
+            t1 = r['tempos'][etapa] if etapa in ETAPAS else r[etapa]
+            etapas[etapa] = {'base': t0, 'atual': t1, 'razao': round(t1 / t0, 3) if t0 else None,
+                             'regressao': t1 - t0 > minimo and t1 > t0 * (1 + tolerancia)}
+        linhas.append({
+            'tamanho': r['tamanho'],
+            'status': [antes['status'], r['status']],
+            'etapas': etapas,
+            'regressao': antes['status'] != r['status'] or any(e['regressao'] for e in etapas.values()),
+        })
+    return {'base': base.get('commit'), 'atual': atual.get('commit'), 'comparacoes': linhas}
+
+
+def bench_compare(args):
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.atual, encoding='utf-8') as f:
+        atual = json.load(f)
+    relatorio = compare_reports(base, atual, args.tolerancia, args.minimo)
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    sys.exit(1 if any(c['regressao'] for c in relatorio['comparacoes']) else 0)
+
+
+def _media(valores):
+    valores = [v for v in valores if v is not None]
+    return round(sum(valores) / len(valores), 4) if valores else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks do School Scheduler')
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    warm = sub.add_parser('warm-start', help='tempo até a 1ª solução e até o ótimo, com e sem warm start')
+    warm.add_argument('--professores', type=int, default=30)
+    warm.add_argument('--materias', type=int, default=6)
+    warm.add_argument('--turmas', type=int, default=6)
+    warm.add_argument('--carga', type=int, default=2)
+    warm.add_argument('--seed', type=int, default=42)
+    warm.add_argument('--time-limit', type=float, default=None)
+    warm.add_argument('--repeticoes', type=int, default=3)
+    warm.set_defaults(func=bench_warm_start)
+
+    heur = sub.add_parser('heuristic', help='gap de custo e tempo do motor heurístico em relação ao MILP')
+    heur.add_argument('--tamanhos', nargs='+', default=['20x5x4', '40x8x8', '60x12x15'],
+                      help='instâncias no formato PROFESSORESxMATERIASxTURMAS')
+    heur.add_argument('--carga', type=int, default=1)
+    heur.add_argument('--seed', type=int, default=42)
+    heur.add_argument('--time-limit', type=float, default=300)
+    heur.add_argument('--heuristic-time', type=float, default=0.5)
+    heur.set_defaults(func=bench_heuristic)
+
+    persist = sub.add_parser('persist', help='vazão de INSERT no cronograma (por linha vs em lotes)')
+    persist.add_argument('--linhas', type=int, nargs='+', default=[1000, 10000, 50000])
+    persist.add_argument('--batch-size', type=int, default=None)
+    persist.add_argument('--seed', type=int, default=42)
+    persist.set_defaults(func=bench_persist)
+
+    xlsx = sub.add_parser('xlsx', help='tempo e memória da exportação XLSX (em memória vs write-only em streaming)')
+    xlsx.add_argument('--linhas', type=int, nargs='+', default=[10000, 50000])
+    xlsx.add_argument('--abas', nargs='+', choices=ss.XLSX_SHEETS, default=['unica', 'turma'])
+    xlsx.add_argument('--seed', type=int, default=42)
+    xlsx.set_defaults(func=bench_xlsx)
+
+    sweep = sub.add_parser('sweep', help='tempos por etapa e pico de memória do pipeline completo, por tamanho')
+    sweep.add_argument('--tamanhos', nargs='+', default=['10x4x3', '20x6x6', '40x8x12', '80x10x24'],
+                       help='instâncias no formato PROFESSORESxMATERIASxTURMAS')
+    sweep.add_argument('--aperto', type=float, default=0.6, help='fração da capacidade gargalo ocupada pela carga')
+    sweep.add_argument('--disponibilidade', type=float, default=0.6, help='fração dos slots livres por professor')
+    sweep.add_argument('--engine', choices=ss.ENGINES, default='milp')
+    sweep.add_argument('--formulation', choices=ss.FORMULATIONS, default='full')
+    sweep.add_argument('--time-limit', type=float, default=120)
+    sweep.add_argument('--heuristic-time', type=float, default=0.5)
+    sweep.add_argument('--elastic', action='store_true')
+    sweep.add_argument('--seed', type=int, default=42)
+    sweep.add_argument('-o', '--output', help="arquivo JSON do relatório ('-' ou omitido: saída padrão)")
+    sweep.set_defaults(func=bench_sweep)
+
+    compare = sub.add_parser('compare', help='compara dois relatórios do sweep; sai com 1 se houver regressão')
+    compare.add_argument('base')
+    compare.add_argument('atual')
+    compare.add_argument('--tolerancia', type=float, default=0.2, help='fração de piora tolerada por etapa')
+    compare.add_argument('--minimo', type=float, default=0.05, help='diferença mínima em segundos para contar')
+    compare.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
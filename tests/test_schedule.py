@@ -2,9 +2,57 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # Ajusta o caminho para importar do diretório pai
 
+import random
 import unittest
 import mysql.connector
+import sqlite3
 from school_schedule import create_connection, optimize_schedule, create_tables  # Import create_tables
+from school_schedule import build_schedule_model, find_components, solve_components, DIAS_SEMANA, HORARIOS
+from school_schedule import SolverOptions, load_warm_start, solve_component, schedule_cost, solve_heuristic
+from school_schedule import persist_schedule, activate_schedule_version, list_schedule_versions, verify_schedule, delete_entity
+from school_schedule import ConnectionPool, translate_placeholders
+from school_schedule import load_professores, save_professor_availability, save_professor_preferences, preference_costs
+from school_schedule import slot_bit, mask_slots, load_time_grid, load_turmas, save_turma_availability, validate_assignments
+from school_schedule import feasibility_problems, load_shortfall, connect_sqlite, GenerationJob
+from school_schedule import load_schedule_page, count_schedule_rows, plan_tree_updates, ScheduleRepository
+from school_schedule import stream_schedule_rows, export_schedule, export_schedule_xlsx, xlsx_column_widths
+from school_schedule import start_service, parse_job_options, prometheus_metrics
+from school_schedule import schedule_fingerprint, load_schedule_inputs, prune_schedule_versions, seed_sample_data
+from scripts.benchmark import generate_school, clear_instance, run_pipeline, compare_reports
+import school_schedule
+import asyncio
+import json
+import tempfile
+import time
+from unittest import mock
+
+try:
+    import openpyxl
+except ImportError:  # dependência opcional (exportação XLSX)
+    openpyxl = None
+
+
+def silencioso(*args):
+    """`notify` que não abre janelas: sem display, o messagebox do Tk falha a partir da 2ª chamada."""
+
+
+def semear(conn, disponibilidade="Segunda,Terça", carga=2, turmas=("Turma A",)):
+    """Cadastra o professor "Teste", a matéria "Matemática" e as turmas (limpos no tearDown).
+
+    Retorna (professor_id, materia_id, [turma_id, ...]).
+    """
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO professores (nome, disponibilidade, preferencias) VALUES (%s, %s, %s)", ("Teste", disponibilidade, ""))
+    p_id = cursor.lastrowid
+    cursor.execute("INSERT INTO materias (nome, carga_horaria) VALUES (%s, %s)", ("Matemática", carga))
+    m_id = cursor.lastrowid
+    turma_ids = []
+    for nome in turmas:
+        cursor.execute("INSERT INTO turmas (nome, ano) VALUES (%s, %s)", (nome, 2025))
+        turma_ids.append(cursor.lastrowid)
+    conn.commit()
+    return p_id, m_id, turma_ids
+
 
 class TestSchoolScheduler(unittest.TestCase):
     def setUp(self):
@@ -33,14 +81,693 @@ class TestSchoolScheduler(unittest.TestCase):
         self.assertGreater(count, 0)
         print("Teste de otimização passou")
 
+    def test_modelo_esparso(self):
+        professores = [(1, "A", "Segunda,Terça", ""), (2, "B", "Quarta", "")]
+        materias = [(1, "Matemática", 2), (2, "História", 1)]
+        turmas = [(1, "Turma A"), (2, "Turma B")]
+        _, x, stats = build_schedule_model(professores, materias, turmas, DIAS_SEMANA, HORARIOS)
+        # 3 dias disponíveis no total (2 + 1) em vez de 2 professores x 5 dias
+        self.assertEqual(stats['variaveis'], 3 * 2 * 2 * len(HORARIOS))
+        self.assertEqual(stats['variaveis_densas'], 2 * 5 * 2 * 2 * len(HORARIOS))
+        self.assertLess(stats['restricoes'], stats['restricoes_densas'])
+        self.assertTrue(all(d in ("Segunda", "Terça") for p, _, _, d, _ in x if p == 1))
+        self.assertEqual(stats['demandas_sem_professor'], [])
+        self.assertTrue({'objetivo', 'carga', 'professor', 'turma'} <= set(stats['tempos']))
+
+    def test_custo_preferencia(self):
+        professores = [(1, "A", "Segunda,Terça", "Matemática:Terça")]
+        materias = [(1, "Matemática", 1), (2, "História", 1)]
+        turmas = [(1, "Turma A")]
+        prob, x, _ = build_schedule_model(professores, materias, turmas, DIAS_SEMANA, HORARIOS)
+        custos = prob.objective
+        self.assertEqual(custos[x[1, 1, 1, "Terça", 0]], 1)
+        self.assertEqual(custos[x[1, 1, 1, "Segunda", 0]], 6)
+        self.assertEqual(custos[x[1, 2, 1, "Segunda", 0]], 11)
+
+    def test_componentes_em_paralelo(self):
+        professores = [(1, "A", "Segunda", ""), (2, "B", "", "")]
+        turmas = [(1, "Turma A"), (2, "Turma B")]
+        componentes = find_components(professores, turmas, DIAS_SEMANA)
+        self.assertEqual(len(componentes), 1)
+        self.assertEqual([p[0] for p in componentes[0][0]], [1])
+
+        # Dois blocos disjuntos montados à mão são resolvidos no pool de processos
+        materias = [(1, "Matemática", 2)]
+        blocos = [([(1, "A", "Segunda", "")], [(1, "Turma A")]),
+                  ([(2, "B", "Terça", "")], [(2, "Turma B")])]
+        resultados = solve_components(blocos, materias, DIAS_SEMANA, HORARIOS, max_workers=2)
+        self.assertEqual([status for status, _, _ in resultados], ["Optimal", "Optimal"])
+        self.assertEqual({a[2] for _, atrib, _ in resultados for a in atrib}, {1, 2})
+
+    def test_opcoes_do_solver_por_ambiente(self):
+        env = {"SOLVER_TIME_LIMIT": "30", "SOLVER_GAP_REL": "0.02", "SOLVER_THREADS": "4", "SOLVER_KEEP_LOGS": "true"}
+        with mock.patch.dict(os.environ, env):
+            opts = SolverOptions.from_env()
+        self.assertEqual((opts.solver, opts.time_limit, opts.gap_rel, opts.threads, opts.keep_logs),
+                         ("PULP_CBC_CMD", 30.0, 0.02, 4, True))
+        solver = opts.build("componente_1")
+        self.assertEqual(solver.timeLimit, 30.0)
+        self.assertEqual(solver.optionsDict.get("gapRel"), 0.02)
+        self.assertTrue(solver.optionsDict.get("logPath").endswith("componente_1.log"))
+
+    def test_warm_start_le_cronograma_atual(self):
+        cursor = self.conn.cursor()
+        # Linha legada (sem versão): a migração de create_tables a coloca numa versão ativa
+        cursor.execute("""
+        INSERT INTO cronogramas (professor_id, materia_id, turma_id, dia_semana, horario_inicio, horario_fim)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        """, (1, 2, 3, "Terça", "10:00:00", "11:00:00"))
+        self.conn.commit()
+        create_tables(self.conn)
+        self.assertEqual(load_warm_start(cursor, HORARIOS), {(1, 2, 3, "Terça", 2)})
+
+    def test_formulacao_agregada_equivalente(self):
+        rng = random.Random(7)
+        for _ in range(3):
+            materias = [(i, f"M{i}", rng.randint(1, 3)) for i in range(1, 4)]
+            turmas = [(i, f"T{i}") for i in range(1, 3)]
+            professores = [(i, f"P{i}", ",".join(rng.sample(DIAS_SEMANA, 2)),
+                            f"M{rng.randint(1, 3)}:{rng.choice(DIAS_SEMANA)}") for i in range(1, 5)]
+            resultados = {}
+            for formulacao in ("full", "aggregated"):
+                opts = SolverOptions(formulation=formulacao)
+                status, atribuicoes, stats = solve_component(professores, materias, turmas, DIAS_SEMANA, HORARIOS, opts)
+                self.assertEqual(status, "Optimal")
+                # cronograma reconstruído tem o mesmo custo que o objetivo do modelo
+                self.assertAlmostEqual(schedule_cost(professores, materias, DIAS_SEMANA, atribuicoes), stats['objetivo'])
+                self.assertEqual(len({(t, d, s) for _, _, t, d, s in atribuicoes}), len(atribuicoes))
+                self.assertEqual(len({(p, d, s) for p, _, _, d, s in atribuicoes}), len(atribuicoes))
+                resultados[formulacao] = stats
+            self.assertAlmostEqual(resultados["full"]['objetivo'], resultados["aggregated"]['objetivo'])
+            self.assertLess(resultados["aggregated"]['variaveis'], resultados["full"]['variaveis'])
+
+    def test_motor_heuristico(self):
+        rng = random.Random(3)
+        materias = [(i, f"M{i}", 2) for i in range(1, 4)]
+        turmas = [(i, f"T{i}") for i in range(1, 4)]
+        professores = [(i, f"P{i}", ",".join(rng.sample(DIAS_SEMANA, 3)),
+                        f"M{rng.randint(1, 3)}:{rng.choice(DIAS_SEMANA)}") for i in range(1, 7)]
+        status, atribuicoes, stats = solve_heuristic(professores, materias, turmas, DIAS_SEMANA, HORARIOS, time_limit=0.1)
+        self.assertEqual(status, "Feasible")
+        self.assertEqual(len(atribuicoes), 2 * 3 * 3)
+        self.assertEqual(len({(t, d, s) for _, _, t, d, s in atribuicoes}), len(atribuicoes))
+        self.assertEqual(len({(p, d, s) for p, _, _, d, s in atribuicoes}), len(atribuicoes))
+        disp = {p[0]: p[2].split(",") for p in professores}
+        self.assertTrue(all(d in disp[p] for p, _, _, d, _ in atribuicoes))
+        self.assertEqual(schedule_cost(professores, materias, DIAS_SEMANA, atribuicoes), stats['objetivo'])
+        _, _, milp = solve_component(professores, materias, turmas, DIAS_SEMANA, HORARIOS)
+        self.assertGreaterEqual(stats['objetivo'], milp['objetivo'])
+
+    def test_persistencia_em_lotes_e_transacional(self):
+        atribuicoes = [(1, 1, 1, d, s) for d in DIAS_SEMANA for s in range(len(HORARIOS))]
+        versao = persist_schedule(self.conn, atribuicoes, HORARIOS, batch_size=7)
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM cronogramas WHERE versao_id = %s", (versao,))
+        self.assertEqual(cursor.fetchone()[0], len(atribuicoes))
+
+        # Falha no meio da gravação não cria versão nem troca a ativa
+        with self.assertRaises((sqlite3.ProgrammingError, mysql.connector.errors.ProgrammingError)):
+            persist_schedule(self.conn, [(1, 1, 1, "Segunda", 0), (1, 1, 1, object(), 1)], HORARIOS, batch_size=1)
+        self.assertEqual(load_warm_start(cursor, HORARIOS), set(atribuicoes))
+        cursor.execute("SELECT COUNT(*) FROM cronogramas")
+        self.assertEqual(cursor.fetchone()[0], len(atribuicoes))
+
+    def test_exclusao_com_versoes_guardadas(self):
+        cursor = self.conn.cursor()
+        professores = []
+        for nome in ("Antigo", "Atual"):
+            cursor.execute("INSERT INTO professores (nome, disponibilidade, preferencias) VALUES (%s, %s, %s)",
+                           (nome, "Segunda", ""))
+            professores.append(cursor.lastrowid)
+        cursor.execute("INSERT INTO materias (nome, carga_horaria) VALUES (%s, %s)", ("Matemática", 1))
+        m_id = cursor.lastrowid
+        cursor.execute("INSERT INTO turmas (nome, ano) VALUES (%s, %s)", ("Turma A", 2025))
+        t_id = cursor.lastrowid
+        self.conn.commit()
+        antiga = persist_schedule(self.conn, [(professores[0], m_id, t_id, "Segunda", 0)], HORARIOS)
+        ativa = persist_schedule(self.conn, [(professores[1], m_id, t_id, "Segunda", 0)], HORARIOS)
+
+        # A versão antiga perderia o professor: sai junto com ele
+        self.assertEqual(delete_entity(self.conn, "professores", professores[0]), [antiga])
+        self.assertEqual([v[0] for v in list_schedule_versions(self.conn)], [ativa])
+        # O cronograma ativo bloqueia a exclusão, e nada muda
+        with self.assertRaises(ValueError):
+            delete_entity(self.conn, "professores", professores[1])
+        cursor.execute("SELECT COUNT(*) FROM professores")
+        self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_versoes_de_cronograma(self):
+        cursor = self.conn.cursor()
+        v1 = persist_schedule(self.conn, [(1, 1, 1, "Segunda", 0)], HORARIOS)
+        v2 = persist_schedule(self.conn, [(2, 2, 2, "Terça", 1)], HORARIOS)
+        self.assertEqual(load_warm_start(cursor, HORARIOS), {(2, 2, 2, "Terça", 1)})
+        # Rollback instantâneo para a versão anterior
+        activate_schedule_version(self.conn, v1)
+        self.assertEqual(load_warm_start(cursor, HORARIOS), {(1, 1, 1, "Segunda", 0)})
+        with self.assertRaises(ValueError):
+            activate_schedule_version(self.conn, v2 + 100)
+        # Retenção de 1 mantém a mais recente e a ativa (v1), mesmo sendo mais antiga
+        v3 = persist_schedule(self.conn, [(3, 3, 3, "Quarta", 2)], HORARIOS, retention=1)
+        self.assertEqual([v[0] for v in list_schedule_versions(self.conn)], [v3])
+        activate_schedule_version(self.conn, v3)
+        persist_schedule(self.conn, [(4, 4, 4, "Quinta", 3)], HORARIOS, retention=2)
+        versoes = list_schedule_versions(self.conn)
+        self.assertEqual(len(versoes), 2)
+        self.assertTrue(versoes[0][3])
+        cursor.execute("SELECT COUNT(*) FROM cronogramas")
+        self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_indices_impedem_conflitos(self):
+        create_tables(self.conn)  # migração de índices é idempotente
+        versao = persist_schedule(self.conn, [(1, 1, 1, "Segunda", 0), (2, 1, 2, "Segunda", 0)], HORARIOS)
+        self.assertEqual(verify_schedule(self.conn), [])
+        # Mesma turma no mesmo horário / mesmo professor no mesmo horário: recusado na gravação
+        for conflito in ([(1, 1, 1, "Terça", 0), (2, 2, 1, "Terça", 0)], [(1, 1, 1, "Terça", 0), (1, 2, 2, "Terça", 0)]):
+            with self.assertRaises((sqlite3.IntegrityError, mysql.connector.errors.IntegrityError)):
+                persist_schedule(self.conn, conflito, HORARIOS)
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT versao_id FROM cronograma_ativo")
+        self.assertEqual(cursor.fetchone()[0], versao)
+
+    def test_pool_de_conexoes(self):
+        livres = []
+        fake = mock.Mock()
+
+        def get_connection():
+            if not livres:
+                raise mysql.connector.errors.PoolError("Failed getting connection; pool exhausted")
+            return livres.pop()
+
+        fake.get_connection.side_effect = get_connection
+        with mock.patch("school_schedule.pooling.MySQLConnectionPool", return_value=fake):
+            pool = ConnectionPool(size=2, timeout=0.05, host="db")
+        conexoes = [mock.Mock(), mock.Mock()]
+        conexoes[1].ping.side_effect = mysql.connector.errors.OperationalError("MySQL server has gone away")
+        for c in conexoes:
+            c.close.side_effect = lambda c=c: livres.append(c)
+        livres.extend(conexoes)
+
+        with pool.connection(), pool.connection():
+            self.assertEqual(pool.metrics()['em_uso'], 2)
+            with self.assertRaises(mysql.connector.errors.PoolError):
+                pool.acquire()
+        # conexão velha foi reconectada no health check; ambas voltaram ao pool
+        conexoes[1].reconnect.assert_called_once()
+        m = pool.metrics()
+        self.assertEqual((m['em_uso'], m['emprestimos'], m['reconexoes'], m['esgotamentos']), (0, 2, 1, 1))
+        # close() repetido não desconta duas vezes
+        conexao = pool.acquire()
+        self.assertEqual(pool.metrics()['em_uso'], 1)
+        conexao.close()
+        conexao.close()
+        self.assertEqual(pool.metrics()['em_uso'], 0)
+
+    def test_pool_so_com_init_pool(self):
+        with (mock.patch.multiple(school_schedule, DB_BACKEND="mysql", _pool=None),
+              mock.patch("mysql.connector.connect") as connect,
+              mock.patch.object(school_schedule, "ConnectionPool") as pool_cls):
+            # Processo avulso (worker, --headless, export): conexão direta, sem abrir um pool
+            self.assertIs(create_connection(), connect.return_value)
+            pool_cls.assert_not_called()
+            # GUI / --serve: create_connection passa a emprestar do pool do processo
+            self.assertIs(school_schedule.init_pool(size=2), pool_cls.return_value)
+            self.assertIs(create_connection(), pool_cls.return_value.acquire.return_value)
+            self.assertEqual((connect.call_count, pool_cls.call_args.kwargs["size"]), (1, 2))
+
+    def test_placeholders_sqlite(self):
+        sql = "SELECT '%s', \"%s\" FROM t WHERE a = %s AND b LIKE 'x''%s' -- %s\nAND c = %s"
+        self.assertEqual(translate_placeholders(sql),
+                         "SELECT '%s', \"%s\" FROM t WHERE a = ? AND b LIKE 'x''%s' -- %s\nAND c = ?")
+
+    def test_backend_sqlite_em_arquivo(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho = os.path.join(tmp, "escola.db")
+            with mock.patch.multiple(school_schedule, DB_BACKEND="sqlite", SQLITE_PATH=caminho):
+                conn = create_connection()
+                create_tables(conn)
+                persist_schedule(conn, [(1, 1, 1, "Segunda", 0)], HORARIOS)
+                cursor = conn.cursor()
+                cursor.execute("PRAGMA journal_mode")
+                self.assertEqual(cursor.fetchone()[0], "wal")
+                conn.close()
+                # Os dados sobrevivem ao fechamento da conexão
+                conn = create_connection()
+                self.assertEqual(load_warm_start(conn.cursor(), HORARIOS), {(1, 1, 1, "Segunda", 0)})
+                conn.close()
+
+    def test_geracao_em_segundo_plano(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho = os.path.join(tmp, "escola.db")
+            conn = connect_sqlite(caminho)
+            create_tables(conn)
+            semear(conn)
+
+            job = GenerationJob(SolverOptions(), caminho).start()
+            eventos = []
+            while job.running:
+                eventos.extend(job.poll())
+                time.sleep(0.05)
+            self.assertTrue(job.resultado)
+            self.assertIn(('progresso', "Componente 1/1: Optimal"), eventos)
+            self.assertEqual(eventos[-1], ('fim', True))
+            # A versão gravada pelo outro processo já é a ativa nesta conexão
+            self.assertEqual(len(load_warm_start(conn.cursor(), HORARIOS)), 2)
+
+            job = GenerationJob(SolverOptions(), caminho).start()
+            job.cancel()
+            self.assertFalse(job.running)
+            self.assertTrue(job.cancelado)
+            self.assertFalse(job._processo.is_alive())
+            conn.close()
+
+    def test_api_http_com_fila_de_geracao(self):
+        async def requisitar(porta, metodo, caminho, corpo=None, texto=False):
+            reader, writer = await asyncio.open_connection("127.0.0.1", porta)
+            dados = json.dumps(corpo).encode() if corpo is not None else b""
+            writer.write(f"{metodo} {caminho} HTTP/1.1\r\nHost: teste\r\nContent-Length: {len(dados)}\r\n\r\n".encode()
+                         + dados)
+            resposta = await reader.read()
+            writer.close()
+            cabecalho, _, corpo = resposta.partition(b"\r\n\r\n")
+            return int(cabecalho.split()[1]), corpo.decode() if texto else json.loads(corpo)
+
+        async def cenario(caminho):
+            servidor, fila = await start_service("127.0.0.1", 0, SolverOptions(), caminho)
+            porta = servidor.sockets[0].getsockname()[1]
+            try:
+                self.assertEqual((await requisitar(porta, "GET", "/turmas"))[1][0]["nome"], "Turma A")
+                status, job = await requisitar(porta, "POST", "/jobs", {"engine": "heuristic"})
+                self.assertEqual((status, job["status"]), (202, "pendente"))
+                self.assertEqual((await requisitar(porta, "POST", "/jobs", {"engine": "x"}))[0], 400)
+                self.assertEqual((await requisitar(porta, "DELETE", "/jobs"))[0], 405)
+                self.assertEqual((await requisitar(porta, "GET", "/jobs/99"))[0], 404)
+                while job["status"] in ("pendente", "executando"):
+                    await asyncio.sleep(0.05)
+                    job = (await requisitar(porta, "GET", f"/jobs/{job['id']}"))[1]
+                self.assertEqual(job["status"], "concluido", job["mensagens"])
+                self.assertIsNotNone(job["versao_id"])
+                self.assertEqual(job["resultado"]["aulas"], 2)
+                _, metricas = await requisitar(porta, "GET", "/metrics", texto=True)
+                self.assertIn('school_schedule_solves_total{result="ok"} 1', metricas)
+                self.assertIn("school_schedule_last_lessons 2", metricas)
+                status, pagina = await requisitar(porta, "GET", "/cronograma?turma=Turma%20A&limit=1")
+                self.assertEqual((status, pagina["total"], len(pagina["aulas"])), (200, 2, 1))
+                self.assertEqual(pagina["aulas"][0]["materia"], "Matemática")
+                # Pedidos idênticos enquanto o job espera na fila viram um só
+                primeiro, novo = fila.submit()
+                segundo, repetido = fila.submit()
+                self.assertIs(primeiro, segundo)
+                self.assertEqual((novo, repetido, segundo.pedidos), (True, False, 2))
+            finally:
+                servidor.close()
+                await servidor.wait_closed()
+                await fila.close()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho = os.path.join(tmp, "escola.db")
+            conn = connect_sqlite(caminho)
+            create_tables(conn)
+            semear(conn)
+            conn.close()
+            asyncio.run(cenario(caminho))
+
+        opcoes = parse_job_options({"elastic": True, "time_limit": 5}, SolverOptions())
+        self.assertEqual((opcoes.elastic, opcoes.time_limit), (True, 5.0))
+        for invalido in ({"solver": "GUROBI_CMD"}, {"threads": 1.5}, {"elastic": "sim"}, []):
+            with self.assertRaises(ValueError):
+                parse_job_options(invalido, SolverOptions())
+
+    def test_fila_sobrevive_a_erro_no_job(self):
+        async def executar(job):
+            if job.solver_options.engine == "heuristic":
+                raise RuntimeError("banco indisponível")
+            job.status = 'concluido'
+
+        async def cenario():
+            fila = school_schedule.SolveQueue(SolverOptions(), workers=1)
+            fila._fila = asyncio.Queue()
+            with mock.patch.object(fila, "_executar", executar):
+                tarefa = asyncio.create_task(fila._consumir())
+                falho, _ = fila.submit(SolverOptions(engine="heuristic"))
+                seguinte, _ = fila.submit(SolverOptions(engine="milp"))
+                while not seguinte.terminado and not tarefa.done():
+                    await asyncio.sleep(0.01)
+                tarefa.cancel()
+            return fila, falho, seguinte
+
+        fila, falho, seguinte = asyncio.run(cenario())
+        self.assertEqual((falho.status, seguinte.status), ("falhou", "concluido"))
+        self.assertIn("banco indisponível", falho.mensagens[0][1])
+        self.assertEqual(fila.totais["falha"], 1)
+
+    def test_gerador_sintetico_e_sweep(self):
+        cursor = self.conn.cursor()
+        try:
+            resumo = generate_school(self.conn, professores=6, materias=3, turmas=4, aperto=0.5, disponibilidade=0.5)
+            dias, horarios, grade = load_time_grid(cursor)
+            self.assertEqual(resumo["slots"], grade.bit_count())
+            # Gargalo: 6 professores x 10 slots = 60 < 4 turmas x 20 slots; metade disso em aulas
+            self.assertEqual((resumo["capacidade_professores"], resumo["aulas"]), (60, 28))
+            cursor.execute("SELECT SUM(carga_horaria), MIN(carga_horaria) FROM materias")
+            self.assertEqual(cursor.fetchone(), (7, 1))
+            materias, _, _, _, turmas, professores = school_schedule.load_schedule_inputs(cursor)
+            self.assertEqual({p[2].bit_count() for p in professores}, {10})
+            self.assertEqual(feasibility_problems(professores, materias, turmas, dias, len(horarios)), [])
+        finally:
+            clear_instance(cursor)
+            self.conn.commit()
+
+        config = {"aperto": 0.5, "disponibilidade": 0.5, "seed": 1, "engine": "heuristic", "formulation": "full",
+                  "time_limit": None, "heuristic_time": 0.05, "elastic": False}
+        resultado = run_pipeline("6x3x2", config)
+        clear_instance(cursor)  # no MySQL o pipeline gravou no mesmo banco do teste
+        self.conn.commit()
+        self.assertEqual((resultado["status"], resultado["conflitos"]), ("Feasible", 0))
+        self.assertEqual(resultado["aulas"], resultado["instancia"]["aulas"])
+        self.assertTrue(all(v >= 0 for v in resultado["tempos"].values()))
+
+        lento = json.loads(json.dumps(resultado))
+        lento["tempos"]["resolucao"] += 1.0
+        lento["tempo_total"] += 1.0
+        comparacao = compare_reports({"resultados": [resultado]}, {"resultados": [lento]})["comparacoes"][0]
+        self.assertTrue(comparacao["etapas"]["resolucao"]["regressao"])
+        self.assertFalse(comparacao["etapas"]["carga_dados"]["regressao"])
+        self.assertFalse(compare_reports({"resultados": [resultado]},
+                                         {"resultados": [resultado]})["comparacoes"][0]["regressao"])
+
+    def test_instrumentacao_da_geracao(self):
+        vazio = optimize_schedule(self.conn, notify=silencioso)
+        self.assertFalse(vazio)
+        self.assertEqual(vazio.status, "NoData")
+
+        semear(self.conn)
+        with tempfile.TemporaryDirectory() as tmp:
+            resultado = optimize_schedule(self.conn, solver_options=SolverOptions(profile_dir=tmp),
+                                          notify=silencioso)
+            self.assertTrue(resultado)
+            self.assertEqual((resultado.status, resultado.aulas, resultado.componentes), ("Optimal", 2, 1))
+            self.assertTrue({"carga_dados", "viabilidade", "montagem", "solver", "gravacao", "total"}
+                            <= set(resultado.tempos))
+            self.assertGreaterEqual(resultado.nao_nulos, resultado.variaveis)
+            self.assertEqual(sorted(os.path.basename(f) for f in resultado.perfis),
+                             sorted(os.listdir(tmp)))
+        texto = prometheus_metrics(resultado)
+        self.assertIn('school_schedule_last_status{status="Optimal"} 1', texto)
+        self.assertIn(f"school_schedule_last_model_nonzeros {resultado.nao_nulos}", texto)
+        self.assertIn('school_schedule_last_phase_seconds{phase="montagem"}', texto)
+
+    def test_cache_por_impressao_digital(self):
+        cursor = self.conn.cursor()
+        semear(self.conn)
+
+        entrada = load_schedule_inputs(self.conn.cursor())
+        impressao = schedule_fingerprint(*entrada, SolverOptions())
+        self.assertEqual(impressao, schedule_fingerprint(*entrada, SolverOptions(keep_logs=True, force_solve=True)))
+        self.assertNotEqual(impressao, schedule_fingerprint(*entrada, SolverOptions(elastic=True)))
+        cursor.execute("UPDATE turmas SET nome = %s", ("Turma B",))
+        self.assertEqual(impressao, schedule_fingerprint(*load_schedule_inputs(self.conn.cursor()), SolverOptions()))
+
+        primeira = optimize_schedule(self.conn, solver_options=SolverOptions(), notify=silencioso)
+        self.assertEqual((primeira.status, primeira.impressao), ("Optimal", impressao))
+        reuso = optimize_schedule(self.conn, solver_options=SolverOptions(), notify=silencioso)
+        self.assertEqual((reuso.status, reuso.versao_id, reuso.aulas), ("Cached", primeira.versao_id, 2))
+        self.assertNotIn("resolucao", reuso.tempos)
+        forcada = optimize_schedule(self.conn, solver_options=SolverOptions(force_solve=True), notify=silencioso)
+        self.assertEqual(forcada.status, "Optimal")
+        self.assertNotEqual(forcada.versao_id, primeira.versao_id)
+
+        cursor.execute("UPDATE materias SET carga_horaria = 1")
+        self.conn.commit()
+        outra = optimize_schedule(self.conn, solver_options=SolverOptions(), notify=silencioso)
+        self.assertEqual((outra.status, outra.aulas), ("Optimal", 1))
+        # LRU: a versão reaproveitada por último sobrevive à retenção; a ativa nunca sai
+        cursor.execute("UPDATE cronograma_versoes SET usado_em = %s WHERE id = %s", ("2099-01-01 00:00:00", primeira.versao_id))
+        self.conn.commit()
+        prune_schedule_versions(self.conn, retention=1)
+        self.assertEqual([v[0] for v in list_schedule_versions(self.conn)], [outra.versao_id, primeira.versao_id])
+
+    def test_tabela_incremental_e_filtros(self):
+        p_id, m_id, turmas = semear(self.conn, turmas=("Turma A", "Turma B"))
+        aulas = [(p_id, m_id, turmas[s % 2], d, s) for d in ("Segunda", "Terça") for s in range(4)]
+        persist_schedule(self.conn, aulas, HORARIOS)
+
+        self.assertEqual(count_schedule_rows(self.conn), 8)
+        self.assertEqual(count_schedule_rows(self.conn, turma_id=turmas[0], dia="Terça"), 2)
+        pagina = load_schedule_page(self.conn, limit=3, offset=3)
+        self.assertEqual([valores[3:5] for _, valores in pagina],
+                         [("Segunda", "11:00:00"), ("Terça", "08:00:00"), ("Terça", "09:00:00")])
+        exibidas = load_schedule_page(self.conn)
+
+        # Nova versão: o último horário de Terça passa da Turma B para a Turma A; o resto não muda
+        aulas[-1] = (p_id, m_id, turmas[0], "Terça", 3)
+        persist_schedule(self.conn, aulas, HORARIOS)
+        novas = load_schedule_page(self.conn)
+        operacoes = plan_tree_updates(exibidas, novas)
+        self.assertEqual([op[0] for op in operacoes], ['delete', 'insert'])
+
+        def aplicar(linhas, operacoes):
+            linhas = list(linhas)
+            for op in operacoes:
+                if op[0] == 'delete':
+                    linhas = [linha for linha in linhas if linha[0] not in op[1]]
+                elif op[0] == 'update':
+                    linhas = [(c, op[2] if c == op[1] else v) for c, v in linhas]
+                elif op[0] == 'move':
+                    linha = next(linha for linha in linhas if linha[0] == op[1])
+                    linhas.remove(linha)
+                    linhas.insert(op[2], linha)
+                else:
+                    linhas.insert(op[1], (op[2], op[3]))
+            return linhas
+
+        self.assertEqual(aplicar(exibidas, operacoes), novas)
+        embaralhadas = [novas[2], ("x", ()), novas[0], (novas[1][0], ("outro",))]
+        self.assertEqual(aplicar(embaralhadas, plan_tree_updates(embaralhadas, novas)), novas)
+
+    def test_repositorio_com_cache(self):
+        p_id, m_id, (t_id,) = semear(self.conn, "Segunda", carga=1)
+        persist_schedule(self.conn, [(p_id, m_id, t_id, "Segunda", 1)], HORARIOS)
+
+        repositorio = ScheduleRepository(self.conn)
+        esperado = [("Teste", "Matemática", "Turma A", "Segunda", "09:00:00", "10:00:00")]
+        self.assertEqual(repositorio.rows(), esperado)
+        with mock.patch.object(school_schedule, "load_schedule_rows") as consulta:
+            self.assertEqual(repositorio.rows(), esperado)
+            consulta.assert_not_called()
+        self.assertEqual(repositorio.count(), 1)
+        self.assertEqual(repositorio.count(), 1)
+        self.assertEqual((repositorio.hits, repositorio.misses), (2, 2))
+
+        # Uma escrita invalida: a próxima leitura volta ao banco e vê a nova versão
+        persist_schedule(self.conn, [(p_id, m_id, t_id, "Segunda", 2)], HORARIOS)
+        self.assertEqual(repositorio.rows(), esperado)
+        repositorio.invalidate()
+        self.assertEqual(repositorio.rows()[0][4], "10:00:00")
+        self.assertEqual(repositorio.metrics()["geracao"], 1)
+        self.assertEqual(repositorio.metrics()["misses"], 3)
+
+    def test_exportacao_em_streaming(self):
+        p_id, m_id, (t_id,) = semear(self.conn, "Segunda", carga=3)
+        persist_schedule(self.conn, [(p_id, m_id, t_id, "Segunda", s) for s in range(3)], HORARIOS)
+
+        linhas = stream_schedule_rows(self.conn, turma_id=t_id, batch_size=1)
+        self.assertEqual(next(linhas), ("Teste", "Matemática", "Turma A", "Segunda", "08:00:00", "09:00:00"))
+        linhas.close()
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho = os.path.join(tmp, "cronograma.ndjson")
+            self.assertEqual(export_schedule(stream_schedule_rows(self.conn, batch_size=2), caminho, "ndjson"), 3)
+            with open(caminho, encoding="utf-8") as f:
+                registros = [json.loads(linha) for linha in f]
+            self.assertEqual([r["inicio"] for r in registros], ["08:00:00", "09:00:00", "10:00:00"])
+            self.assertEqual(registros[0]["materia"], "Matemática")
+
+            caminho = os.path.join(tmp, "cronograma.csv")
+            self.assertEqual(export_schedule(stream_schedule_rows(self.conn, dia="Terça"), caminho), 0)
+            with open(caminho, encoding="utf-8") as f:
+                self.assertEqual(f.read().strip(), "Professor,Matéria,Turma,Dia,Início,Fim")
+            # Nenhum .tmp fica para trás
+            self.assertEqual(sorted(os.listdir(tmp)), ["cronograma.csv", "cronograma.ndjson"])
+            # XLSX tem função própria: aqui é recusado antes de criar qualquer arquivo
+            with self.assertRaises(ValueError):
+                export_schedule([], os.path.join(tmp, "cronograma.xlsx"), "xlsx")
+            self.assertEqual(len(os.listdir(tmp)), 2)
+
+    @unittest.skipUnless(openpyxl, "openpyxl não instalado")
+    def test_exportacao_xlsx_em_streaming(self):
+        cursor = self.conn.cursor()
+        cursor.execute("INSERT INTO professores (nome, disponibilidade, preferencias) VALUES (%s, %s, %s)",
+                       ("Professora com um nome bem comprido", "Segunda", ""))
+        p_id = cursor.lastrowid
+        cursor.execute("INSERT INTO materias (nome, carga_horaria) VALUES (%s, %s)", ("Matemática", 2))
+        m_id = cursor.lastrowid
+        turmas = []
+        for nome in ("Turma A", "Turma B"):
+            cursor.execute("INSERT INTO turmas (nome, ano) VALUES (%s, %s)", (nome, 2025))
+            turmas.append(cursor.lastrowid)
+        self.conn.commit()
+        persist_schedule(self.conn, [(p_id, m_id, t, "Segunda", s) for s, t in enumerate(turmas)], HORARIOS)
+
+        larguras = xlsx_column_widths(self.conn)
+        self.assertEqual(larguras[0], len("Professora com um nome bem comprido") + 2)
+        self.assertEqual(larguras[4:], [12, 12])
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho = os.path.join(tmp, "cronograma.xlsx")
+            linhas = stream_schedule_rows(self.conn, ordem="turma", batch_size=1)
+            self.assertEqual(export_schedule_xlsx(linhas, caminho, "turma", larguras), 2)
+            wb = openpyxl.load_workbook(caminho)
+            self.assertEqual(wb.sheetnames, ["Turma A", "Turma B"])
+            ws = wb["Turma B"]
+            self.assertEqual([c.value for c in ws[1]], ["Professor", "Matéria", "Turma", "Dia", "Início", "Fim"])
+            self.assertTrue(ws["A1"].font.b)
+            self.assertEqual(ws.freeze_panes, "A2")
+            self.assertEqual(ws.column_dimensions["A"].width, larguras[0])
+            self.assertEqual([c.value for c in ws[2]][2:5], ["Turma B", "Segunda", "09:00:00"])
+            self.assertEqual(ws.max_row, 2)
+            self.assertEqual(os.listdir(tmp), ["cronograma.xlsx"])
+
+    def test_disponibilidade_e_preferencias_normalizadas(self):
+        cursor = self.conn.cursor()
+        cursor.execute("INSERT INTO materias (nome, carga_horaria) VALUES (%s, %s)", ("Matemática", 2))
+        m_id = cursor.lastrowid
+        cursor.execute("INSERT INTO professores (nome, disponibilidade, preferencias) VALUES (%s, %s, %s)",
+                       ("Teste", "Segunda,Terça", "Matemática:Terça"))
+        p_id = cursor.lastrowid
+        self.conn.commit()
+        materias = [(m_id, "Matemática", 2)]
+        # Migração das colunas legadas: dia inteiro -> todos os horários do dia
+        create_tables(self.conn)
+        create_tables(self.conn)
+        (_, _, disp, prefs), = load_professores(cursor, materias, DIAS_SEMANA, HORARIOS)
+        self.assertEqual(disp, 0b1111_1111)  # Segunda e Terça inteiras: bits 0-7
+        self.assertEqual(prefs, ((m_id, "Terça", 5),))
+
+        # Disponibilidade por horário e várias preferências com peso
+        save_professor_availability(self.conn, p_id, slot_bit(2, 0, 4) | slot_bit(2, 3, 4), DIAS_SEMANA, HORARIOS)
+        save_professor_preferences(self.conn, p_id, [(None, "Quarta", 2), (None, "Sexta", 6), (m_id, None, 5)])
+        professores = load_professores(cursor, materias, DIAS_SEMANA, HORARIOS)
+        self.assertEqual(mask_slots(professores[0][2], DIAS_SEMANA, 4), [("Quarta", 0), ("Quarta", 3)])
+        _, custo_dia = preference_costs(professores, materias, DIAS_SEMANA)
+        self.assertEqual((custo_dia[p_id, "Sexta"], custo_dia[p_id, "Quarta"], custo_dia[p_id, "Segunda"]), (0, 4, 6))
+        _, x, _ = build_schedule_model(professores, materias, [(1, "Turma A")], DIAS_SEMANA, HORARIOS)
+        self.assertEqual(sorted(k[3:] for k in x), [("Quarta", 0), ("Quarta", 3)])
+        _, atribuicoes, _ = solve_heuristic(professores, materias, [(1, "Turma A")], DIAS_SEMANA, HORARIOS,
+                                            time_limit=0.01)
+        self.assertEqual(sorted(a[3:] for a in atribuicoes), [("Quarta", 0), ("Quarta", 3)])
+        cursor.execute("DELETE FROM professor_disponibilidade")
+        cursor.execute("DELETE FROM professor_preferencias")
+        self.conn.commit()
+
+    def test_grade_horaria_e_mascaras(self):
+        cursor = self.conn.cursor()
+        # Grade com turno da tarde só na Segunda: 5 dias x 5 horários, 21 slots existentes
+        cursor.execute("INSERT INTO grade_horaria (dia_semana, horario_inicio, horario_fim) VALUES (%s, %s, %s)",
+                       ("Segunda", "14:00:00", "15:00:00"))
+        self.conn.commit()
+        dias, horarios, grade = load_time_grid(cursor)
+        self.assertEqual((dias, len(horarios), grade.bit_count()), (DIAS_SEMANA, 5, 21))
+        self.assertEqual(horarios[4], ("14:00:00", "15:00:00"))
+
+        cursor.execute("INSERT INTO turmas (nome, ano) VALUES (%s, %s)", ("Turma A", 2025))
+        t_id = cursor.lastrowid
+        save_turma_availability(self.conn, t_id, slot_bit(0, 4, 5) | slot_bit(1, 0, 5), dias, horarios, grade)
+        (_, _, mask_turma), = [t for t in load_turmas(cursor, dias, horarios, grade) if t[0] == t_id]
+        self.assertEqual(mask_slots(mask_turma, dias, 5), [("Segunda", 4), ("Terça", 0)])
+
+        professores = [(1, "A", "Segunda,Terça", ""), (2, "B", "Quarta", "")]
+        materias = [(1, "Matemática", 2)]
+        turmas = [(t_id, "Turma A", mask_turma)]
+        # Professor B não tem horário em comum com a turma: fica fora do componente e do modelo
+        (profs, _), = find_components(professores, turmas, dias, len(horarios))
+        self.assertEqual([p[0] for p in profs], [1])
+        status, atribuicoes, _ = solve_component(professores, materias, turmas, dias, horarios)
+        self.assertEqual(status, "Optimal")
+        self.assertEqual(sorted(a[3:] for a in atribuicoes), [("Segunda", 4), ("Terça", 0)])
+        self.assertEqual(validate_assignments(atribuicoes, [(1, "A", mask_turma, ())], turmas, dias, 5), [])
+        problemas = validate_assignments([(1, 1, t_id, "Segunda", 4)] * 2, [(1, "A", mask_turma, ())], turmas, dias, 5)
+        self.assertEqual(len(problemas), 2)
+        self.assertIn("Professor 1 com duas aulas em Segunda slot 4", problemas)
+        cursor.execute("DELETE FROM grade_horaria WHERE horario_inicio = %s", ("14:00:00",))
+        cursor.execute("DELETE FROM turma_disponibilidade")
+        self.conn.commit()
+
+    def test_analise_de_viabilidade(self):
+        def dias(*nomes):
+            return sum(slot_bit(DIAS_SEMANA.index(d), s, 4) for d in nomes for s in range(4))
+        materias = [(1, "Matemática", 3)]
+        professores = [(1, "Ana", dias("Segunda"), ()), (2, "Bruno", dias("Terça"), ()), (3, "Carla", dias("Quarta"), ())]
+        # Cada turma e o total passam na checagem de capacidade, mas A e B só podem ter aula na
+        # Segunda, onde há 4 horários de professor para 6 aulas
+        turmas = [(1, "A", dias("Segunda")), (2, "B", dias("Segunda")), (3, "C", dias(*DIAS_SEMANA))]
+        falhas = feasibility_problems(professores, materias, turmas, DIAS_SEMANA, 4)
+        self.assertEqual(falhas[0], "Turmas A, B: precisam de 6 aulas, mas os professores disponíveis "
+                                    "nos horários delas só cobrem 4 (faltam 2)")
+        self.assertIn("Segunda", falhas[1])
+        self.assertIn("Ana", falhas[1])
+        status, _, _ = solve_component(professores, materias, turmas, DIAS_SEMANA, HORARIOS)
+        self.assertNotIn(status, ("Optimal", "Feasible"))
+
+        turmas[1] = (2, "B", dias("Segunda", "Terça"))
+        self.assertEqual(feasibility_problems(professores, materias, turmas, DIAS_SEMANA, 4), [])
+        falhas = feasibility_problems(professores, [(1, "Matemática", 5)], turmas, DIAS_SEMANA, 4)
+        self.assertEqual(falhas[0], "Turma A: carga horária (5) excede os horários com professor disponível (4)")
+        # Turma sem máscara, no formato (id, nome): vale a grade inteira, como em turma_mask
+        self.assertEqual(feasibility_problems(professores, materias, [(4, "D")], DIAS_SEMANA, 4), [])
+        falhas = feasibility_problems(professores, [(1, "Matemática", 13)], [(4, "D")], DIAS_SEMANA, 4)
+        self.assertEqual(falhas[0], "Turma D: carga horária (13) excede os horários com professor disponível (12)")
+
+    def test_dados_de_exemplo_viaveis(self):
+        cursor = self.conn.cursor()
+        clear_instance(cursor)
+        self.conn.commit()
+        try:
+            seed_sample_data(self.conn)
+            materias, dias, horarios, _, turmas, professores = load_schedule_inputs(cursor)
+            self.assertEqual((len(professores), len(materias), len(turmas)), (2, 2, 1))
+            self.assertEqual(feasibility_problems(professores, materias, turmas, dias, len(horarios)), [])
+        finally:
+            clear_instance(cursor)
+            self.conn.commit()
+
+    def test_modo_elastico(self):
+        def dias(*nomes):
+            return sum(slot_bit(DIAS_SEMANA.index(d), s, 4) for d in nomes for s in range(4))
+        cursor = self.conn.cursor()
+        cursor.execute("INSERT INTO materias (nome, carga_horaria) VALUES (%s, %s)", ("Matemática", 3))
+        m_id = cursor.lastrowid
+        turmas = []
+        for nome, mask in (("Turma A", dias("Segunda")), ("Turma B", dias("Segunda")), ("Turma C", dias(*DIAS_SEMANA))):
+            cursor.execute("INSERT INTO turmas (nome, ano) VALUES (%s, %s)", (nome, 2025))
+            turmas.append((cursor.lastrowid, nome, mask))
+        self.conn.commit()
+        materias = [(m_id, "Matemática", 3)]
+        professores = [(1, "Ana", dias("Segunda"), ()), (2, "Bruno", dias("Terça"), ()), (3, "Carla", dias("Quarta"), ())]
+        # A e B disputam os 4 horários da Ana na Segunda: 2 das 6 aulas ficam de fora
+        for options in (SolverOptions(elastic=True), SolverOptions(elastic=True, formulation='aggregated'),
+                        SolverOptions(elastic=True, engine='heuristic')):
+            status, atribuicoes, stats = solve_component(professores, materias, turmas, DIAS_SEMANA, HORARIOS, options)
+            self.assertIn(status, ("Optimal", "Feasible"))
+            self.assertEqual(len(atribuicoes), 7)
+            self.assertEqual(sum(qtd for _, _, qtd in stats['faltas']), 2)
+            self.assertEqual(validate_assignments(atribuicoes, professores, turmas, DIAS_SEMANA, 4), [])
+
+        persist_schedule(self.conn, atribuicoes, HORARIOS, faltas=stats['faltas'])
+        faltas = load_shortfall(self.conn)
+        self.assertEqual(sum(qtd for _, _, qtd in faltas), 2)
+        self.assertTrue(all(mat == "Matemática" and tur in ("Turma A", "Turma B") for mat, tur, _ in faltas))
+        status, _, _ = solve_component(professores, materias, turmas, DIAS_SEMANA, HORARIOS, SolverOptions())
+        self.assertNotIn(status, ("Optimal", "Feasible"))
+
     def tearDown(self):
         try:
             cursor = self.conn.cursor()
             # Deletar em ordem reversa para evitar foreign key errors: cronogramas primeiro, depois pais
             cursor.execute("DELETE FROM cronogramas")
+            cursor.execute("DELETE FROM cronograma_faltas")
+            cursor.execute("UPDATE cronograma_ativo SET versao_id = NULL")
+            cursor.execute("DELETE FROM cronograma_versoes")
             cursor.execute("DELETE FROM professores WHERE nome = 'Teste'")
             cursor.execute("DELETE FROM materias WHERE nome = 'Matemática'")
-            cursor.execute("DELETE FROM turmas WHERE nome = 'Turma A'")
+            cursor.execute("DELETE FROM turmas WHERE nome LIKE 'Turma %'")
             self.conn.commit()
             print("Dados limpos com sucesso")
         except mysql.connector.Error as e: